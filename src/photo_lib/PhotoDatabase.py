@@ -3,29 +3,32 @@ import filecmp
 import os
 import sqlite3
 import json
-import base64
 import time
 
-import cv2
-from .metadataagregator import MetadataAggregator, FileMetaData
+from .metadataagregator import MetadataAggregator, FileMetaData, parse_date_tags, load_google_fotos_metadata, \
+    fingerprint_file, hash_file
 import shutil
 from typing import Set, Union
 import warnings
 from dataclasses import dataclass
-from difPy.dif import dif
-from _queue import Empty
 import multiprocessing as mp
 import multiprocessing.connection as mpconn
-from typing import Tuple
-import sys
-import ffmpeg
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, wait, FIRST_COMPLETED, ALL_COMPLETED
+from typing import Tuple, List, Callable
 from .errors_and_warnings import *
 from fast_diff_py import fastDif
-from photo_lib.utils import rec_list_all
+from photo_lib.utils import rec_list_all, walk_files, decode_metadata
+from .similarity import connected_components
+from .thumbnails import image_thumbnail, video_thumbnail, image_extensions, video_extensions, thumbnail_extension
+from .search_scheduler import DuplicateSearch, SearchTask, difpy_folder, numpy_group, numpy_window, hash_thumbnails, \
+    cluster_phashes
+import itertools
 
 
-# INFO: If you run the img_ana_dup_search from another file and not the gui, MAKE SURE TO EMPTY THE PIPE.
+# INFO: If you run the img_ana_dup_search_new (fastDif) from another file and not the gui, MAKE SURE TO EMPTY THE PIPE.
 # After around 1000 Calls, the pipe will be full and the program will freeze !!!
+# The numpy, window, phash and difpy searches return a DuplicateSearch instead, which has no pipe, call its run or
+# poll method.
 
 @dataclass
 class DatabaseEntry:
@@ -41,6 +44,41 @@ class DatabaseEntry:
     verify: int
 
 
+# MetadataAggregator and hashes to skip of a worker process of the parallel import, set by _init_import_worker
+_worker_mda: Union[MetadataAggregator, None] = None
+_worker_skip_hashes: Union[set, None] = None
+_worker_skip_fingerprints: Union[set, None] = None
+
+
+def _init_import_worker(exiftool_path: str, detect_new_keys: bool, skip_hashes: set = None,
+                        skip_fingerprints: set = None):
+    """
+    Initializer of the worker processes of the parallel import. Each worker runs its own exiftool process.
+
+    :param exiftool_path: path to the exiftool executable, None for the default
+    :param detect_new_keys: passed on to the MetadataAggregator
+    :param skip_hashes: hashes of files which aren't passed to exiftool
+    :param skip_fingerprints: fingerprints of files which aren't hashed nor passed to exiftool
+    :return:
+    """
+    global _worker_mda, _worker_skip_hashes, _worker_skip_fingerprints
+    _worker_mda = MetadataAggregator(exiftool_path=exiftool_path, detect_new_keys=detect_new_keys)
+    _worker_skip_hashes = skip_hashes
+    _worker_skip_fingerprints = skip_fingerprints
+
+
+def _import_worker_process_files(paths: List[str]) -> List[FileMetaData]:
+    """
+    Hash, extract the metadata and resolve the datetime of a batch of files inside a worker process. The paths are
+    passed to exiftool in a single call.
+
+    :param paths: paths to the files
+    :return: the FileMetaData of the files, in the order of paths
+    """
+    return list(_worker_mda.process_files(paths, batch_size=len(paths), skip_hashes=_worker_skip_hashes,
+                                          skip_fingerprints=_worker_skip_fingerprints))
+
+
 class PhotoDb:
     root_dir: str
     img_db: str
@@ -57,7 +95,15 @@ class PhotoDb:
 
     __datetime_format = "%Y-%m-%d %H.%M.%S"
 
-    proc_handles: list = []
+    # Commit policy of the import pipeline, commit after commit_every files or after commit_interval seconds.
+    commit_every: int = 1
+    commit_interval: Union[float, None] = None
+    journal_mode: Union[str, None] = None
+    journal_modes: set = {"DELETE", "TRUNCATE", "PERSIST", "MEMORY", "WAL", "OFF"}
+
+    __uncommitted_files: int = 0
+    __last_commit: float = 0.0
+    __pending_copies: dict
 
     # Table Creation Commands
     images_table_command: str = \
@@ -109,9 +155,92 @@ class PhotoDb:
          "original_google_metadata INTEGER DEFAULT 1 "
          "CHECK (trash.original_google_metadata >= 0 AND trash.original_google_metadata < 2))")
 
+    # datetime of every date tag of an image that parsed, so candidates for renaming can be looked up without the
+    # metadata
+    date_tags_table_command: str = \
+        ("CREATE TABLE date_tags "
+         "(key INTEGER PRIMARY KEY AUTOINCREMENT, "
+         "image_key INTEGER NOT NULL, "
+         "tag TEXT NOT NULL, "
+         "datetime TEXT NOT NULL, "
+         "raw TEXT)")
+
+    # file_hash and datetime of every imported file by its path and stat signature, so an incremental import can skip
+    # the files which didn't change since they were last imported.
+    import_cache_table_command: str = \
+        ("CREATE TABLE import_cache "
+         "(org_fpath TEXT NOT NULL, "
+         "org_fname TEXT NOT NULL, "
+         "file_size INTEGER NOT NULL, "
+         "mtime REAL NOT NULL, "
+         "file_hash TEXT, "
+         "datetime TEXT, "
+         "PRIMARY KEY (org_fpath, org_fname))")
+
+    # size and hash of the first and last 64 KiB of the files of images, see fingerprint_file. Filled on import and
+    # by fill_fingerprints, images without fingerprint are only found by the full hash.
+    fingerprints_table_command: str = \
+        ("CREATE TABLE fingerprints "
+         "(image_key INTEGER PRIMARY KEY, "
+         "file_size INTEGER NOT NULL, "
+         "partial_hash TEXT NOT NULL)")
+
+    # difference hash of the thumbnail of every image, see similarity.dhash. Stored as hex string since the 64 bit
+    # hashes don't fit into a signed sqlite integer.
+    phashes_table_command: str = \
+        ("CREATE TABLE phashes "
+         "(image_key INTEGER PRIMARY KEY, "
+         "dhash TEXT NOT NULL)")
+
     table_command_dict: dict
 
-    def __init__(self, root_dir: str, db_path: str = None):
+    # Version of the database layout, stored in the user_version of the database. Bump it when adding an upgrade step
+    # to upgrade_db.
+    # 1: secondary indexes
+    # 2: metadata columns store plain json instead of base64 encoded json
+    # 3: date_tags table
+    # 4: import_cache table
+    # 5: fingerprints table
+    # 6: duplicates table split into duplicate_clusters and duplicate_members
+    # 7: phashes table
+    db_version: int = 7
+
+    # Secondary indexes for the hot lookups. names.name and images.new_name are UNIQUE and therefore already indexed.
+    index_commands: dict = {
+        "images_datetime_index": "CREATE INDEX IF NOT EXISTS images_datetime_index ON images (datetime)",
+        "images_file_hash_index": "CREATE INDEX IF NOT EXISTS images_file_hash_index ON images (file_hash)",
+        "replaced_datetime_file_hash_index":
+            "CREATE INDEX IF NOT EXISTS replaced_datetime_file_hash_index ON replaced (datetime, file_hash)",
+        "replaced_file_hash_index": "CREATE INDEX IF NOT EXISTS replaced_file_hash_index ON replaced (file_hash)",
+        "trash_file_hash_index": "CREATE INDEX IF NOT EXISTS trash_file_hash_index ON trash (file_hash)",
+        "date_tags_image_key_index": "CREATE INDEX IF NOT EXISTS date_tags_image_key_index ON date_tags (image_key)",
+        "date_tags_tag_datetime_index":
+            "CREATE INDEX IF NOT EXISTS date_tags_tag_datetime_index ON date_tags (tag, datetime)",
+        "fingerprints_index":
+            "CREATE INDEX IF NOT EXISTS fingerprints_index ON fingerprints (file_size, partial_hash)"
+    }
+
+    def __init__(self, root_dir: str, db_path: str = None, commit_every: int = 1, commit_interval: float = None,
+                 journal_mode: str = None):
+        """
+        Open the database of a photo library, creating it if it doesn't exist yet.
+
+        :param root_dir: root directory of the photo library
+        :param db_path: path to the database, defaults to .photos.db in the root_dir
+        :param commit_every: the import commits to the database after this many files
+        :param commit_interval: the import commits to the database after this many seconds (if not None)
+        :param journal_mode: sqlite journal mode to set on the database, e.g. WAL. None keeps the current one
+        """
+        if commit_every < 1:
+            raise ValueError("commit_every must be at least 1")
+
+        if journal_mode is not None and journal_mode.upper() not in self.journal_modes:
+            raise ValueError(f"Unsupported journal mode {journal_mode}, must be one of {self.journal_modes}")
+
+        self.commit_every = commit_every
+        self.commit_interval = commit_interval
+        self.journal_mode = journal_mode
+        self.__pending_copies = {}
 
         if os.path.exists(root_dir):
             self.root_dir = root_dir
@@ -150,6 +279,10 @@ class PhotoDb:
         if existence and not correctness:
             raise CorruptDatabase("Database is not correctly formatted and might not work. Check the logs.")
 
+        # upgrade databases created by an older version
+        if self.get_db_version() < self.db_version or len(self.verify_indexes()) > 0:
+            self.upgrade_db()
+
     # ------------------------------------------------------------------------------------------------------------------
     # UTILITY CONVERTERS
     # ------------------------------------------------------------------------------------------------------------------
@@ -182,22 +315,17 @@ class PhotoDb:
         return datetime.datetime.strptime(dt_str, self.__datetime_format)
 
     @staticmethod
-    def __dict_to_b64(metadata: dict):
-        json_string = json.dumps(metadata)
-        json_bytes = json_string.encode("utf-8")
-        b64_bytes = base64.b64encode(json_bytes)
-        b64_string = b64_bytes.decode("ascii")
-        return b64_string
+    def __dict_to_json(metadata: Union[dict, None]):
+        if metadata is None:
+            return None
+        return json.dumps(metadata)
 
     @staticmethod
-    def __b64_to_dict(b64_str: str):
-        if b64_str is None:
-            return None
-        b64_bytes = b64_str.encode("ascii")
-        json_bytes = base64.b64decode(b64_bytes)
-        json_str = json_bytes.decode("utf-8")
-        meta_dict = json.loads(json_str)
-        return meta_dict
+    def __json_to_dict(json_str: Union[str, None]):
+        """
+        Decode a metadata column, see utils.decode_metadata.
+        """
+        return decode_metadata(json_str)
 
     def thumbnail_name(self, ext: str, key: int):
         thumbnail_name = f"thumb_{key}{ext}"
@@ -207,23 +335,133 @@ class PhotoDb:
         return os.path.join(self.trash_dir, file_name)
 
     def duplicate_table_exists(self) -> bool:
-        self.cur.execute("SELECT name FROM sqlite_master WHERE type='table' AND name='duplicates'")
+        self.cur.execute("SELECT name FROM sqlite_master WHERE type='table' AND name='duplicate_clusters'")
         dups = self.cur.fetchone()
         return dups is not None
 
     def create_duplicates_table(self):
-        self.cur.execute("CREATE TABLE duplicates ("
+        """
+        Create the duplicate_clusters and duplicate_members tables. A cluster is a group of images found to be
+        duplicates by a search (match_type is the level of the search, e.g. hash, day). The members are stored in the
+        order they were found, the first member is the one the others matched against.
+        """
+        self.cur.execute("CREATE TABLE duplicate_clusters ("
+                         "key INTEGER PRIMARY KEY AUTOINCREMENT,"
+                         "match_type TEXT NOT NULL,"
+                         "score REAL)")
+        self.cur.execute("CREATE TABLE duplicate_members ("
                          "key INTEGER PRIMARY KEY AUTOINCREMENT,"
-                         "match_type TEXT,"
-                         "matched_keys TEXT)")
+                         "cluster_key INTEGER NOT NULL,"
+                         "image_key INTEGER NOT NULL,"
+                         "position INTEGER NOT NULL,"
+                         "score REAL)")
+        self.cur.execute("CREATE INDEX duplicate_members_cluster_index ON duplicate_members (cluster_key, position)")
+        self.cur.execute("CREATE INDEX duplicate_members_image_index ON duplicate_members (image_key)")
 
     def delete_duplicates_table(self):
-        self.cur.execute("DROP TABLE IF EXISTS duplicates")
+        self.cur.execute("DROP TABLE IF EXISTS duplicate_members")
+        self.cur.execute("DROP TABLE IF EXISTS duplicate_clusters")
 
     def get_duplicate_table_size(self):
-        self.cur.execute("SELECT COUNT(key) FROM duplicates")
+        self.cur.execute("SELECT COUNT(key) FROM duplicate_clusters")
         return self.cur.fetchone()[0]
 
+    def insert_duplicate_clusters(self, match_type: str, clusters: List[List[int]], scores: List[float] = None):
+        """
+        Insert clusters into the duplicate tables. Doesn't commit.
+
+        **Preconditions:**
+
+        - The duplicate tables exist.
+
+        :param match_type: type of the search which found the clusters
+        :param clusters: list of the image keys of every cluster
+        :param scores: score of every cluster, None if the search doesn't provide one
+        :return:
+        """
+        if scores is None:
+            scores = [None] * len(clusters)
+
+        members = []
+        for keys, score in zip(clusters, scores):
+            self.cur.execute("INSERT INTO duplicate_clusters (match_type, score) VALUES (?, ?)", (match_type, score))
+            cluster_key = self.cur.lastrowid
+            members.extend((cluster_key, image_key, position) for position, image_key in enumerate(keys))
+
+        self.cur.executemany("INSERT INTO duplicate_members (cluster_key, image_key, position) VALUES (?, ?, ?)",
+                             members)
+
+    def clusters_of_image(self, key: int) -> List[int]:
+        """
+        Keys of all duplicate clusters containing an image.
+
+        :param key: key of the image
+        :return:
+        """
+        if not self.duplicate_table_exists():
+            return []
+
+        self.cur.execute("SELECT DISTINCT cluster_key FROM duplicate_members WHERE image_key = ? ORDER BY cluster_key",
+                         (key,))
+        return [row[0] for row in self.cur.fetchall()]
+
+    def remove_from_duplicates(self, key: int):
+        """
+        Remove an image from all duplicate clusters. Clusters left with less than two members are removed as well.
+        Doesn't commit.
+
+        :param key: key of the image
+        :return:
+        """
+        clusters = self.clusters_of_image(key)
+        if len(clusters) == 0:
+            return
+
+        self.cur.execute("DELETE FROM duplicate_members WHERE image_key = ?", (key,))
+
+        for cluster_key in clusters:
+            self.cur.execute("SELECT COUNT(key) FROM duplicate_members WHERE cluster_key = ?", (cluster_key,))
+            if self.cur.fetchone()[0] < 2:
+                self.cur.execute("DELETE FROM duplicate_members WHERE cluster_key = ?", (cluster_key,))
+                self.cur.execute("DELETE FROM duplicate_clusters WHERE key = ?", (cluster_key,))
+
+    def __delete_image_rows(self, key: int):
+        """
+        Remove an image from the images table along with its rows in the date_tags, fingerprints and phashes tables
+        and its duplicate clusters. Doesn't commit.
+
+        :param key: key of the image
+        :return:
+        """
+        self.cur.execute("DELETE FROM images WHERE key = ?", (key,))
+        self.cur.execute("DELETE FROM date_tags WHERE image_key = ?", (key,))
+        self.cur.execute("DELETE FROM fingerprints WHERE image_key = ?", (key,))
+        self.cur.execute("DELETE FROM phashes WHERE image_key = ?", (key,))
+        self.remove_from_duplicates(key)
+
+    def convert_duplicates_table(self):
+        """
+        Move the clusters of the duplicates table, which stored the keys of a cluster as json array, into the
+        duplicate_clusters and duplicate_members tables. The match_type is kept.
+        :return:
+        """
+        self.cur.execute("SELECT name FROM sqlite_master WHERE type='table' AND name='duplicates'")
+        if self.cur.fetchone() is None:
+            return
+
+        self.delete_duplicates_table()
+        self.create_duplicates_table()
+
+        self.cur.execute("SELECT match_type, matched_keys FROM duplicates ORDER BY key")
+        rows = self.cur.fetchall()
+
+        for match_type, matched_keys in rows:
+            self.insert_duplicate_clusters(match_type=match_type, clusters=[json.loads(matched_keys)])
+
+        self.cur.execute("DROP TABLE duplicates")
+        self.con.commit()
+        print(f"Converted {len(rows)} duplicate clusters")
+
     # ------------------------------------------------------------------------------------------------------------------
     # INIT
     # ------------------------------------------------------------------------------------------------------------------
@@ -243,6 +481,9 @@ class PhotoDb:
         self.con = sqlite3.Connection(self.img_db)
         self.cur = self.con.cursor()
 
+        if self.journal_mode is not None:
+            self.cur.execute(f"PRAGMA journal_mode = {self.journal_mode.upper()}")
+
     def purge_import_tables(self):
         self.cur.execute("SELECT import_table_name FROM import_tables")
         ttd = self.cur.fetchone()
@@ -372,8 +613,128 @@ class PhotoDb:
         # Todo: Think about trash -> once removed images not reimported?
         self.cur.execute(self.trash_table_command)
 
+        self.cur.execute(self.date_tags_table_command)
+
+        self.cur.execute(self.import_cache_table_command)
+
+        self.cur.execute(self.fingerprints_table_command)
+
+        self.cur.execute(self.phashes_table_command)
+
+        self.con.commit()
+        self.create_indexes()
+        self.__set_db_version()
+
+    def get_db_version(self) -> int:
+        """
+        Version of the database layout, 0 if the database predates the versioning.
+        """
+        self.cur.execute("PRAGMA user_version")
+        return self.cur.fetchone()[0]
+
+    def verify_indexes(self) -> list:
+        """
+        Verifies the existence of all indexes in index_commands.
+
+        :return: list of the names of the missing indexes
+        """
+        self.cur.execute("SELECT name FROM sqlite_master WHERE type = 'index'")
+        present = {row[0] for row in self.cur.fetchall()}
+
+        return [name for name in self.index_commands.keys() if name not in present]
+
+    def create_indexes(self):
+        """
+        Creates all missing indexes.
+
+        **Preconditions:**
+
+        - All tables exist and are correctly formatted.
+
+        :return:
+        """
+        for name in self.verify_indexes():
+            print(f"Creating index {name}")
+            self.cur.execute(self.index_commands[name])
+
+        self.con.commit()
+
+    def __set_db_version(self):
+        self.cur.execute(f"PRAGMA user_version = {self.db_version}")
         self.con.commit()
 
+    def upgrade_db(self):
+        """
+        Upgrade a database created by an older version to the current db_version.
+
+        **Preconditions:**
+
+        - All tables exist and are correctly formatted.
+
+        :return:
+        """
+        version = self.get_db_version()
+
+        if version < 2:
+            self.convert_metadata_to_json()
+
+        if version < 3:
+            if "date_tags" not in self.__list_present_tables():
+                self.cur.execute(self.date_tags_table_command)
+            self.fill_date_tags()
+
+        if version < 4:
+            if "import_cache" not in self.__list_present_tables():
+                self.cur.execute(self.import_cache_table_command)
+
+        if version < 5:
+            if "fingerprints" not in self.__list_present_tables():
+                self.cur.execute(self.fingerprints_table_command)
+
+        if version < 6:
+            self.convert_duplicates_table()
+
+        if version < 7:
+            if "phashes" not in self.__list_present_tables():
+                self.cur.execute(self.phashes_table_command)
+
+        self.create_indexes()
+        self.__set_db_version()
+
+    def __metadata_tables(self) -> list:
+        """
+        List all tables with a metadata and google_fotos_metadata column, i.e. images, replaced, trash and the import
+        tables.
+        """
+        present = self.__list_present_tables()
+        self.cur.execute("SELECT import_table_name FROM import_tables")
+        import_tables = [row[0] for row in self.cur.fetchall() if row[0] in present]
+
+        return ["images", "replaced", "trash"] + import_tables
+
+    def convert_metadata_to_json(self, vacuum: bool = True):
+        """
+        One-shot migration of the metadata columns from base64 encoded json to plain json. Plain json is a quarter
+        smaller, is decoded in one step and can be queried with the json functions of sqlite.
+
+        :param vacuum: vacuum the database afterwards to return the freed space to the file system.
+        :return:
+        """
+        for table in self.__metadata_tables():
+            self.cur.execute(f"SELECT key, metadata, google_fotos_metadata FROM {table}")
+            rows = self.cur.fetchall()
+            print(f"Converting metadata of {len(rows)} rows in {table}")
+
+            self.cur.executemany(f"UPDATE {table} SET metadata = ?, google_fotos_metadata = ? WHERE key = ?",
+                                 [(self.__dict_to_json(self.__json_to_dict(row[1])),
+                                   self.__dict_to_json(self.__json_to_dict(row[2])),
+                                   row[0]) for row in rows])
+
+        self.con.commit()
+
+        if vacuum:
+            self.cur.execute("VACUUM")
+
     def rename_file(self, entry: DatabaseEntry, new_datetime: datetime.datetime, naming_tag: str):
         """
         Performs renaming action of a file
@@ -446,8 +807,10 @@ class PhotoDb:
                 except FileNotFoundError:
                     print(f"File {row[6]} not found. Skipping.")
 
-                # remove from the images table
-                self.cur.execute(f"DELETE FROM images WHERE new_name = '{row[6]}'")
+                # remove from the images table along with the rows the import wrote to the other tables
+                self.cur.execute("SELECT key FROM images WHERE new_name = ?", (row[6],))
+                for (key,) in self.cur.fetchall():
+                    self.__delete_image_rows(key)
 
             # deleting the row from the import table
             self.cur.execute(f"DELETE FROM {tbl_name} WHERE key = {row[0]}")
@@ -459,7 +822,46 @@ class PhotoDb:
         self.cur.execute(f"DROP TABLE {tbl_name}")
         self.con.commit()
 
-    def import_folder(self, folder_path: str, al_fl: Set[str] = None, ignore_deleted: bool = False):
+    def import_folder(self, folder_path: str, al_fl: Set[str] = None, ignore_deleted: bool = False,
+                      procs: int = 1, batch_size: int = 32, incremental: bool = False, hash_first: bool = False):
+        """
+        Import all files in a folder and its subfolders into the database.
+
+        With procs > 1, the hashing, the exiftool extraction and the datetime resolution are done by a pool of worker
+        processes. The database is still only written from this process, in the order of the import table, so the
+        resulting names and rows are identical to the ones of a serial import.
+
+        :param folder_path: folder to import
+        :param al_fl: allowed file extensions, defaults to self.allowed_files
+        :param ignore_deleted: currently unused
+        :param procs: number of worker processes for the metadata aggregation, 1 imports serially
+        :param batch_size: number of files passed to exiftool in a single call
+        :param incremental: skip hashing and exiftool for files whose path, size and mtime match the import_cache
+        :param hash_first: hash the files before running exiftool and skip exiftool for files already in the database
+        :return: name of the import table
+
+        The database is committed according to commit_every and commit_interval. Files are only copied into the
+        library after the commit containing their rows. After a crash, the import table therefore only marks files
+        as imported which are either present or missing, never copied files the database doesn't know about, and
+        revert_import can clean up the import.
+
+        With incremental, files whose stat signature is unchanged since they were last imported reuse the cached
+        file_hash and datetime. If the cached values show the file is already present, it is marked as such without
+        reading it, its metadata column in the import table stays empty. Otherwise, it is processed normally.
+
+        With hash_first, files whose fingerprint is in the fingerprints table aren't hashed and files whose hash is in
+        the images or replaced table aren't passed to exiftool. If a binary
+        identical file is found in images, or a single entry in replaced with a successor, the file is marked as
+        present like determine_import would do, without comparing the datetime. Otherwise, the metadata is extracted
+        after all and the file is processed normally. The trash table isn't considered, trashed files are imported
+        again as before. hash_first saves the exiftool calls of known files, not reads: a file matching by fingerprint
+        is compared binary with the copy in the library, which reads both files.
+
+        Without hash_first, every file is read once for its hash, the fingerprint is taken from the same read.
+        """
+        if procs > 1 and self.mda.det_new_ks:
+            raise ValueError("detect_new_keys exits on unknown keys and is not supported by the parallel import")
+
         folder_path = os.path.abspath(folder_path.rstrip("/"))
         temp_table_name = self.__create_import_table(folder_path)
 
@@ -480,67 +882,337 @@ class PhotoDb:
                          f" allowed INTEGER DEFAULT 0 CHECK ({temp_table_name}.allowed >= 0 AND {temp_table_name}.allowed < 2),"
                          f" processed INTEGER DEFAULT 0 CHECK ({temp_table_name}.processed >= 0 AND {temp_table_name}.processed < 2),"
                          f" message TEXT,"
-                         f" hash_based_duplicate TEXT)")
+                         f" hash_based_duplicate TEXT,"
+                         f" file_size INTEGER,"
+                         f" mtime REAL)")
 
         self.con.commit()
 
         # import all files in subdirectory and count them
-        number_of_files = self.__rec_list(path=folder_path, table=temp_table_name, allowed_files=al_fl)
+        self.__rec_list(path=folder_path, table=temp_table_name, allowed_files=al_fl)
+        self.con.commit()
+
+        # the commit_interval counts from the start of the import, not from the last commit of an earlier one
+        self.__last_commit = time.monotonic()
+
+        try:
+            if incremental:
+                self.__import_cached(table=temp_table_name)
+
+            skip_hashes = self.__known_hashes() if hash_first else None
+            skip_fingerprints = self.__known_fingerprints() if hash_first else None
+
+            if procs > 1:
+                self.__import_parallel(table=temp_table_name, procs=procs, batch_size=batch_size,
+                                       skip_hashes=skip_hashes, skip_fingerprints=skip_fingerprints)
+            else:
+                self.__import_serial(table=temp_table_name, batch_size=batch_size, skip_hashes=skip_hashes,
+                                     skip_fingerprints=skip_fingerprints)
+        except BaseException:
+            # drop the uncommitted part of the import, none of its files were copied yet
+            self.con.rollback()
+            self.__pending_copies = {}
+            self.__uncommitted_files = 0
+            raise
+
+        self.__import_commit(force=True)
+        return temp_table_name
+
+    def __import_commit(self, force: bool = False):
+        """
+        Count a processed file and commit the import if commit_every files were processed since the last commit or
+        commit_interval seconds passed. After the commit, the files imported since the last commit are copied into
+        the library.
+
+        :param force: commit regardless of the commit policy, doesn't count a file.
+        :return:
+        """
+        if not force:
+            self.__uncommitted_files += 1
+
+            if self.__uncommitted_files < self.commit_every and (
+                    self.commit_interval is None or time.monotonic() - self.__last_commit < self.commit_interval):
+                return
+
         self.con.commit()
 
-        for i in range(number_of_files):
+        # copy files and preserve metadata
+        for dst, src in self.__pending_copies.items():
+            shutil.copy2(src=src, dst=dst, follow_symlinks=True)
+
+        self.__pending_copies = {}
+        self.__uncommitted_files = 0
+        self.__last_commit = time.monotonic()
+
+    def __import_cached(self, table: str):
+        """
+        Mark the files of an import table as present whose path and stat signature match the import_cache and whose
+        cached file_hash and datetime are found in the database. The remaining files are left unprocessed.
+
+        :param table: import table of the current import
+        :return:
+        """
+        self.cur.execute(f"SELECT t.org_fname, t.org_fpath, t.key, c.file_hash, c.datetime FROM {table} AS t "
+                         f"JOIN import_cache AS c ON t.org_fpath = c.org_fpath AND t.org_fname = c.org_fname "
+                         f"AND t.file_size = c.file_size AND t.mtime = c.mtime "
+                         f"WHERE t.allowed = 1 AND t.processed = 0 AND c.datetime IS NOT NULL ORDER BY t.key")
+        rows = self.cur.fetchall()
+        skipped = 0
+
+        for fname, fpath, key, file_hash, dt_str in rows:
+            file_metadata = FileMetaData(org_fname=fname, org_fpath=fpath, metadata=None, naming_tag="",
+                                         file_hash=file_hash, datetime_object=self.__db_str_to_datetime(dt_str),
+                                         google_fotos_metadata=load_google_fotos_metadata(os.path.join(fpath, fname)))
+
+            # the binary comparison was done when the file was cached, the stat signature didn't change since.
+            should_import, message, successor = self.determine_import(file_metadata, verify_binary=False)
+
+            # file changed or isn't present anymore, needs to be processed normally
+            if should_import > 0:
+                continue
+
+            self.__handle_preset(table=table, file_metadata=file_metadata, msg=message,
+                                 present_file_name=successor, update_key=key, status_code=should_import,
+                                 successor=successor)
+            skipped += 1
+
+        print(f"Skipped {skipped} of {len(rows)} cached files")
+
+    def __update_import_cache(self, table: str, file_metadata: FileMetaData, update_key: int):
+        """
+        Store the file_hash and datetime of a processed file in the import_cache under its stat signature.
+
+        :param table: import table of the current import
+        :param file_metadata: metadata of the file from the MetadataAggregator
+        :param update_key: key of the file in the import table
+        :return:
+        """
+        self.cur.execute(f"INSERT OR REPLACE INTO import_cache "
+                         f"(org_fpath, org_fname, file_size, mtime, file_hash, datetime) "
+                         f"SELECT org_fpath, org_fname, file_size, mtime, ?, ? FROM {table} "
+                         f"WHERE key = ? AND file_size IS NOT NULL AND mtime IS NOT NULL",
+                         (file_metadata.file_hash, self.__datetime_to_db_str(file_metadata.datetime_object),
+                          update_key))
+
+    def __cache_known_file(self, table: str, file_metadata: FileMetaData, dt_str: str, update_key: int):
+        """
+        Store a file found by its fingerprint or hash in the import_cache, so a later incremental import skips it
+        without reading it. The file isn't passed to exiftool, so the datetime of the matching file is cached.
+
+        :param table: import table of the current import
+        :param file_metadata: metadata of the file, only the hash and the google fotos metadata are set
+        :param dt_str: datetime of the matching file as stored in the database
+        :param update_key: key of the file in the import table
+        :return:
+        """
+        file_metadata.datetime_object = self.__db_str_to_datetime(dt_str)
+        self.__update_import_cache(table=table, file_metadata=file_metadata, update_key=update_key)
+
+    def __unprocessed_import_rows(self, table: str) -> list:
+        """
+        List the allowed files of an import table which aren't processed yet, in the order they are imported in.
+
+        :param table: import table of the current import
+        :return: list of (org_fname, org_fpath, key)
+        """
+        self.cur.execute(f"SELECT org_fname, org_fpath, key FROM {table} WHERE allowed = 1 AND processed = 0 "
+                         f"ORDER BY key")
+        return self.cur.fetchall()
+
+    def __known_hashes(self) -> set:
+        """
+        Hashes of all files in the images and replaced table.
+        """
+        self.cur.execute("SELECT file_hash FROM images WHERE file_hash IS NOT NULL "
+                         "UNION SELECT file_hash FROM replaced WHERE file_hash IS NOT NULL")
+        return {row[0] for row in self.cur.fetchall()}
+
+    def __known_fingerprints(self) -> set:
+        """
+        (file_size, partial_hash) of all files in the fingerprints table.
+        """
+        self.cur.execute("SELECT file_size, partial_hash FROM fingerprints")
+        return {(row[0], row[1]) for row in self.cur.fetchall()}
+
+    def __import_serial(self, table: str, batch_size: int, skip_hashes: set = None, skip_fingerprints: set = None):
+        """
+        Process the files of an import table in this process. The files are passed to exiftool in batches.
+
+        :param table: import table of the current import
+        :param batch_size: number of files passed to exiftool in a single call
+        :param skip_hashes: hashes of files which aren't passed to exiftool, see MetadataAggregator.process_files
+        :param skip_fingerprints: fingerprints of files which aren't hashed nor passed to exiftool
+        :return:
+        """
+        rows = self.__unprocessed_import_rows(table)
+        paths = [os.path.join(row[1], row[0]) for row in rows]
+
+        for i, file_metadata in enumerate(self.mda.process_files(paths, batch_size=batch_size,
+                                                                 skip_hashes=skip_hashes,
+                                                                 skip_fingerprints=skip_fingerprints)):
             if i % 100 == 0:
                 print(i)
 
-            # fetch a not processed file from import table
-            self.cur.execute(
-                f"SELECT org_fname, org_fpath, key FROM {temp_table_name} WHERE allowed = 1 AND processed = 0")
-            cur_file = self.cur.fetchone()
+            self.__import_file(table=table, file_metadata=file_metadata, update_key=rows[i][2])
 
-            # all files which are allowed processed. stopping
-            if cur_file is None:
-                break
+    def __import_parallel(self, table: str, procs: int, batch_size: int, skip_hashes: set = None,
+                          skip_fingerprints: set = None):
+        """
+        Process the files of an import table with a pool of worker processes. The workers only aggregate the metadata,
+        the results are consumed in the order of the import table and written to the database from this process.
+
+        :param table: import table of the current import
+        :param procs: number of worker processes
+        :param batch_size: number of files passed to exiftool in a single call by a worker
+        :param skip_hashes: hashes of files which aren't passed to exiftool, see MetadataAggregator.process_files
+        :param skip_fingerprints: fingerprints of files which aren't hashed nor passed to exiftool
+        :return:
+        """
+        rows = self.__unprocessed_import_rows(table)
+        paths = [os.path.join(row[1], row[0]) for row in rows]
+        batches = [paths[i:i + batch_size] for i in range(0, len(paths), batch_size)]
 
-            # perform the metadata aggregation
-            file_metadata = self.mda.process_file(os.path.join(cur_file[1], cur_file[0]))
-            # imported_file_name = self.__file_name_generator(file_metadata.datetime_object, file_metadata.org_fname)
+        with mp.Pool(processes=procs, initializer=_init_import_worker,
+                     initargs=(self.mda.exiftool_path, self.mda.det_new_ks, skip_hashes, skip_fingerprints)) as pool:
 
-            # should be imported?
-            should_import, message, successor = self.determine_import(file_metadata)
+            # imap preserves the order of the batches, workers keep running ahead while the results are written.
+            i = 0
+            for batch_metadata in pool.imap(_import_worker_process_files, batches):
+                for file_metadata in batch_metadata:
+                    if i % 100 == 0:
+                        print(i)
 
-            # DEBUG AID
-            # assert 0 <= should_import <= 2
+                    self.__import_file(table=table, file_metadata=file_metadata, update_key=rows[i][2])
+                    i += 1
 
-            # 0 equal to not import, already present
-            if should_import <= 0:
-                self.__handle_preset(table=temp_table_name, file_metadata=file_metadata, msg=message,
-                                     present_file_name=successor, update_key=cur_file[2], status_code=should_import,
-                                     successor=successor)
+    def __import_file(self, table: str, file_metadata: FileMetaData, update_key: int):
+        """
+        Decide if a file is imported and update the database accordingly.
 
-            # straight import
-            elif should_import == 1:
-                self.__handle_import(fmd=file_metadata, table=temp_table_name, msg=message, update_key=cur_file[2])
+        :param table: import table of the current import
+        :param file_metadata: metadata of the file from the MetadataAggregator
+        :param update_key: key of the file in the import table
+        :return:
+        """
+        # only the hash or the fingerprint is known, see MetadataAggregator.process_files
+        if file_metadata.datetime_object is None and file_metadata.metadata is None:
+            if file_metadata.file_hash is None:
+                if self.__import_known_fingerprint(table=table, file_metadata=file_metadata, update_key=update_key):
+                    return
 
-        return temp_table_name
+                file_metadata.file_hash = hash_file(os.path.join(file_metadata.org_fpath, file_metadata.org_fname))
+
+            if self.__import_known_hash(table=table, file_metadata=file_metadata, update_key=update_key):
+                return
+
+            # the hash and the fingerprint are known already, only exiftool is left
+            fingerprint = file_metadata.file_size, file_metadata.partial_hash
+            file_metadata = self.mda.process_file(os.path.join(file_metadata.org_fpath, file_metadata.org_fname),
+                                                  f_hash=file_metadata.file_hash)
+            file_metadata.file_size, file_metadata.partial_hash = fingerprint
+
+        self.__update_import_cache(table=table, file_metadata=file_metadata, update_key=update_key)
+
+        # should be imported?
+        should_import, message, successor = self.determine_import(file_metadata)
+
+        # DEBUG AID
+        # assert 0 <= should_import <= 2
+
+        # 0 equal to not import, already present
+        if should_import <= 0:
+            self.__handle_preset(table=table, file_metadata=file_metadata, msg=message,
+                                 present_file_name=successor, update_key=update_key, status_code=should_import,
+                                 successor=successor)
+
+        # straight import
+        elif should_import == 1:
+            self.__handle_import(fmd=file_metadata, table=table, msg=message, update_key=update_key)
+
+    def __import_known_fingerprint(self, table: str, file_metadata: FileMetaData, update_key: int) -> bool:
+        """
+        Mark a file of which only the fingerprint is known as present, if a binary identical file with the same
+        fingerprint is in the images table. The file_hash is taken from the identical file.
+
+        :param table: import table of the current import
+        :param file_metadata: metadata of the file, only the fingerprint and the google fotos metadata are set
+        :param update_key: key of the file in the import table
+        :return: True if the file was handled, False if it needs to be hashed
+        """
+        current_file_path = os.path.join(file_metadata.org_fpath, file_metadata.org_fname)
+
+        self.cur.execute("SELECT images.new_name, images.datetime, images.file_hash FROM fingerprints "
+                         "JOIN images ON fingerprints.image_key = images.key "
+                         "WHERE fingerprints.file_size = ? AND fingerprints.partial_hash = ?",
+                         (file_metadata.file_size, file_metadata.partial_hash))
+        for new_name, dt_str, file_hash in self.cur.fetchall():
+            old_path = self.path_from_datetime(dt_obj=self.__string_to_datetime(dt_str=dt_str), file_name=new_name)
+
+            if old_path in self.__pending_copies:
+                self.__import_commit(force=True)
+
+            if filecmp.cmp(old_path, current_file_path, shallow=False):
+                file_metadata.file_hash = file_hash
+                self.__cache_known_file(table=table, file_metadata=file_metadata, dt_str=dt_str,
+                                        update_key=update_key)
+                self.__handle_preset(table=table, file_metadata=file_metadata, msg="Binary matching file found.",
+                                     present_file_name=new_name, update_key=update_key, status_code=0,
+                                     successor=new_name)
+                return True
+
+        return False
+
+    def __import_known_hash(self, table: str, file_metadata: FileMetaData, update_key: int) -> bool:
+        """
+        Mark a file of which only the hash is known as present, if a binary identical file is in the images table or
+        a single entry with matching hash and a successor is in the replaced table.
+
+        :param table: import table of the current import
+        :param file_metadata: metadata of the file, only the hash and the google fotos metadata are set
+        :param update_key: key of the file in the import table
+        :return: True if the file was handled, False if it needs to be processed normally
+        """
+        current_file_path = os.path.join(file_metadata.org_fpath, file_metadata.org_fname)
+
+        self.cur.execute("SELECT new_name, datetime FROM images WHERE file_hash = ?", (file_metadata.file_hash,))
+        for new_name, dt_str in self.cur.fetchall():
+            old_path = self.path_from_datetime(dt_obj=self.__string_to_datetime(dt_str=dt_str), file_name=new_name)
+
+            # match is imported in the current batch, commit to get the file copied
+            if old_path in self.__pending_copies:
+                self.__import_commit(force=True)
+
+            if filecmp.cmp(old_path, current_file_path, shallow=False):
+                self.__cache_known_file(table=table, file_metadata=file_metadata, dt_str=dt_str,
+                                        update_key=update_key)
+                self.__handle_preset(table=table, file_metadata=file_metadata, msg="Binary matching file found.",
+                                     present_file_name=new_name, update_key=update_key, status_code=0,
+                                     successor=new_name)
+                return True
+
+        self.cur.execute("SELECT images.new_name, replaced.datetime FROM replaced "
+                         "JOIN images ON replaced.successor = images.key "
+                         "WHERE replaced.file_hash = ?", (file_metadata.file_hash,))
+        successors = self.cur.fetchall()
+        if len(successors) != 1:
+            return False
+
+        self.__cache_known_file(table=table, file_metadata=file_metadata, dt_str=successors[0][1],
+                                update_key=update_key)
+        self.__handle_preset(table=table, file_metadata=file_metadata,
+                             msg="Found entry in database with matching hash", present_file_name=successors[0][0],
+                             update_key=update_key, status_code=-1, successor=successors[0][0])
+        return True
 
     def __rec_list(self, path, table: str, allowed_files: set):
-        count = 0
-        sub = os.listdir(path)
-        for f in sub:
-            np = os.path.join(path, f)
-            if os.path.isfile(np):
-                # compute the allowed
-                f_allowed = 1 if os.path.splitext(np)[1].lower() in allowed_files else 0
-                fname = os.path.basename(np)
-                fpath = os.path.dirname(np)
-
-                # insert into temporary database
-                self.cur.execute(f"INSERT INTO {table} (org_fname, org_fpath, allowed) "
-                                 f"VALUES ('{fname}', '{fpath}', {f_allowed})")
-                count += 1
-            elif os.path.isdir(np):
-                count += self.__rec_list(np, table, allowed_files)
-        return count
+        rows = ((fname, fpath, 1 if os.path.splitext(fname)[1].lower() in allowed_files else 0, size, mtime)
+                for fpath, fname, size, mtime in walk_files(path))
+
+        # insert into temporary database
+        before = self.con.total_changes
+        self.cur.executemany(f"INSERT INTO {table} (org_fname, org_fpath, allowed, file_size, mtime) "
+                             f"VALUES (?, ?, ?, ?, ?)", rows)
+        return self.con.total_changes - before
 
     def __handle_preset(self, table: str, file_metadata: FileMetaData, msg: str,
                         present_file_name: str, update_key: int, status_code: int, successor: str):
@@ -554,42 +1226,25 @@ class PhotoDb:
         :param update_key:
         :return:
         """
-        if file_metadata.google_fotos_metadata is None:
-            self.cur.execute(f"UPDATE {table} "
-                             f"SET metadata = '{self.__dict_to_b64(file_metadata.metadata)}', "
-                             f"file_hash = '{file_metadata.file_hash}', "
-                             f"imported = 0, "
-                             f"processed=1, "
-                             f"message = '{msg}', "
-                             f"hash_based_duplicate = '{present_file_name}' WHERE key = {update_key}")
-            self.con.commit()
-        else:
-            self.cur.execute(f"UPDATE {table} "
-                             f"SET metadata = '{self.__dict_to_b64(file_metadata.metadata)}', "
-                             f"file_hash = '{file_metadata.file_hash}', "
-                             f"imported = 0, "
-                             f"processed=1, "
-                             f"message = '{msg}', "
-                             f"google_fotos_metadata = '{self.__dict_to_b64(file_metadata.google_fotos_metadata)}', "
-                             f"hash_based_duplicate = '{present_file_name}' WHERE key = {update_key}")
-            self.con.commit()
-
-
-            # TODO simplify the two if blocks.
-            if status_code == 0:
-                self.cur.execute(f"UPDATE images SET "
-                                 f"google_fotos_metadata = '{self.__dict_to_b64(file_metadata.google_fotos_metadata)}', "
-                                 f"original_google_metadata = 0 WHERE new_name = '{successor}'")
-
-                self.con.commit()
-
-            elif status_code == -1:
-                self.cur.execute(f"UPDATE images SET "
-                                 f"google_fotos_metadata = '{self.__dict_to_b64(file_metadata.google_fotos_metadata)}', "
-                                 f"original_google_metadata = 0 WHERE new_name = '{successor}'")
-
-                self.con.commit()
-                # raise NotImplementedError("Updating of google fotos metadata if file is in replaced not implemented.")
+        google_fotos_metadata = self.__dict_to_json(file_metadata.google_fotos_metadata)
+
+        self.cur.execute(f"UPDATE {table} "
+                         f"SET metadata = ?, "
+                         f"file_hash = ?, "
+                         f"imported = 0, "
+                         f"processed=1, "
+                         f"message = ?, "
+                         f"google_fotos_metadata = ?, "
+                         f"hash_based_duplicate = ? WHERE key = ?",
+                         (self.__dict_to_json(file_metadata.metadata), file_metadata.file_hash, msg,
+                          google_fotos_metadata, present_file_name, update_key))
+
+        # update the google fotos metadata of the present file, regardless of it being in images or replaced
+        if google_fotos_metadata is not None and status_code in (0, -1):
+            self.cur.execute("UPDATE images SET google_fotos_metadata = ?, original_google_metadata = 0 "
+                             "WHERE new_name = ?", (google_fotos_metadata, successor))
+
+        self.__import_commit()
 
     def __handle_import(self, fmd: FileMetaData, table: str, msg: str, update_key: int):
 
@@ -602,53 +1257,50 @@ class PhotoDb:
 
         self.cur.execute(f"INSERT INTO names (name) VALUES ('{new_file_name}')")
 
-        # copy file and preserve metadata
-        shutil.copy2(src=os.path.join(fmd.org_fpath, fmd.org_fname),
-                     dst=new_file_path,
-                     follow_symlinks=True)
-
-        if fmd.google_fotos_metadata is None:
-            # create entry in images database
-            self.cur.execute("INSERT INTO images (org_fname, org_fpath, metadata, naming_tag, "
-                             "file_hash, new_name, datetime, present, verify) "
-                             f"VALUES ('{fmd.org_fname}', '{fmd.org_fpath}',"
-                             f"'{self.__dict_to_b64(fmd.metadata)}', '{fmd.naming_tag}', "
-                             f"'{fmd.file_hash}', '{new_file_name}',"
-                             f"'{self.__datetime_to_db_str(fmd.datetime_object)}',"
-                             f"1, {1 if fmd.verify else 0})")
-
-            # create entry in temporary database
-            self.cur.execute(f"UPDATE {table} "
-                             f"SET metadata = '{self.__dict_to_b64(fmd.metadata)}', "
-                             f"file_hash = '{fmd.file_hash}', "
-                             f"new_name = '{new_file_name}', "
-                             f"imported = 1, "
-                             f"processed = 1, "
-                             f"message = '{msg}' WHERE key = {update_key}")
-        else:
-            # create entry in images database
-            self.cur.execute("INSERT INTO images (org_fname, org_fpath, metadata, naming_tag, "
-                             "file_hash, new_name, datetime, present, verify,google_fotos_metadata ) "
-                             f"VALUES ('{fmd.org_fname}', '{fmd.org_fpath}',"
-                             f"'{self.__dict_to_b64(fmd.metadata)}', '{fmd.naming_tag}', "
-                             f"'{fmd.file_hash}', '{new_file_name}',"
-                             f"'{self.__datetime_to_db_str(fmd.datetime_object)}',"
-                             f"1, {1 if fmd.verify else 0},"
-                             f"'{self.__dict_to_b64(fmd.google_fotos_metadata)}')")
-
-            # create entry in temporary database
-            self.cur.execute(f"UPDATE {table} "
-                             f"SET metadata = '{self.__dict_to_b64(fmd.metadata)}', "
-                             f"file_hash = '{fmd.file_hash}', "
-                             f"new_name = '{new_file_name}', "
-                             f"imported = 1, "
-                             f"processed = 1, "
-                             f"google_fotos_metadata = '{self.__dict_to_b64(fmd.google_fotos_metadata)}', "
-                             f"message = '{msg}' WHERE key = {update_key}")
+        # file is copied once the rows are committed
+        self.__pending_copies[new_file_path] = os.path.join(fmd.org_fpath, fmd.org_fname)
 
-        self.con.commit()
+        metadata = self.__dict_to_json(fmd.metadata)
+        google_fotos_metadata = self.__dict_to_json(fmd.google_fotos_metadata)
+
+        # create entry in images database
+        self.cur.execute("INSERT INTO images (org_fname, org_fpath, metadata, naming_tag, "
+                         "file_hash, new_name, datetime, present, verify, google_fotos_metadata) "
+                         "VALUES (?, ?, ?, ?, ?, ?, ?, 1, ?, ?)",
+                         (fmd.org_fname, fmd.org_fpath, metadata, fmd.naming_tag, fmd.file_hash, new_file_name,
+                          self.__datetime_to_db_str(fmd.datetime_object), 1 if fmd.verify else 0,
+                          google_fotos_metadata))
+
+        image_key = self.cur.lastrowid
 
-    def determine_import(self, file_metadata: FileMetaData, current_file_path: str = None) -> tuple:
+        date_tags = fmd.date_tags
+        if date_tags is None:
+            date_tags = parse_date_tags(fmd.metadata, ignore_errors=True)
+
+        self.__insert_date_tags(image_key=image_key, date_tags=date_tags)
+
+        # process_files fingerprints every file while hashing it, this only reads files processed otherwise
+        if fmd.partial_hash is None:
+            fmd.file_size, fmd.partial_hash = fingerprint_file(os.path.join(fmd.org_fpath, fmd.org_fname))
+
+        self.cur.execute("INSERT INTO fingerprints (image_key, file_size, partial_hash) VALUES (?, ?, ?)",
+                         (image_key, fmd.file_size, fmd.partial_hash))
+
+        # create entry in temporary database
+        self.cur.execute(f"UPDATE {table} "
+                         f"SET metadata = ?, "
+                         f"file_hash = ?, "
+                         f"new_name = ?, "
+                         f"imported = 1, "
+                         f"processed = 1, "
+                         f"google_fotos_metadata = ?, "
+                         f"message = ? WHERE key = ?",
+                         (metadata, fmd.file_hash, new_file_name, google_fotos_metadata, msg, update_key))
+
+        self.__import_commit()
+
+    def determine_import(self, file_metadata: FileMetaData, current_file_path: str = None,
+                         verify_binary: bool = True) -> tuple:
         # Verify existence in the database
         # TODO: rethink the present column in database
 
@@ -673,7 +1325,14 @@ class PhotoDb:
             # verify match by hash, if has doesn't match, search replaced table
             if match[4] == file_metadata.file_hash:
 
+                # match is imported in the current batch, commit to get the file copied
+                if old_path in self.__pending_copies:
+                    self.__import_commit(force=True)
+
                 # compare binary if hash is match
+                if not verify_binary:
+                    return 0, "Hash matching file found.", match[5]
+
                 if not filecmp.cmp(old_path, current_file_path, shallow=False):
                     warnings.warn(f"Files with identical hash but differing binary found.\n"
                                   f"New File: {current_file_path}\nOld File: {old_path}", RareOccurrence)
@@ -862,15 +1521,14 @@ class PhotoDb:
         # would violate SQL but just put it in here because I might be stupid
         assert len(data) == 1
 
-        # insert duplicate into replaced table
-        self.cur.execute(f"INSERT INTO replaced "
-                         f"(key, org_fname, metadata, google_fotos_metadata, file_hash, successor, datetime) "
-                         f"VALUES "
-                         f"({data[0][0]}, '{data[0][1]}', '{data[0][2]}', '{data[0][3]}', '{data[0][4]}', {successor}, "
-                         f"'{data[0][5]}')")
+        # insert duplicate into replaced table, the json metadata may contain quotes, so it's passed as parameter
+        self.cur.execute("INSERT INTO replaced "
+                         "(key, org_fname, metadata, google_fotos_metadata, file_hash, successor, datetime) "
+                         "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                         (data[0][0], data[0][1], data[0][2], data[0][3], data[0][4], successor, data[0][5]))
 
         # is removed duplicate from main table because it could result in confusion
-        self.cur.execute(f"DELETE FROM images WHERE key = {duplicate_image_id}")
+        self.__delete_image_rows(duplicate_image_id)
 
         self.con.commit()
 
@@ -896,30 +1554,43 @@ class PhotoDb:
             raise ValueError("Key or Filename must be provided")
 
         if key is not None:
-            self.cur.execute(f"SELECT key, org_fname , org_fpath, metadata, google_fotos_metadata, naming_tag, "
-                             f"file_hash, new_name , datetime, present, verify FROM images WHERE key is {key}")
+            self.cur.execute(f"SELECT {self.__entry_columns('images')} FROM images WHERE key is {key}")
 
         else:
-            self.cur.execute(f"SELECT key, org_fname , org_fpath, metadata, google_fotos_metadata, naming_tag, "
-                             f"file_hash, new_name , datetime, present, verify FROM images WHERE new_name = '{filename}'")
+            self.cur.execute(f"SELECT {self.__entry_columns('images')} FROM images WHERE new_name = '{filename}'")
 
         res = self.cur.fetchone()
 
         if res is not None:
-            return DatabaseEntry(
-                key=res[0],
-                org_fname=res[1],
-                org_fpath=res[2],
-                metadata=self.__b64_to_dict(res[3]),
-                naming_tag=res[5],
-                file_hash=res[6],
-                new_name=res[7],
-                datetime=self.__db_str_to_datetime(res[8]),
-                google_fotos_metadata=self.__b64_to_dict(res[4]),
-                verify=res[10])
+            return self.__row_to_entry(res)
 
         return None
 
+    @staticmethod
+    def __entry_columns(table: str) -> str:
+        """
+        Columns of the images table needed for a DatabaseEntry, prefixed with table.
+        """
+        return ", ".join(f"{table}.{c}" for c in ("key", "org_fname", "org_fpath", "metadata", "google_fotos_metadata",
+                                                 "naming_tag", "file_hash", "new_name", "datetime", "present",
+                                                 "verify"))
+
+    def __row_to_entry(self, res: tuple) -> DatabaseEntry:
+        """
+        Convert a row of the columns of __entry_columns into a DatabaseEntry.
+        """
+        return DatabaseEntry(
+            key=res[0],
+            org_fname=res[1],
+            org_fpath=res[2],
+            metadata=self.__json_to_dict(res[3]),
+            naming_tag=res[5],
+            file_hash=res[6],
+            new_name=res[7],
+            datetime=self.__db_str_to_datetime(res[8]),
+            google_fotos_metadata=self.__json_to_dict(res[4]),
+            verify=res[10])
+
     def get_metadata(self,  key: int = None, filename: str = None):
         if key is None and filename is None:
             raise ValueError("Key or Filename must be provided")
@@ -933,7 +1604,7 @@ class PhotoDb:
         res = self.cur.fetchone()
 
         if res is not None:
-            return self.__b64_to_dict(res[0])
+            return self.__json_to_dict(res[0])
 
         return None
 
@@ -969,7 +1640,7 @@ class PhotoDb:
         img_key = results[0][0]
         img_fname = results[0][1]
 
-        if os.path.splitext(img_fname)[1] not in {".mov", ".m4v", ".mp4", ".gif"}:
+        if os.path.splitext(img_fname)[1] not in video_extensions:
             if inform:
                 # TODO Debug
                 # print(f"{img_fname} was not of supported type to create thumbnails with ffmpeg lib.")
@@ -978,35 +1649,15 @@ class PhotoDb:
 
         img_fpath = self.path_from_datetime(img_dt, img_fname)
 
-        # don't create a thumbnail if it already exists.
-        if os.path.exists(self.thumbnail_name(ext=os.path.splitext(img_fname)[1], key=img_key)) and not overwrite:
-            return False
-
-        try:
-            probe = ffmpeg.probe(img_fpath)
-        except ffmpeg.Error as e:
-            print(e.stderr.decode(), file=sys.stderr)
+        # don't create a thumbnail if it already exists, videos have a jpg thumbnail.
+        if os.path.exists(self.thumbnail_name(ext=".jpg", key=img_key)) and not overwrite:
             return False
 
-        time = float(probe['streams'][0]['duration']) // 2
-
-        for i in range(len(probe['streams'])):
-            width = probe['streams'][i].get('width')
-            if width is not None:
-                break
-        try:
-            (
-                ffmpeg
-                .input(img_fpath, ss=time)
-                .filter('scale', width, -1)
-                .output(self.thumbnail_name(ext=".jpg", key=img_key), vframes=1)
-                .overwrite_output()
-                .run(capture_stdout=True, capture_stderr=True)
-            )
-        except ffmpeg.Error as e:
-            print(e.stderr.decode(), file=sys.stderr)
+        value = video_thumbnail(src=img_fpath, dst=self.thumbnail_name(ext=".jpg", key=img_key))
+        if value is None:
             return False
 
+        self.__store_dhash(key=img_key, value=value)
         return True
 
     def create_img_thumbnail(self, key: int = None, fname: str = None, max_pixel: int = 512,
@@ -1041,7 +1692,7 @@ class PhotoDb:
         img_key = results[0][0]
         img_fname = results[0][1]
 
-        if os.path.splitext(img_fname)[1] not in {".jpeg", ".jpg", ".png", ".tiff"}:
+        if os.path.splitext(img_fname)[1] not in image_extensions:
             if inform:
                 # TODO logging debug
                 # print(f"{img_fname} was not of supported type to create thumbnails with cv2 lib.")
@@ -1054,27 +1705,147 @@ class PhotoDb:
         if os.path.exists(self.thumbnail_name(ext=os.path.splitext(img_fname)[1], key=img_key)) and not overwrite:
             return False
 
-        # load image from disk, 1 means cv::IMREAD_COLOR
-        img = cv2.imread(img_fpath, 1)
+        value = image_thumbnail(src=img_fpath, dst=self.thumbnail_name(ext=os.path.splitext(img_fname)[1], key=img_key),
+                                max_pixel=max_pixel)
+        if value is None:
+            return False
 
-        # determine which axis is larger
-        max_pix = max(img.shape[0], img.shape[1])
+        self.__store_dhash(key=img_key, value=value)
+        return True
 
-        # calculate new size
-        if max_pix == img.shape[0]:
-            py = max_pixel
-            px = int(max_pixel / max_pix * img.shape[1])
-        else:
-            px = max_pixel
-            py = int(max_pixel / max_pix * img.shape[0])
+    def __store_dhash(self, key: int, value: Union[int, None]):
+        """
+        Store the difference hash of an image, doesn't commit.
 
-        # resize image to new size
-        img_half = cv2.resize(img, dsize=(px, py))
+        :param key: key of the image
+        :param value: hash, nothing is stored if it's None
+        :return:
+        """
+        if value is not None:
+            self.cur.execute("INSERT OR REPLACE INTO phashes (image_key, dhash) VALUES (?, ?)", (key, f"{value:016x}"))
 
-        # store image
-        cv2.imwrite(self.thumbnail_name(ext=os.path.splitext(img_fname)[1], key=img_key), img_half)
+    def thumbnail_path(self, key: int, new_name: str, create: bool = True) -> Union[str, None]:
+        """
+        Path to the thumbnail of an image, the thumbnail is created if it doesn't exist yet.
 
-        return True
+        :param key: key of the image
+        :param new_name: new_name of the image
+        :param create: create a missing thumbnail, which writes its difference hash to the database
+        :return: path or None if no thumbnail could be created
+        """
+        # videos have a jpg thumbnail
+        candidates = (self.thumbnail_name(ext=os.path.splitext(new_name)[1], key=key),
+                      self.thumbnail_name(ext=".jpg", key=key))
+
+        if create and not any(os.path.exists(thumbnail) for thumbnail in candidates):
+            if not self.create_img_thumbnail(key=key) and not self.create_vid_thumbnail(key=key):
+                return None
+
+        for thumbnail in candidates:
+            if os.path.exists(thumbnail):
+                return thumbnail
+
+        return None
+
+    def __thumbnail_entry(self, key: int, new_name: str, dt_str: str) -> Union[Tuple[int, str, str], None]:
+        """
+        Entry of an image for the workers of a search, which create the thumbnail if it's missing.
+
+        :param key: key of the image
+        :param new_name: new_name of the image
+        :param dt_str: datetime of the image as stored in the database
+        :return: (key, path of the image, path of its thumbnail) or None if no thumbnail can be created of the file
+        """
+        ext = thumbnail_extension(new_name)
+        if ext is None:
+            return None
+
+        return key, self.path_from_datetime(self.__db_str_to_datetime(dt_str), new_name), \
+            self.thumbnail_name(ext=ext, key=key)
+
+    def fill_phashes(self, procs: int = 4, page_size: int = 256, max_pixel: int = 512,
+                     progress: Callable[[int, int], None] = None,
+                     handle_finished: Callable[..., None] = None, final_task: SearchTask = None) -> DuplicateSearch:
+        """
+        Prepare the search computing the difference hash of all images that don't have one yet. The hashes are
+        computed from the thumbnails by the workers of a DuplicateSearch (see search_scheduler.hash_thumbnails),
+        missing thumbnails are created by the workers as well. The hashes are stored as the pages finish.
+
+        :param procs: number of worker processes
+        :param page_size: number of images per task
+        :param max_pixel: size of the larger side of created image thumbnails
+        :param progress: called with (number of images hashed, total number of images)
+        :param handle_finished: called once all hashes are stored, see DuplicateSearch
+        :param final_task: task run once all hashes are stored, see DuplicateSearch
+        :return: the unstarted DuplicateSearch, call its run or poll method
+        """
+        self.cur.execute("SELECT key, new_name, datetime FROM images WHERE key NOT IN (SELECT image_key FROM phashes) "
+                         "ORDER BY key")
+        entries = [entry for entry in itertools.starmap(self.__thumbnail_entry, self.cur.fetchall())
+                   if entry is not None]
+
+        tasks = [SearchTask(weight=len(entries[i:i + page_size]), func=hash_thumbnails,
+                            args=(entries[i:i + page_size], max_pixel))
+                 for i in range(0, len(entries), page_size)]
+        hashed = 0
+
+        def handle_result(hashes: List[Tuple[int, int]]):
+            nonlocal hashed
+
+            for key, value in hashes:
+                self.__store_dhash(key=key, value=value)
+            self.con.commit()
+
+            hashed += len(hashes)
+            if progress is not None:
+                progress(hashed, len(entries))
+
+        return DuplicateSearch(tasks=tasks, handle_result=handle_result, procs=procs, handle_finished=handle_finished,
+                               final_task=final_task)
+
+    def phash_dup_search(self, max_distance: int = 4, overwrite: bool = False, separate_process: bool = True,
+                         procs: int = 4, progress: Callable[[int, int], None] = None):
+        """
+        Populates the duplicates table with clusters of visually similar images across the entire library, using the
+        difference hashes of the phashes table. Only images without a hash need to be loaded, which is done by the
+        workers of fill_phashes. The search itself uses a BK-tree and doesn't compare all pairs, it runs in a worker
+        once all hashes are stored (see search_scheduler.cluster_phashes). Only the clusters are inserted by the
+        caller. Nothing is inserted if the search is cancelled.
+
+        :param max_distance: maximum hamming distance (of 64 bits) of two similar images
+        :param overwrite: do not ask if existing duplicate computations should be preserved.
+        :param separate_process: if true, the unstarted DuplicateSearch is returned and the caller polls it (bc gui),
+        otherwise the search is run to completion
+        :param procs: number of worker processes computing the missing hashes
+        :param progress: called with (number of images hashed, total number of images) while the missing hashes are
+        computed
+        :return:
+        """
+        if self.duplicate_table_exists():
+
+            # on not overwrite, return already
+            if not overwrite:
+                return False, "Duplicates Table exist."
+
+            # otherwise drop table
+            self.delete_duplicates_table()
+
+        self.create_duplicates_table()
+        self.con.commit()
+
+        def handle_finished(result: Tuple[List[List[int]], List[int]]):
+            clusters, scores = result
+            self.insert_duplicate_clusters(match_type="phash", clusters=clusters, scores=scores)
+            self.con.commit()
+
+        search = self.fill_phashes(procs=procs, progress=progress, handle_finished=handle_finished,
+                                   final_task=SearchTask(weight=0, func=cluster_phashes,
+                                                         args=(self.img_db, max_distance)))
+
+        if not separate_process:
+            search.run()
+
+        return True, search
 
     def image_to_trash(self, key: int = None, file_name: str = None):
         # both none
@@ -1127,14 +1898,29 @@ class PhotoDb:
         self.cur.execute("INSERT into trash "
                          "(key, org_fname, org_fpath, metadata, google_fotos_metadata, naming_tag, file_hash,"
                          f" new_name, datetime, original_google_metadata) "
-                         "VALUES "
-                         f"({key}, '{org_fname}', '{org_fpath}', '{metadata}', '{google_fotos_metadata}', "
-                         f"'{naming_tag}', '{file_hash}', '{new_name}', '{datetime}', {original_google_metadata})")
+                         "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                         (key, org_fname, org_fpath, metadata, google_fotos_metadata, naming_tag, file_hash, new_name,
+                          datetime, original_google_metadata))
 
-        self.cur.execute(f"DELETE FROM images WHERE key = {key}")
+        self.__delete_image_rows(key)
         self.con.commit()
 
-    def img_ana_dup_search(self, level: str, procs: int = 16, overwrite: bool = False, new: bool = True, separate_process: bool = True):
+    def img_ana_dup_search(self, level: str, procs: int = 16, overwrite: bool = False, new: bool = True,
+                           separate_process: bool = True, engine: str = None):
+        """
+        Search for visually similar images within the groups given by level.
+
+        :param level: possible: all, year, month, day
+        :param procs: number of worker processes of the numpy and the old difpy search
+        :param overwrite: Will drop an existing duplicates table if detected
+        :param new: use the fastDif search instead of the old difpy search
+        :param separate_process: if true, the search will be performed in a separate process (bc gui)
+        :param engine: "numpy" for the in tree search (see img_ana_dup_search_numpy), overrides new
+        :return:
+        """
+        if engine == "numpy":
+            return self.img_ana_dup_search_numpy(level, overwrite, separate_process, procs=procs)
+
         if new:
             return self.img_ana_dup_search_new(level, overwrite, separate_process)
         else:
@@ -1199,6 +1985,165 @@ class PhotoDb:
             pipe_in.send("DONE")
         return True, pipe_out
 
+    def img_ana_dup_search_numpy(self, level: str, overwrite: bool = False, separate_process: bool = True,
+                                 threshold: float = 200.0, size: int = 64, procs: int = 4, max_pixel: int = 512):
+        """
+        Search for visually similar images, comparing all pairs of images within a year, month, day or the entire
+        library with vectorized numpy operations on downsampled grey thumbnails. Every group is compared by a worker
+        of a DuplicateSearch (see search_scheduler.numpy_group), which creates the missing thumbnails of the group as
+        well. The clusters are written to the duplicates table as the groups finish.
+
+        :param level: possible: all, year, month, day
+        :param overwrite: Will drop an existing duplicates table if detected
+        :param separate_process: if true, the unstarted DuplicateSearch is returned and the caller polls it (bc gui),
+        otherwise the search is run to completion
+        :param threshold: maximum mean squared error (of 0-255 grey values) of similar images
+        :param size: width and height the thumbnails are downsampled to
+        :param procs: number of worker processes
+        :param max_pixel: size of the larger side of created image thumbnails
+        :return:
+        """
+        if level not in ("all", "year", "month", "day"):
+            raise ValueError("Not supported search level")
+
+        if self.duplicate_table_exists():
+
+            # on not overwrite, return already
+            if not overwrite:
+                return False, "Duplicates Table exist."
+
+            # otherwise drop table
+            self.delete_duplicates_table()
+
+        self.create_duplicates_table()
+        self.con.commit()
+
+        # length of the datetime prefix shared by the images of a group
+        prefix = {"all": 0, "year": 4, "month": 7, "day": 10}[level]
+
+        # missing thumbnails are created by the workers, nothing is loaded here
+        self.cur.execute(f"SELECT key, new_name, datetime, substr(datetime, 1, {prefix}) FROM images "
+                         f"ORDER BY datetime, key")
+        tasks = []
+        for _, rows in itertools.groupby(self.cur.fetchall(), key=lambda row: row[3]):
+            entries = [entry for entry in itertools.starmap(self.__thumbnail_entry, (row[:3] for row in rows))
+                       if entry is not None]
+
+            if len(entries) > 1:
+                tasks.append(SearchTask(weight=len(entries), func=numpy_group,
+                                        args=(entries, threshold, size, max_pixel)))
+
+        def handle_result(result: Tuple[List[List[int]], List[float], List[Tuple[int, int]]]):
+            clusters, scores, hashes = result
+
+            for key, value in hashes:
+                self.__store_dhash(key=key, value=value)
+
+            self.insert_duplicate_clusters(match_type=level, clusters=clusters, scores=scores)
+            self.con.commit()
+
+        search = DuplicateSearch(tasks=tasks, handle_result=handle_result, procs=procs)
+
+        if not separate_process:
+            search.run()
+
+        return True, search
+
+    def img_ana_dup_search_window(self, hours: float = 24.0, overwrite: bool = False, separate_process: bool = True,
+                                  threshold: float = 200.0, size: int = 64, procs: int = 4, max_pixel: int = 512):
+        """
+        Search for visually similar images taken within hours of each other, regardless of the day, month or year
+        folder they are in. Copies whose datetime was resolved from different tags (e.g. File:FileModifyDate and
+        EXIF:DateTimeOriginal) end up in neighbouring folders and are missed by the day, month and year search.
+
+        The images are read in the order of the images_datetime_index and split into buckets of hours. Every bucket is
+        compared with itself and the following bucket by a worker of a DuplicateSearch (see
+        search_scheduler.numpy_window), which creates the missing thumbnails of the buckets as well. So the cost grows
+        with the number of images per window and not with the size of the library. The clusters are the connected
+        components of all matches, written once all buckets are done. If the search is cancelled, the matches found
+        so far are discarded and the duplicates table stays empty.
+
+        :param hours: maximum difference of the datetimes of similar images
+        :param overwrite: Will drop an existing duplicates table if detected
+        :param separate_process: if true, the unstarted DuplicateSearch is returned and the caller polls it (bc gui),
+        otherwise the search is run to completion
+        :param threshold: maximum mean squared error (of 0-255 grey values) of similar images
+        :param size: width and height the thumbnails are downsampled to
+        :param procs: number of worker processes
+        :param max_pixel: size of the larger side of created image thumbnails
+        :return:
+        """
+        if hours <= 0:
+            raise ValueError("The window needs to be positive")
+
+        if self.duplicate_table_exists():
+
+            # on not overwrite, return already
+            if not overwrite:
+                return False, "Duplicates Table exist."
+
+            # otherwise drop table
+            self.delete_duplicates_table()
+
+        self.create_duplicates_table()
+        self.con.commit()
+
+        window = hours * 3600
+        epoch = datetime.datetime(1970, 1, 1)
+
+        self.cur.execute("SELECT key, new_name, datetime FROM images ORDER BY datetime, key")
+        buckets = []
+        bucket_ids = []
+        for key, new_name, dt_str in self.cur.fetchall():
+            # missing thumbnails are created by the workers, nothing is loaded here
+            entry = self.__thumbnail_entry(key, new_name, dt_str)
+            if entry is None:
+                continue
+
+            timestamp = (self.__db_str_to_datetime(dt_str) - epoch).total_seconds()
+            bucket_id = int(timestamp // window)
+
+            if len(bucket_ids) == 0 or bucket_ids[-1] != bucket_id:
+                buckets.append([])
+                bucket_ids.append(bucket_id)
+
+            buckets[-1].append(entry + (timestamp,))
+
+        tasks = []
+        for i, bucket in enumerate(buckets):
+            # images of the following bucket can be within the window of the images of this bucket
+            entries = bucket
+            if i + 1 < len(buckets) and bucket_ids[i + 1] == bucket_ids[i] + 1:
+                entries = bucket + buckets[i + 1]
+
+            if len(entries) > 1:
+                tasks.append(SearchTask(weight=len(entries), func=numpy_window,
+                                        args=(entries, len(bucket), window, threshold, size, max_pixel)))
+
+        keys = [entry[0] for bucket in buckets for entry in bucket]
+        pairs = []
+
+        def handle_result(result: Tuple[List[Tuple[int, int, float]], List[Tuple[int, int]]]):
+            matches, hashes = result
+            pairs.extend(matches)
+
+            for key, value in hashes:
+                self.__store_dhash(key=key, value=value)
+            self.con.commit()
+
+        # not called if the search is cancelled, incomplete matches would leave clusters split up
+        def handle_finished():
+            clusters, scores = connected_components(keys, pairs)
+            self.insert_duplicate_clusters(match_type="window", clusters=clusters, scores=scores)
+            self.con.commit()
+
+        search = DuplicateSearch(tasks=tasks, handle_result=handle_result, procs=procs, handle_finished=handle_finished)
+
+        if not separate_process:
+            search.run()
+
+        return True, search
+
     def process_images_fast_difpy(self, folders: list, pipe_in: mpconn.Connection, info: str):
         """
         The eigentliche implementation. Needs to be fixed. I namely need to switch to using the Qt5 gui stuff.
@@ -1241,8 +2186,7 @@ class PhotoDb:
                 for d in val["duplicates"]:
                     keys.append(self.file_name_to_key(os.path.basename(d)))
 
-                self.cur.execute(f"INSERT INTO duplicates (match_type, matched_keys) "
-                                 f"VALUES ('{info}', '{json.dumps(keys)}')")
+                self.insert_duplicate_clusters(match_type=info, clusters=[keys])
             self.con.commit()
             pipe_in.send((i, initial_size))
 
@@ -1253,7 +2197,8 @@ class PhotoDb:
     def img_ana_dup_search_old(self, level: str, procs: int = 16, overwrite: bool = False):
         """
         Perform default difpy search. Level determines the level at which the fotos are compared. The higher the level,
-        the longer the comparison. O(n²)
+        the longer the comparison. O(n²) Every folder is searched by a worker of a DuplicateSearch, the largest
+        folders first. The returned search needs to be polled or run, it writes the results to the database.
         :param overwrite: Will drop an existing duplicates table if detected
         :param level: possible: all, year, month, day
         :param procs: number of parallel processes
@@ -1292,41 +2237,21 @@ class PhotoDb:
             dirs.remove(self.thumbnail_dir)
 
         while self.trash_dir in dirs:
-            dirs.remove(self.thumbnail_dir)
-
-        task_queue = mp.Queue()
-        [task_queue.put(directory) for directory in dirs]
-        result_queue = mp.Queue()
-        init_size = len(dirs)
-
-        def difpy_process(task: mp.Queue, results: mp.Queue, id: int):
-            timeout = 10
-            while timeout > 0:
-                try:
-                    task_dir = task.get(block=False)
-                    print(f"{id:02}: processing {task_dir}")
-                    timeout = 10
-                except Empty:
-                    timeout -= 1
-                    time.sleep(1)
-                    continue
-
-                duplicates = dif(task_dir, show_progress=False, show_output=False)
-                results.put(duplicates.result)
-
-        self.proc_handles = []
+            dirs.remove(self.trash_dir)
 
-        for i in range(procs):
-            p = mp.Process(target=difpy_process, args=(task_queue, result_queue, i))
-            p.start()
-            self.proc_handles.append(p)
+        tasks = []
+        for directory in dirs:
+            with os.scandir(directory) as it:
+                weight = sum(1 for entry in it if entry.is_file())
+            tasks.append(SearchTask(weight=weight, func=difpy_folder, args=(directory,)))
 
-        pipe_out, pipe_in = mp.Pipe()
+        def handle_result(clusters: List[List[str]]):
+            for names in clusters:
+                self.insert_duplicate_clusters(match_type=level,
+                                               clusters=[[self.file_name_to_key(name) for name in names]])
+            self.con.commit()
 
-        p = mp.Process(target=self.result_processor, args=(init_size, result_queue, pipe_in, level))
-        p.start()
-        self.proc_handles.append(p)
-        return True, pipe_out
+        return True, DuplicateSearch(tasks=tasks, handle_result=handle_result, procs=procs)
 
     def file_name_to_key(self, file_name: str):
         self.cur.execute(f"SELECT key FROM images WHERE new_name = '{file_name}'")
@@ -1348,34 +2273,13 @@ class PhotoDb:
 
         return res[0][0]
 
-    def result_processor(self, initial_size: int, result: mp.Queue, pipe_in: mpconn.Connection, info: str):
-        count = 0
-        pipe_in.send((0, initial_size))
-
-        while count != initial_size:
-            results: dict = result.get()
-            count += 1
-
-            # iterate through results
-            for val in results.values():
-                keys = [self.file_name_to_key(val['filename'])]
-
-                # iterate through duplicates of single result
-                for d in val["duplicates"]:
-                    keys.append(self.file_name_to_key(os.path.basename(d)))
-
-                self.cur.execute(f"INSERT INTO duplicates (match_type, matched_keys) "
-                                 f"VALUES ('{info}', '{json.dumps(keys)}')")
-            self.con.commit()
-            pipe_in.send((count, initial_size))
-
-        pipe_in.send("DONE")
-        pipe_in.close()
-
-    def duplicates_from_hash(self, overwrite: bool = False) -> tuple:
+    def duplicates_from_hash(self, overwrite: bool = False, progress: Callable[[int, int], None] = None) -> tuple:
         """
-        Populates the duplicates table based on duplicates detected by identical hash
+        Populates the duplicates table based on duplicates detected by identical hash. All clusters are collected in a
+        single grouped query and inserted in one transaction.
+
         :param overwrite: do not ask if existing duplicate computations should be preserved.
+        :param progress: called with (number of clusters inserted, total number of clusters)
         :return:
         """
         msg = ""
@@ -1391,47 +2295,59 @@ class PhotoDb:
 
         self.create_duplicates_table()
 
-        duplicates = self.find_hash_based_duplicates(only_key=False)
+        self.cur.execute("SELECT group_concat(key) FROM images WHERE file_hash IS NOT NULL "
+                         "GROUP BY file_hash HAVING COUNT(key) > 1 ORDER BY file_hash")
+        clusters = [sorted(int(k) for k in row[0].split(",")) for row in self.cur.fetchall()]
 
-        for i in range(len(duplicates)):
-            if i % 100 == 0:
-                print(f"Processing {i} of {len(duplicates)}")
-
-            d = duplicates[i]
-            matching_keys = self.find_hash_in_pictures(d["file_hash"], only_key=True)
+        for i in range(0, len(clusters), 1000):
+            self.insert_duplicate_clusters(match_type="hash", clusters=clusters[i:i + 1000])
 
-            self.cur.execute(f"INSERT INTO duplicates (match_type, matched_keys) "
-                             f"VALUES ('hash', '{json.dumps(matching_keys)}')")
-
-        print(f"Done Processing")
+            if progress is not None:
+                progress(min(i + 1000, len(clusters)), len(clusters))
 
         self.con.commit()
-        return True, msg + f"Successfully found {len(duplicates)} duplicates"
+        return True, msg + f"Successfully found {len(clusters)} duplicates"
 
     def delete_duplicate_row(self, key: int):
-        self.cur.execute(f"DELETE FROM duplicates WHERE key = {key}")
+        self.cur.execute("DELETE FROM duplicate_members WHERE cluster_key = ?", (key,))
+        self.cur.execute("DELETE FROM duplicate_clusters WHERE key = ?", (key,))
         self.con.commit()
 
     def get_duplicate_entry(self):
         """
         Returns one entry from the duplicates table
-        :return:
+        :return: success, list of the DatabaseEntry of the images in the cluster, key of the cluster
         """
-        self.cur.execute("SELECT matched_keys, key FROM duplicates")
-        key_str = self.cur.fetchone()
+        clusters = self.get_duplicate_entries(limit=1)
 
-        if key_str is None:
+        if len(clusters) == 0:
             return False, [], None
 
-        row_id = key_str[1]
-        key_str = key_str[0]
-        keys = json.loads(key_str)
-        img_attribs = []
+        row_id, img_attribs = clusters[0]
+        return True, img_attribs, row_id
 
-        for k in keys:
-            img_attribs.append(self.gui_get_image(key=k))
+    def get_duplicate_entries(self, after: int = None, limit: int = 1) -> List[Tuple[int, List[DatabaseEntry]]]:
+        """
+        Returns the clusters of the duplicates table in order of their key.
 
-        return True, img_attribs, row_id
+        :param after: only clusters with a larger key, None for the first clusters
+        :param limit: maximum number of clusters
+        :return: list of key of the cluster, list of the DatabaseEntry of the images in the cluster
+        """
+        self.cur.execute("SELECT key FROM duplicate_clusters WHERE key > ? ORDER BY key LIMIT ?",
+                         (after if after is not None else -1, limit))
+        row_ids = [row[0] for row in self.cur.fetchall()]
+
+        clusters = []
+        for row_id in row_ids:
+            # members whose image isn't in the images table anymore are left out
+            self.cur.execute(f"SELECT {self.__entry_columns('images')} FROM duplicate_members "
+                             f"JOIN images ON images.key = duplicate_members.image_key "
+                             f"WHERE duplicate_members.cluster_key = ? ORDER BY duplicate_members.position",
+                             (row_id,))
+            clusters.append((row_id, [self.__row_to_entry(res) for res in self.cur.fetchall()]))
+
+        return clusters
 
     def limited_dir_rec_list(self, path: str, nor: int, results: list = None) -> Union[None, list]:
         """
@@ -1468,21 +2384,20 @@ class PhotoDb:
             self.limited_dir_rec_list(path=path, nor=nor, results=result_list)
             return result_list
         else:
-            content = os.listdir(path)
-
-            for c in content:
+            with os.scandir(path) as it:
+                for entry in it:
 
-                # ignore none dirs
-                if not os.path.isdir(os.path.join(path, c)):
-                    continue
+                    # ignore none dirs
+                    if not entry.is_dir():
+                        continue
 
-                # zero, add to list
-                if nor == 0:
-                    results.append(os.path.join(path, c))
-                    continue
+                    # zero, add to list
+                    if nor == 0:
+                        results.append(entry.path)
+                        continue
 
-                # not zero, continue in subdirectories.
-                self.limited_dir_rec_list(path=os.path.join(path, c), nor=nor - 1, results=results)
+                    # not zero, continue in subdirectories.
+                    self.limited_dir_rec_list(path=entry.path, nor=nor - 1, results=results)
 
             return None
 
@@ -1513,35 +2428,242 @@ class PhotoDb:
         self.con.commit()
         print(f"Added {count} non-tracked names to names table of {index} entries")
 
-    def thumbnail_creation(self):
-        index = 0
-        self.cur.execute(f"SELECT key FROM images WHERE key >= {index}")
-        result = self.cur.fetchone()
+    def __insert_date_tags(self, image_key: int, date_tags: list):
+        """
+        Insert the parsed date tags of an image into the date_tags table.
+
+        :param image_key: key of the image in the images table
+        :param date_tags: list of (tag, datetime, raw string) as returned by parse_date_tags
+        :return:
+        """
+        self.cur.executemany("INSERT INTO date_tags (image_key, tag, datetime, raw) VALUES (?, ?, ?, ?)",
+                             [(image_key, tag, self.__datetime_to_db_str(dt), raw) for tag, dt, raw in date_tags])
+
+    def fill_date_tags(self):
+        """
+        Parse the date tags of all images that don't have any entries in the date_tags table yet.
+        :return:
+        """
+        read_cur = self.con.cursor()
+        read_cur.execute("SELECT key, metadata FROM images "
+                         "WHERE key NOT IN (SELECT image_key FROM date_tags) ORDER BY key")
 
         count = 0
-        last = 1
+        rows = read_cur.fetchmany(1000)
+        while len(rows) > 0:
+            for key, metadata in rows:
+                self.__insert_date_tags(image_key=key,
+                                        date_tags=parse_date_tags(self.__json_to_dict(metadata), ignore_errors=True))
 
-        while result is not None:
-            # increment index
-            index += 1
+            count += len(rows)
+            print(f"Parsed date tags of {count} images")
+            rows = read_cur.fetchmany(1000)
 
-            if self.create_img_thumbnail(key=result[0]):
-                count += 1
-            elif self.create_vid_thumbnail(key=result[0]):
+        self.con.commit()
+
+    def fill_fingerprints(self):
+        """
+        Compute the fingerprints of all images that don't have an entry in the fingerprints table yet. Reads at most
+        128 KiB of every file.
+        :return:
+        """
+        read_cur = self.con.cursor()
+        read_cur.execute("SELECT key, new_name, datetime FROM images "
+                         "WHERE key NOT IN (SELECT image_key FROM fingerprints) ORDER BY key")
+
+        count = 0
+        rows = read_cur.fetchmany(1000)
+        while len(rows) > 0:
+            for key, new_name, dt_str in rows:
+                try:
+                    file_size, partial_hash = fingerprint_file(
+                        self.path_from_datetime(self.__db_str_to_datetime(dt_str), new_name))
+                except FileNotFoundError:
+                    print(f"File {new_name} not found. Skipping.")
+                    continue
+
+                self.cur.execute("INSERT INTO fingerprints (image_key, file_size, partial_hash) VALUES (?, ?, ?)",
+                                 (key, file_size, partial_hash))
+
+            count += len(rows)
+            print(f"Fingerprinted {count} images")
+            rows = read_cur.fetchmany(1000)
+
+        self.con.commit()
+
+    def get_date_tags(self, key: int) -> List[Tuple[str, datetime.datetime, str]]:
+        """
+        Get all date tags of an image that parsed.
+
+        :param key: key of the image
+        :return: list of (tag, datetime, raw string) sorted by datetime
+        """
+        self.cur.execute("SELECT tag, datetime, raw FROM date_tags WHERE image_key = ? ORDER BY datetime, key",
+                         (key,))
+        return [(row[0], self.__db_str_to_datetime(row[1]), row[2]) for row in self.cur.fetchall()]
+
+    def get_date_tag(self, key: int, tag: str) -> Union[datetime.datetime, None]:
+        """
+        Get the datetime of a single date tag of an image.
+
+        :param key: key of the image
+        :param tag: name of the tag
+        :return: the datetime or None if the image doesn't have the tag
+        """
+        self.cur.execute("SELECT datetime FROM date_tags WHERE image_key = ? AND tag = ?", (key, tag))
+        res = self.cur.fetchone()
+
+        if res is None:
+            return None
+
+        return self.__db_str_to_datetime(res[0])
+
+    def find_date_tag_mismatches(self, tag: str) -> List[Tuple[int, datetime.datetime]]:
+        """
+        Find all images whose datetime differs from the datetime of the given tag.
+
+        :param tag: name of the tag, e.g. EXIF:DateTimeOriginal
+        :return: list of (key, datetime of the tag)
+        """
+        self.cur.execute("SELECT images.key, date_tags.datetime FROM images "
+                         "JOIN date_tags ON date_tags.image_key = images.key "
+                         "WHERE date_tags.tag = ? AND date_tags.datetime != images.datetime "
+                         "ORDER BY images.key", (tag,))
+        return [(row[0], self.__db_str_to_datetime(row[1])) for row in self.cur.fetchall()]
+
+    def rename_to_tag(self, tag: str):
+        """
+        Rename all images whose datetime differs from the datetime of the given tag to the datetime of the tag.
+
+        :param tag: name of the tag, e.g. EXIF:DateTimeOriginal
+        :return:
+        """
+        mismatches = self.find_date_tag_mismatches(tag)
+
+        for key, new_datetime in mismatches:
+            entry = self.gui_get_image(key=key)
+            self.rename_file(entry=entry, new_datetime=new_datetime, naming_tag=tag)
+
+        self.con.commit()
+        print(f"Renamed {len(mismatches)} images to {tag}")
+
+    def thumbnail_creation(self, procs: int = None, video_threads: int = 4, page_size: int = 1000,
+                           max_pixel: int = 512):
+        """
+        Create the missing thumbnails of all images and videos. The keys are read in pages, the images are scaled by
+        a pool of worker processes and the videos by a pool of threads each running one ffmpeg subprocess at a time.
+        Existing thumbnails are skipped by a single listing of the thumbnail directory. The difference hashes are
+        stored by this process as the thumbnails finish.
+
+        :param procs: number of worker processes for the images, default all cores
+        :param video_threads: number of concurrent ffmpeg subprocesses for the videos
+        :param page_size: number of keys read from the database at once
+        :param max_pixel: size of the larger side of the image thumbnails
+        :return:
+        """
+        procs = procs if procs is not None else os.cpu_count() or 1
+        existing = set(os.listdir(self.thumbnail_dir))
+        max_in_flight = 2 * (procs + video_threads)
+
+        in_flight = {}
+        count = 0
+        failed = 0
+        entries = 0
+        start = time.time()
+
+        def collect(return_when: str):
+            nonlocal count, failed
+
+            finished, _ = wait(list(in_flight.keys()), return_when=return_when)
+            for future in finished:
+                key = in_flight.pop(future)
+
+                try:
+                    value = future.result()
+                except Exception as e:
+                    print(f"Failed to create thumbnail of {key}: {e}")
+                    value = None
+
+                if value is None:
+                    failed += 1
+                    continue
+
+                self.__store_dhash(key=key, value=value)
                 count += 1
 
-            # fetch next new_name
-            self.cur.execute(f"SELECT key FROM images WHERE key >= {index}")
-            result = self.cur.fetchone()
+                if count % 100 == 0:
+                    print(f"Created {count} thumbnails, {count / (time.time() - start):.1f} per second")
+
+        with ProcessPoolExecutor(max_workers=procs) as img_pool, \
+                ThreadPoolExecutor(max_workers=video_threads) as vid_pool:
+            last_key = -1
+            while True:
+                self.cur.execute("SELECT key, new_name, datetime FROM images WHERE key > ? ORDER BY key LIMIT ?",
+                                 (last_key, page_size))
+                rows = self.cur.fetchall()
+
+                if len(rows) == 0:
+                    break
+
+                last_key = rows[-1][0]
+                entries += len(rows)
+
+                for key, new_name, dt_str in rows:
+                    ext = os.path.splitext(new_name)[1]
+                    src = self.path_from_datetime(self.__db_str_to_datetime(dt_str), new_name)
+
+                    if ext in image_extensions:
+                        if f"thumb_{key}{ext}" in existing:
+                            continue
+                        future = img_pool.submit(image_thumbnail, src, self.thumbnail_name(ext=ext, key=key),
+                                                 max_pixel)
+
+                    # videos have a jpg thumbnail
+                    elif ext in video_extensions:
+                        if f"thumb_{key}.jpg" in existing:
+                            continue
+                        future = vid_pool.submit(video_thumbnail, src, self.thumbnail_name(ext=".jpg", key=key))
+
+                    else:
+                        continue
+
+                    in_flight[future] = key
 
-            if count > last and count % 100 == 0:
-                last = count
-                print(f"Created {count} thumbnails")
+                    # backpressure, don't queue more than the pools can work on
+                    if len(in_flight) >= max_in_flight:
+                        collect(FIRST_COMPLETED)
+
+                self.con.commit()
+
+            collect(ALL_COMPLETED)
 
         self.con.commit()
-        print(f"Created {count} thumbnails for {index} entries")
+        elapsed = time.time() - start
+        print(f"Created {count} thumbnails for {entries} entries in {elapsed:.1f}s, "
+              f"{count / max(elapsed, 1e-9):.1f} per second, {failed} failed")
 
     # TODO what happens if one file is not in images table but in trash or sth.
+    def __stored_fingerprints_differ(self, a_key: int, b_key: int) -> bool:
+        """
+        Compare the fingerprints and full hashes stored for two images. Missing values are considered matching.
+
+        :param a_key: key of the first image
+        :param b_key: key of the second image
+        :return: True if the files are known to differ
+        """
+        self.cur.execute("SELECT images.key, images.file_hash, fingerprints.file_size, fingerprints.partial_hash "
+                         "FROM images LEFT JOIN fingerprints ON fingerprints.image_key = images.key "
+                         "WHERE images.key IN (?, ?)", (a_key, b_key))
+        rows = self.cur.fetchall()
+        if len(rows) != 2:
+            return False
+
+        for a, b in zip(rows[0][1:], rows[1][1:]):
+            if a is not None and b is not None and a != b:
+                return True
+
+        return False
+
     def compare_files(self, a_key: int, b_key: int) -> Tuple[Union[bool, None], str]:
         """
         Given two keys, performs binary comparison of the two files.
@@ -1574,7 +2696,11 @@ class PhotoDb:
         path_a = self.path_from_datetime(self.__db_str_to_datetime(res_a[0][1]), res_a[0][0])
         path_b = self.path_from_datetime(self.__db_str_to_datetime(res_b[0][1]), res_b[0][0])
 
-        success = filecmp.cmp(path_a, path_b, shallow=False)
+        # only read the files if the stored fingerprints and hashes don't differ already
+        if self.__stored_fingerprints_differ(a_key, b_key):
+            success = False
+        else:
+            success = filecmp.cmp(path_a, path_b, shallow=False)
         msg = f"'{res_a[0][0]}' is{'' if success else ' FUCKING NOT'} identical to '{res_b[0][0]}'"
 
         return success, msg
@@ -1585,20 +2711,10 @@ class PhotoDb:
 
         :return:
         """
-        subdirs = os.listdir(self.root_dir)
         not_to_index = (".thumbnails", ".trash", ".thumbnailsold", ".temp_thumbnails", "backup.photos.db", "backup2(before orignal_google_metadata).photos.db", ".photos.db")
-        files = []
         errors = []
 
-        for n in not_to_index:
-            try:
-                subdirs.remove(n)
-            except ValueError:
-                pass
-
-        for subdir in subdirs:
-            path = os.path.join(self.root_dir, subdir)
-            files.extend(rec_list_all(path))
+        files = rec_list_all(self.root_dir, skip=not_to_index)
 
         for file in files:
             if self.file_name_to_key(os.path.basename(file)) == -1:
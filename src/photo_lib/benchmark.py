@@ -0,0 +1,272 @@
+"""
+Benchmarks of the performance critical parts of the library.
+
+Usage: python -m photo_lib.benchmark <benchmark> [arguments]
+"""
+import base64
+import hashlib
+import json
+import os
+import sqlite3
+import sys
+import time
+import zlib
+
+from . import old_parsers
+from . import metadataagregator
+from .utils import walk_files, decode_metadata
+from . import similarity
+import numpy as np
+import cv2
+
+
+def benchmark_metadata_format(db_path: str, limit: int = 10000):
+    """
+    Compare the size and the decode time of the metadata column of the images table, stored as base64 encoded json
+    (before database version 2), as plain json (current format) and as zlib compressed json for reference.
+
+    :param db_path: path to a .photos.db
+    :param limit: maximum number of rows to use
+    :return:
+    """
+    con = sqlite3.connect(db_path)
+    cur = con.cursor()
+    cur.execute(f"SELECT metadata FROM images LIMIT {int(limit)}")
+    dicts = [d for d in (decode_metadata(row[0]) for row in cur.fetchall()) if d is not None]
+    con.close()
+
+    if len(dicts) == 0:
+        print("No images in database")
+        return
+
+    json_strs = [json.dumps(d) for d in dicts]
+    formats = {
+        "base64 json": ([base64.b64encode(j.encode("utf-8")).decode("ascii") for j in json_strs],
+                        lambda v: json.loads(base64.b64decode(v.encode("ascii")).decode("utf-8"))),
+        "json": (json_strs, json.loads),
+        "zlib json": ([zlib.compress(j.encode("utf-8")) for j in json_strs],
+                      lambda v: json.loads(zlib.decompress(v).decode("utf-8")))
+    }
+
+    print(f"Metadata of {len(dicts)} images")
+    print(f"{'format':<12} {'size [MB]':>10} {'decode [ms]':>12} {'per row [us]':>13}")
+    for name, (values, decode) in formats.items():
+        size = sum(len(v) for v in values)
+
+        start = time.perf_counter()
+        for v in values:
+            decode(v)
+        elapsed = time.perf_counter() - start
+
+        print(f"{name:<12} {size / 1e6:>10.2f} {elapsed * 1e3:>12.1f} {elapsed / len(values) * 1e6:>13.1f}")
+
+
+def benchmark_date_parser(db_path: str, limit: int = 10000):
+    """
+    Compare the strptime cascade (old_parsers.general_parser) with the precompiled general_parser on all date
+    strings found in the metadata of the images table. Verifies both return the same results.
+
+    :param db_path: path to a .photos.db
+    :param limit: maximum number of rows to use
+    :return:
+    """
+    con = sqlite3.connect(db_path)
+    cur = con.cursor()
+    cur.execute(f"SELECT metadata FROM images LIMIT {int(limit)}")
+    dt_strs = []
+    for row in cur.fetchall():
+        for key, value in (decode_metadata(row[0]) or {}).items():
+            if type(value) is str and ("Date" in key or "Time" in key):
+                dt_strs.append(value)
+    con.close()
+
+    if len(dt_strs) == 0:
+        print("No date strings in database")
+        return
+
+    def parse_all(parser):
+        results = []
+        for dt_str in dt_strs:
+            try:
+                results.append(parser(dt_str))
+            except ValueError:
+                results.append(ValueError)
+        return results
+
+    print(f"{len(dt_strs)} date strings, {len(set(dt_strs))} distinct")
+
+    start = time.perf_counter()
+    old_results = parse_all(old_parsers.general_parser)
+    old_time = time.perf_counter() - start
+
+    metadataagregator.parse_format.cache_clear()
+    start = time.perf_counter()
+    new_results = parse_all(metadataagregator.general_parser)
+    new_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    parse_all(metadataagregator.general_parser)
+    cached_time = time.perf_counter() - start
+
+    mismatches = sum(1 for a, b in zip(old_results, new_results) if a != b)
+
+    print(f"{'parser':<12} {'total [ms]':>11} {'per string [us]':>16} {'speedup':>8}")
+    for name, elapsed in (("strptime", old_time), ("compiled", new_time), ("cached", cached_time)):
+        print(f"{name:<12} {elapsed * 1e3:>11.1f} {elapsed / len(dt_strs) * 1e6:>16.2f} "
+              f"{old_time / elapsed:>8.1f}")
+    print(f"Mismatches: {mismatches}")
+
+
+def _hash_file_4k(path: str):
+    """
+    hash_file before the engines, reading 4K blocks.
+    """
+    sha256_hash = hashlib.sha256()
+    with open(path, "rb") as f:
+        for byte_block in iter(lambda: f.read(4096), b""):
+            sha256_hash.update(byte_block)
+    return sha256_hash.hexdigest()
+
+
+def benchmark_hash(folder: str, repeat: int = 3):
+    """
+    Compare the throughput of the engines of hash_file (and the former 4K block loop) on all files in a folder, e.g.
+    a mix of images and videos. Verifies all engines produce the same digests. The files are read once before, so
+    all engines run with the same (warm) page cache.
+
+    :param folder: folder with the files to hash
+    :param repeat: number of times every engine hashes all files, the best run is reported
+    :return:
+    """
+    paths = [os.path.join(dirpath, name) for dirpath, name, _, _ in walk_files(folder)]
+    total_size = sum(os.path.getsize(p) for p in paths)
+
+    if total_size == 0:
+        print("No data to hash")
+        return
+
+    reference = [_hash_file_4k(p) for p in paths]
+    engines = {"4k blocks": _hash_file_4k}
+    for engine in metadataagregator.hash_engines:
+        if engine == "file_digest" and not hasattr(hashlib, "file_digest"):
+            continue
+        engines[engine] = lambda p, e=engine: metadataagregator.hash_file(p, engine=e)
+
+    print(f"{len(paths)} files, {total_size / 1e6:.1f} MB")
+    print(f"{'engine':<12} {'best [s]':>9} {'MB/s':>9} {'identical':>10}")
+    for name, func in engines.items():
+        best = None
+        digests = None
+        for _ in range(int(repeat)):
+            start = time.perf_counter()
+            digests = [func(p) for p in paths]
+            elapsed = time.perf_counter() - start
+            best = elapsed if best is None else min(best, elapsed)
+
+        print(f"{name:<12} {best:>9.3f} {total_size / 1e6 / best:>9.1f} {str(digests == reference):>10}")
+
+
+def benchmark_pairwise(n: int = 1000, size: int = 64, threshold: float = 200.0):
+    """
+    Compare the blockwise all pairs mean squared error of similarity.pairwise_mse with comparing every pair on its
+    own like difPy does, on n random images of size x size grey values. The per pair loop is timed on the first 200
+    images and extrapolated.
+
+    :param n: number of images
+    :param size: width and height of the images
+    :param threshold: maximum mean squared error of a match
+    :return:
+    """
+    n, size, threshold = int(n), int(size), float(threshold)
+    rng = np.random.default_rng(0)
+    vectors = (rng.random((n, size * size)) * 255).astype(np.float32)
+
+    # plant some near duplicates
+    vectors[n // 2:n // 2 + n // 10] = vectors[:n // 10] + rng.normal(0, 5, (n // 10, size * size))
+
+    sample = min(n, 200)
+    start = time.perf_counter()
+    loop_pairs = []
+    for i in range(sample):
+        for j in range(i + 1, sample):
+            mse = float(np.mean((vectors[i] - vectors[j]) ** 2))
+            if mse <= threshold:
+                loop_pairs.append((i, j))
+    loop_time = (time.perf_counter() - start) * (n * (n - 1)) / (sample * (sample - 1))
+
+    start = time.perf_counter()
+    pairs = similarity.pairwise_mse(vectors, threshold=threshold)
+    block_time = time.perf_counter() - start
+
+    block_sample = sorted((a, b) for a, b, _ in pairs if b < sample)
+
+    print(f"{n} images of {size}x{size}, {n * (n - 1) // 2} pairs, {len(pairs)} matches")
+    print(f"{'engine':<12} {'total [s]':>10} {'speedup':>8}")
+    print(f"{'per pair':<12} {loop_time:>10.2f} {1.0:>8.1f}")
+    print(f"{'blockwise':<12} {block_time:>10.2f} {loop_time / block_time:>8.1f}")
+    print(f"Identical matches on the sample: {block_sample == loop_pairs}")
+
+
+def benchmark_decode(folder: str, max_pixel: int = 512, repeat: int = 3):
+    """
+    Compare decoding the jpgs of a folder at full resolution with the reduced decoding of similarity.imread_reduced,
+    both followed by the resize to a thumbnail of max_pixel. The size of the decoded array is the dominating part of
+    the peak memory per image.
+
+    :param folder: folder with jpgs
+    :param max_pixel: size of the larger side of the thumbnail
+    :param repeat: number of times every jpg is decoded, the best run is reported
+    :return:
+    """
+    max_pixel = int(max_pixel)
+    paths = [os.path.join(dirpath, name) for dirpath, name, _, _ in walk_files(folder)
+             if os.path.splitext(name)[1].lower() in (".jpg", ".jpeg")]
+
+    if len(paths) == 0:
+        print("No jpgs to decode")
+        return
+
+    def thumbnail(img):
+        scale = max_pixel / max(img.shape[0], img.shape[1])
+        return cv2.resize(img, dsize=(int(img.shape[1] * scale), int(img.shape[0] * scale)))
+
+    engines = {
+        "full": lambda p: cv2.imread(p, cv2.IMREAD_COLOR),
+        "reduced": lambda p: similarity.imread_reduced(p, min_pixel=max_pixel),
+    }
+
+    print(f"{len(paths)} jpgs, thumbnails of {max_pixel} pixels")
+    print(f"{'decode':<8} {'best [s]':>9} {'per image [ms]':>15} {'max array [MB]':>15} {'speedup':>8}")
+    reference = None
+    for name, decode in engines.items():
+        best = None
+        max_bytes = 0
+        for _ in range(int(repeat)):
+            start = time.perf_counter()
+            for p in paths:
+                img = decode(p)
+                max_bytes = max(max_bytes, img.nbytes)
+                thumbnail(img)
+            elapsed = time.perf_counter() - start
+            best = elapsed if best is None else min(best, elapsed)
+
+        reference = best if reference is None else reference
+        print(f"{name:<8} {best:>9.3f} {best / len(paths) * 1e3:>15.1f} {max_bytes / 1e6:>15.1f} "
+              f"{reference / best:>8.1f}")
+
+
+benchmarks = {
+    "metadata_format": benchmark_metadata_format,
+    "date_parser": benchmark_date_parser,
+    "hash": benchmark_hash,
+    "pairwise": benchmark_pairwise,
+    "decode": benchmark_decode,
+}
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2 or sys.argv[1] not in benchmarks:
+        print(f"Usage: python -m photo_lib.benchmark <{'|'.join(benchmarks.keys())}> [arguments]")
+        exit(1)
+
+    benchmarks[sys.argv[1]](*sys.argv[2:])
@@ -2,21 +2,36 @@ import os.path
 import warnings
 
 from PyQt6.QtWidgets import QLabel, QPushButton
-from PyQt6.QtGui import QPixmap, QIcon
-from PyQt6.QtCore import Qt
+from PyQt6.QtGui import QPixmap, QIcon, QImage
+from PyQt6.QtCore import Qt, pyqtSignal
+from photo_lib.PhotoDatabase import PhotoDb
+from photo_lib.gui.media_loader import MediaLoader
+from photo_lib.gui.image_cache import cache_of, thumbnail_size, full_size
 from typing import Union
 
 class ClickableImage(QPushButton):
+    """
+    Button showing a preview of a file. The preview is the thumbnail if one is given, the full file is only decoded
+    without a thumbnail. fpath is the path of the file itself, e.g. to open it in full view on click.
+
+    With a MediaLoader the preview is decoded in the background, a placeholder is shown until loaded is emitted.
+    Given the key of the image, previews are shared through the image caches, see cache_of. Given its database and
+    new_name as well, a missing thumbnail is created by the MediaLoader.
+    """
     img_lbl: QLabel
     pixmap: Union[QPixmap, None]
     fpath: str
+    preview_path: str
     width_div_height: float = 1.0
     count: int = 0
 
-    def __init__(self, file_path: str):
+    loaded = pyqtSignal()
+
+    def __init__(self, file_path: str, thumbnail_path: str = None, loader: MediaLoader = None, key: int = None,
+                 pdb: PhotoDb = None, new_name: str = None):
         super().__init__()
         self.pixmap = None
-        self.load_image(file_path)
+        self.load_image(file_path, thumbnail_path, loader, key, pdb, new_name)
 
         # self.setPixmap(self.pixmap.scaled(self.size(), aspectRatioMode=Qt.AspectRatioMode.KeepAspectRatio))
         # self.media.setScaledContents(True) # Will scale the widget, undoing the keep aspect ratio.
@@ -29,10 +44,71 @@ class ClickableImage(QPushButton):
         # self.setPixmap(self.pixmap.scaled(self.size(), aspectRatioMode=Qt.AspectRatioMode.KeepAspectRatio))
         # self.media.setScaledContents(True)
 
-    def load_image(self, file_path: str):
+    def load_image(self, file_path: str, thumbnail_path: str = None, loader: MediaLoader = None, key: int = None,
+                   pdb: PhotoDb = None, new_name: str = None):
+        """
+        Show the preview of a file.
+
+        :param file_path: path of the file
+        :param thumbnail_path: path of its thumbnail, the file itself is decoded if None
+        :param loader: decode the preview in the background, synchronously if None
+        :param key: key of the image in the database, used for the image caches, not cached if None
+        :param pdb: database of the image, with loader, key and new_name the loader creates a missing thumbnail
+        :param new_name: new_name of the image
+        :return:
+        """
         self.fpath = file_path
-        self.pixmap = QPixmap(file_path)
-        if os.path.splitext(file_path)[1] not in [".png", ".jpg", ".jpeg", ".gif"]:
+        self.preview_path = thumbnail_path if thumbnail_path is not None else file_path
+        self.setStyleSheet("border: none;")
+
+        create_thumbnail = thumbnail_path is None and loader is not None and key is not None \
+            and pdb is not None and new_name is not None
+
+        cache_key = None
+        if key is not None:
+            cache_key = (key, thumbnail_size if thumbnail_path is not None or create_thumbnail else full_size)
+            image = cache_of(cache_key).get(cache_key)
+
+            if image is not None:
+                self.set_image(image)
+                return
+
+        if loader is None:
+            image = QImage(self.preview_path)
+            if cache_key is not None:
+                cache_of(cache_key).put(cache_key, image)
+            self.set_image(image)
+            return
+
+        self.pixmap = None
+        self.setIcon(QIcon())
+        self.setText("Loading...")
+        if create_thumbnail:
+            loader.load_thumbnail(pdb, key, new_name, file_path, self.set_preview, receiver=self)
+        else:
+            loader.load(self.preview_path, self.set_image, receiver=self, cache_key=cache_key)
+
+    def set_preview(self, image: QImage, path: str):
+        """
+        Show a preview decoded by the loader, the thumbnail or the file itself if no thumbnail could be created.
+
+        :param image: the decoded preview
+        :param path: path it was decoded from
+        :return:
+        """
+        self.preview_path = path
+        self.set_image(image)
+
+    def set_image(self, image: QImage):
+        """
+        Show the decoded preview.
+
+        :param image: the decoded preview
+        :return:
+        """
+        self.setText("")
+        self.pixmap = QPixmap.fromImage(image)
+        if os.path.splitext(self.preview_path)[1] not in [".png", ".jpg", ".jpeg", ".gif"]:
             warnings.warn("File must be an image.")
         else:
             try:
@@ -41,4 +117,4 @@ class ClickableImage(QPushButton):
                 self.width_div_height = 1.0
         self.setIcon(QIcon(self.pixmap))
         self.setIconSize(self.size())
-        self.setStyleSheet("border: none;")
\ No newline at end of file
+        self.loaded.emit()
@@ -4,9 +4,11 @@ from PyQt6.QtCore import Qt
 from photo_lib.gui.model import Model, NoDbException
 from photo_lib.gui.media_pane import MediaPane
 from photo_lib.gui.text_scroll_area import TextScroller
+from photo_lib.gui.metadata_view import MetadataView
 from photo_lib.gui.button_bar import ButtonBar
+from photo_lib.gui.media_loader import MediaLoader
 
-from typing import Callable, List
+from typing import Callable, List, Union
 import warnings
 
 
@@ -76,6 +78,9 @@ class CompareRoot(QLabel):
 
     message_label: QLabel = None
 
+    # decodes the pictures of the panes in the background
+    media_loader: MediaLoader
+
     def __init__(self, model: Model, open_image_fn: Callable, open_datetime_modal_fn: Callable):
         """
         This widget is the root widget for the compare view. It holds all the MediaPanes and the buttons to control them.
@@ -88,6 +93,7 @@ class CompareRoot(QLabel):
         self.open_datetime_modal_fn = open_datetime_modal_fn
         self.model = model
         self.media_panes = []
+        self.media_loader = MediaLoader()
 
         # Instantiating the widgets
         self.media_panes_placeholder = QLabel()
@@ -239,7 +245,8 @@ class CompareRoot(QLabel):
         for dbe in self.model.files:
             pane = MediaPane(self.model, dbe, self.synchronized_scroll,
                              move_right=self.move_right,
-                             move_left=self.move_left)
+                             move_left=self.move_left,
+                             loader=self.media_loader)
             self.media_panes.append(pane)
             self.media_layout.addWidget(pane)
 
@@ -248,7 +255,7 @@ class CompareRoot(QLabel):
             pane.main_button.clicked.connect(button_wrapper(pane.main_button, self.button_state))
             pane.remove_media_button.clicked.connect(pain_wrapper(pane, self.remove_media_pane))
             self.max_needed_width += pane.max_needed_width + 10  # TODO Better formula
-            pane.media.clicked.connect(lambda: self.open_image_fn(pane.media.fpath))
+            pane.media.clicked.connect(lambda _=False, p=pane: self.open_image_fn(p.media.fpath, p.dbe.key))
             pane.change_tag_button.clicked.connect(lambda: self.open_datetime_modal_fn(pane))
 
             # Add functions for the adding and removing of the target.
@@ -272,6 +279,9 @@ class CompareRoot(QLabel):
 
         :return:
         """
+        # pictures of the cluster that weren't decoded yet aren't needed anymore
+        self.media_loader.cancel()
+
         for element in self.media_panes:
             self.media_layout.removeWidget(element)
             element.deleteLater()
@@ -306,13 +316,13 @@ class CompareRoot(QLabel):
         # is not. The key is already removed from the table in the database but the gui still has it. This would
         # lead to an error in the compare files function.
 
-    def synchronized_scroll(self, name: str, caller: TextScroller, rx: float, ry: float):
+    def synchronized_scroll(self, name: str, caller: Union[TextScroller, MetadataView], rx: float, ry: float):
         """
         Iterate over all Media panes in the compare view and set the scroll amount to the same relative value indicated
         by rx and ry.
 
-        The TextScrollers that are going to be affected are indicated by the name argument which specifies the
-        attribute name of the TextScroller.
+        The TextScrollers (or the MetadataViews) that are going to be affected are indicated by the name argument which
+        specifies the attribute name of the TextScroller.
 
         The caller is needed to prevent a recursive self call with no termination.
 
@@ -524,10 +534,14 @@ class CompareRoot(QLabel):
         else:
             fsize_bg = f"background: rgb(255, 200, 200);"
 
+        # highlight the tags that differ between the files
+        differing = self.model.differing_tags([pane.dbe.metadata for pane in self.media_panes])
+
         for pane in self.media_panes:
             pane.original_name_lbl.setStyleSheet(name_bg)
             pane.new_name_lbl.setStyleSheet(dt_bg)
             pane.file_size_lbl.setStyleSheet(fsize_bg)
+            pane.metadata_lbl.table_model.set_differing(differing)
 
     def set_target(self, target: MediaPane):
         """
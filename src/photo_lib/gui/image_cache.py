@@ -0,0 +1,144 @@
+import os
+import threading
+import warnings
+from collections import OrderedDict
+from typing import Hashable, Union, Tuple
+
+from PyQt6.QtGui import QImage
+
+
+# target sizes of the cache keys, the larger side of the thumbnails and the original resolution
+thumbnail_size: int = 512
+full_size: int = 0
+
+
+class ImageCache:
+    """
+    Process wide LRU cache of decoded images, keyed by (image key, target size). The least recently used images are
+    evicted once the decoded size exceeds max_bytes. Stores QImages since unlike QPixmaps they may be created in
+    other threads, e.g. by the MediaLoader or the prefetching of the Model.
+
+    The budget covers the cached QImages only. Every widget showing an image holds a QPixmap copy of it on top, so
+    the memory in use can be up to twice the budget.
+    """
+    name: str
+    max_bytes: int
+    size_bytes: int = 0
+    hits: int = 0
+    misses: int = 0
+
+    __images: OrderedDict
+    __lock: threading.Lock
+
+    def __init__(self, max_bytes: int = 512 * 2 ** 20, name: str = "Image cache"):
+        """
+        :param max_bytes: budget of the decoded images
+        :param name: shown in the status
+        """
+        self.name = name
+        self.max_bytes = max_bytes
+        self.__images = OrderedDict()
+        self.__lock = threading.Lock()
+
+    def __contains__(self, key: Hashable) -> bool:
+        with self.__lock:
+            return key in self.__images
+
+    def __len__(self) -> int:
+        return len(self.__images)
+
+    def get(self, key: Hashable) -> Union[QImage, None]:
+        """
+        Look up an image, counting a hit or a miss.
+
+        :param key: (image key, target size)
+        :return: the image or None
+        """
+        with self.__lock:
+            image = self.__images.get(key)
+
+            if image is None:
+                self.misses += 1
+                return None
+
+            self.hits += 1
+            self.__images.move_to_end(key)
+            return image
+
+    def put(self, key: Hashable, image: QImage):
+        """
+        Add an image and evict the least recently used ones until the cache fits its budget. Null images and images
+        larger than the budget aren't cached.
+
+        :param key: (image key, target size)
+        :param image: decoded image
+        :return:
+        """
+        size = image.sizeInBytes()
+        if image.isNull() or size > self.max_bytes:
+            return
+
+        with self.__lock:
+            old = self.__images.pop(key, None)
+            if old is not None:
+                self.size_bytes -= old.sizeInBytes()
+
+            self.__images[key] = image
+            self.size_bytes += size
+
+            while self.size_bytes > self.max_bytes:
+                _, evicted = self.__images.popitem(last=False)
+                self.size_bytes -= evicted.sizeInBytes()
+
+    def clear(self):
+        with self.__lock:
+            self.__images.clear()
+            self.size_bytes = 0
+
+    def status(self) -> str:
+        """
+        Hits, misses and memory use for the status bar.
+        """
+        return f"{self.name}: {self.hits} hits, {self.misses} misses, " \
+               f"{self.size_bytes / 2 ** 20:.0f} / {self.max_bytes / 2 ** 20:.0f} MB"
+
+
+def budget_from_env(variable: str, default_mb: int) -> int:
+    """
+    Budget of a cache in bytes, set in MB by an environment variable, e.g. PHOTO_LIB_THUMBNAIL_CACHE_MB=1024.
+
+    :param variable: name of the environment variable
+    :param default_mb: budget if the variable isn't set or isn't a non-negative number
+    :return:
+    """
+    value = os.environ.get(variable)
+    if value is None:
+        return default_mb * 2 ** 20
+
+    try:
+        mb = float(value)
+    except ValueError:
+        mb = -1
+
+    if mb < 0:
+        warnings.warn(f"Ignoring {variable}={value}, expected a size in MB. Using {default_mb} MB")
+        mb = default_mb
+
+    return int(mb * 2 ** 20)
+
+
+# The thumbnails and the originals have separate budgets, a 40 MP original takes 160 MB decoded. Sharing one budget,
+# a few clicks on the full view would evict all thumbnails the prefetching and the MediaLoader decoded.
+# The budgets are read once at import, set the variables before starting the gui. 0 disables a cache.
+image_cache = ImageCache(max_bytes=budget_from_env("PHOTO_LIB_THUMBNAIL_CACHE_MB", 512), name="Thumbnail cache")
+full_image_cache = ImageCache(max_bytes=budget_from_env("PHOTO_LIB_FULL_CACHE_MB", 384), name="Full size cache")
+
+
+def cache_of(cache_key: Tuple[int, int]) -> ImageCache:
+    """
+    The cache an image belongs to by its target size.
+
+    :param cache_key: (image key, target size)
+    :return: full_image_cache for the originals, image_cache otherwise
+    """
+    return full_image_cache if cache_key[1] == full_size else image_cache
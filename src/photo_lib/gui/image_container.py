@@ -1,6 +1,7 @@
 from PyQt6.QtWidgets import QLabel, QSizePolicy, QPushButton, QVBoxLayout
-from PyQt6.QtGui import QPixmap
+from PyQt6.QtGui import QPixmap, QImage
 from PyQt6.QtCore import Qt
+from photo_lib.gui.image_cache import full_image_cache, full_size
 
 class ResizingImage(QPushButton):
     img_lbl: QLabel
@@ -8,14 +9,14 @@ class ResizingImage(QPushButton):
     fpath: str
     width_div_height: float
 
-    def __init__(self, file_path: str):
+    def __init__(self, file_path: str, key: int = None):
         super().__init__()
         self.img_lbl = QLabel()
         self.setLayout(QVBoxLayout())
         self.layout().addWidget(self.img_lbl)
         # self.media.setScaledContents(True) # Will scale the widget, undoing the keep aspect ratio.
         self.setSizePolicy(QSizePolicy.Policy.MinimumExpanding, QSizePolicy.Policy.MinimumExpanding)  # Image goes behind other widgets.
-        self.load_image(file_path)
+        self.load_image(file_path, key)
 
     def resizeEvent(self, event):
         super().resizeEvent(event)
@@ -23,8 +24,22 @@ class ResizingImage(QPushButton):
             self.img_lbl.setPixmap(self.pxmap.scaled(self.size(), aspectRatioMode=Qt.AspectRatioMode.KeepAspectRatio))
         # self.media.setScaledContents(True)
 
-    def load_image(self, file_path: str):
+    def load_image(self, file_path: str, key: int = None):
+        """
+        Show a file at full resolution.
+
+        :param file_path: path of the file
+        :param key: key of the image in the database, used for the full_image_cache, not cached if None
+        :return:
+        """
         self.fpath = file_path
-        self.pxmap = QPixmap(file_path)
+
+        image = full_image_cache.get((key, full_size)) if key is not None else None
+        if image is None:
+            image = QImage(file_path)
+            if key is not None:
+                full_image_cache.put((key, full_size), image)
+
+        self.pxmap = QPixmap.fromImage(image)
         self.width_div_height = self.pxmap.width() / self.pxmap.height()
-        self.img_lbl.setPixmap(self.pxmap.scaled(self.size(), aspectRatioMode=Qt.AspectRatioMode.KeepAspectRatio))
\ No newline at end of file
+        self.img_lbl.setPixmap(self.pxmap.scaled(self.size(), aspectRatioMode=Qt.AspectRatioMode.KeepAspectRatio))
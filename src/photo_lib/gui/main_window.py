@@ -1,10 +1,14 @@
-from PyQt6.QtWidgets import QMainWindow, QSizePolicy, QWidget, QStackedLayout, QDialog, QMenu, QProgressDialog
+from PyQt6.QtWidgets import QMainWindow, QSizePolicy, QWidget, QStackedLayout, QDialog, QMenu, QProgressDialog, \
+    QLabel
 from photo_lib.gui.model import Model
 from photo_lib.gui.compare_widget import CompareRoot
 from photo_lib.gui.image_container import ResizingImage
 from photo_lib.gui.modals import DateTimeModal, FolderSelectModal, TaskSelectModal
 from photo_lib.gui.media_pane import MediaPane
+from photo_lib.gui.image_cache import image_cache, full_image_cache
 from PyQt6.QtGui import QAction, QIcon, QKeySequence
+from photo_lib.search_scheduler import DuplicateSearch
+from PyQt6.QtCore import QTimer, Qt
 from typing import Union
 
 
@@ -47,6 +51,11 @@ class RootWindow(QMainWindow):
     search_duplicates_action: QAction
 
     progress_dialog: Union[QProgressDialog, None] = None
+    search: Union[DuplicateSearch, None] = None
+    search_timer: Union[QTimer, None] = None
+
+    cache_status_label: QLabel
+    cache_status_timer: QTimer
 
     def __init__(self):
         super().__init__()
@@ -82,6 +91,13 @@ class RootWindow(QMainWindow):
         # Misc setup of the window
         self.setWindowTitle("Picture Duplicate Manager")
 
+        # Hits and misses of the image caches in the status bar
+        self.cache_status_label = QLabel(self.cache_status())
+        self.statusBar().addPermanentWidget(self.cache_status_label)
+        self.cache_status_timer = QTimer(self)
+        self.cache_status_timer.timeout.connect(lambda: self.cache_status_label.setText(self.cache_status()))
+        self.cache_status_timer.start(1000)
+
         # Open the Folder Select Modal
         self.open_folder_select(init=True)
 
@@ -99,6 +115,13 @@ class RootWindow(QMainWindow):
         file_menu.addAction(self.open_folder_select_action)
         file_menu.addAction(self.search_duplicates_action)
 
+    @staticmethod
+    def cache_status() -> str:
+        """
+        Status of the thumbnail and the full size image cache.
+        """
+        return f"{image_cache.status()} | {full_image_cache.status()}"
+
     def search_duplicates(self):
         """
         Search for duplicates in the currently selected database.
@@ -114,39 +137,79 @@ class RootWindow(QMainWindow):
         # There may not really be another type of return value.
         assert ret_val == 1, f"Unknown return value from TaskSelectModal of {ret_val}"
 
-        success, pipe = self.model.search_duplicates()
+        success, search = self.model.search_duplicates()
 
         if not success:
             print("No success")
             return
 
-        if pipe is None:
-            self.open_compare_root()
-            self.compare_root.load_elements()
-            self.model.search_level = None
+        if search is None:
+            self.search_finished()
+            return
 
-        else:
-            pass
-            # self.progress_dialog = QProgressDialog("Searching for duplicates...", "Cancel", 0, 0, self)
-            # self.progress_dialog.setWindowModality(2)
-            # self.progress_dialog.setCancelButton(None)
-            # self.progress_dialog.show()
-            #
-            # pipe.progress.connect(self.progress_dialog.setValue)
-            # pipe.finished.connect(self.search_finished)
+        self.search = search
+        self.progress_dialog = QProgressDialog("Searching for duplicates...", "Cancel", 0, search.total, self)
+        self.progress_dialog.setWindowModality(Qt.WindowModality.WindowModal)
+        self.progress_dialog.canceled.connect(self.cancel_search)
+        self.progress_dialog.show()
+
+        # The search hands its results to the database in this process, poll it instead of blocking the gui.
+        self.search_timer = QTimer(self)
+        self.search_timer.timeout.connect(self.poll_search)
+        self.search_timer.start(100)
+
+    def poll_search(self):
+        """
+        Collect the finished groups of the running search and update the progress dialog.
+        :return:
+        """
+        running = self.search.poll()
+        self.progress_dialog.setValue(self.search.done)
+
+        if not running:
+            # closing the dialog emits canceled, so the search is reset first
+            self.search_timer.stop()
+            self.search = None
+            self.progress_dialog.close()
+            self.search_finished()
+
+    def cancel_search(self):
+        """
+        Cancel the running search. The groups found so far remain in the duplicates table, searches which write
+        their clusters at the end (phash, window) leave it empty.
+        :return:
+        """
+        if self.search is None:
+            return
+
+        self.search_timer.stop()
+        self.search.cancel()
+        self.search = None
+        self.search_finished()
+        self.statusBar().showMessage("Search cancelled, the duplicates found are incomplete.", 10000)
+
+    def search_finished(self):
+        """
+        Show the results of the duplicate search.
+        :return:
+        """
+        self.open_compare_root()
+        self.compare_root.load_elements()
+        self.model.search_level = None
 
-    def open_image(self, path: str):
+    def open_image(self, path: str, key: int = None):
         """
         Open an image in full screen mode.
         :param path: path to the image
+        :param key: key of the image in the database, used for the full_image_cache
         :return:
         """
         if self.full_screen_image is None:
-            self.full_screen_image = ResizingImage(path)
+            self.full_screen_image = ResizingImage(path, key)
             self.full_screen_image.clicked.connect(self.open_compare_root)
             self.stacked_layout.addWidget(self.full_screen_image)
         else:
-            self.full_screen_image.load_image(path)
+            self.full_screen_image.load_image(path, key)
 
         self.set_view(self.full_screen_image)
 
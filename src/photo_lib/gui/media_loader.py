@@ -0,0 +1,169 @@
+import threading
+
+from PyQt6.QtCore import QObject, QRunnable, QThreadPool, pyqtSignal, pyqtSlot
+from PyQt6.QtGui import QImage
+from PyQt6 import sip
+from photo_lib.PhotoDatabase import PhotoDb
+from photo_lib.gui.image_cache import cache_of, thumbnail_size, full_size
+from typing import Dict, Callable, Tuple, Union
+
+
+# PhotoDb of every thread of the pool, sqlite connections can't be shared between threads
+_loader_local = threading.local()
+
+
+def _loader_db(root_dir: str, db_path: str) -> PhotoDb:
+    """
+    Connection to the database of the calling thread of the pool, reopened if the database was switched.
+
+    :param root_dir: root of the library
+    :param db_path: path of its database
+    :return:
+    """
+    if getattr(_loader_local, "db", None) != (root_dir, db_path):
+        pdb = getattr(_loader_local, "pdb", None)
+        if pdb is not None:
+            pdb.con.close()
+
+        _loader_local.pdb = PhotoDb(root_dir=root_dir, db_path=db_path)
+        _loader_local.db = (root_dir, db_path)
+
+    return _loader_local.pdb
+
+
+class _LoadSignals(QObject):
+    """
+    Signals of a _LoadTask. QRunnable isn't a QObject, the signals are created in the gui thread so the connected
+    slot runs in the gui thread as well.
+    """
+    loaded = pyqtSignal(int, int, QImage, str)
+
+
+class _LoadTask(QRunnable):
+    """
+    Decodes one image in a thread of the pool. QImage, unlike QPixmap, may be used outside the gui thread.
+
+    Given thumbnail_of, the thumbnail of the image is created first if it is missing, with the connection of the thread
+    since creating it stores its difference hash. The file itself is decoded if no thumbnail can be created.
+    """
+    def __init__(self, loader: "MediaLoader", generation: int, request: int, path: str,
+                 cache_key: Tuple[int, int] = None, thumbnail_of: Tuple[str, str, int, str] = None):
+        super().__init__()
+        self.loader = loader
+        self.generation = generation
+        self.request = request
+        self.path = path
+        self.cache_key = cache_key
+        self.thumbnail_of = thumbnail_of
+        self.signals = _LoadSignals()
+
+    def run(self):
+        # the cluster was skipped while the task was waiting
+        if self.generation != self.loader.generation:
+            return
+
+        path, cache_key = self.path, self.cache_key
+        if self.thumbnail_of is not None:
+            root_dir, db_path, key, new_name = self.thumbnail_of
+            pdb = _loader_db(root_dir, db_path)
+            thumbnail = pdb.thumbnail_path(key=key, new_name=new_name)
+            pdb.con.commit()
+
+            if thumbnail is not None:
+                path, cache_key = thumbnail, (key, thumbnail_size)
+            else:
+                cache_key = (key, full_size)
+
+        image = QImage(path)
+        if cache_key is not None:
+            cache_of(cache_key).put(cache_key, image)
+
+        self.signals.loaded.emit(self.generation, self.request, image, path)
+
+
+class MediaLoader(QObject):
+    """
+    Decodes images in a QThreadPool and hands them back to the gui thread. Every load belongs to the current
+    generation. cancel starts a new generation, the queued loads of the old one are dropped and the results of the
+    running ones are discarded, e.g. when the user skips to the next cluster.
+    """
+    pool: QThreadPool
+    generation: int = 0
+
+    __next_request: int = 0
+    __pending: Dict[int, Tuple[Callable, Union[QObject, None], bool]]
+
+    def __init__(self, max_threads: int = None):
+        """
+        :param max_threads: maximum number of concurrent decodes, default the number of cores
+        """
+        super().__init__()
+        self.pool = QThreadPool()
+        if max_threads is not None:
+            self.pool.setMaxThreadCount(max_threads)
+
+        self.__pending = {}
+
+    def load(self, path: str, callback: Callable[[QImage], None], receiver: QObject = None,
+             cache_key: Tuple[int, int] = None):
+        """
+        Decode an image in the background.
+
+        :param path: path of the image
+        :param callback: called in the gui thread with the decoded image, a null QImage if decoding failed
+        :param receiver: widget the callback belongs to, the callback is dropped if the widget was deleted meanwhile
+        :param cache_key: (image key, target size) to store the decoded image in its cache, see cache_of
+        :return:
+        """
+        self.__start(callback, receiver, False, path, cache_key)
+
+    def load_thumbnail(self, pdb: PhotoDb, key: int, new_name: str, path: str, callback: Callable[[QImage, str], None],
+                       receiver: QObject = None):
+        """
+        Decode the thumbnail of an image in the background, the thumbnail is created in the pool if it doesn't exist
+        yet, so the gui thread doesn't wait for it. The decoded thumbnail is stored in the image_cache, the file itself
+        is decoded into the full_image_cache if no thumbnail can be created.
+
+        :param pdb: database of the image, only its paths are passed to the pool
+        :param key: key of the image
+        :param new_name: new_name of the image
+        :param path: path of the image
+        :param callback: called in the gui thread with the decoded image and the path it was decoded from
+        :param receiver: widget the callback belongs to, the callback is dropped if the widget was deleted meanwhile
+        :return:
+        """
+        self.__start(callback, receiver, True, path, None, (pdb.root_dir, pdb.img_db, key, new_name))
+
+    def __start(self, callback: Callable, receiver: Union[QObject, None], with_path: bool, *args):
+        self.__next_request += 1
+        request = self.__next_request
+
+        self.__pending[request] = (callback, receiver, with_path)
+
+        task = _LoadTask(self, self.generation, request, *args)
+        task.signals.loaded.connect(self.__deliver)
+        self.pool.start(task)
+
+    def cancel(self):
+        """
+        Drop all loads that haven't been delivered yet.
+        :return:
+        """
+        self.generation += 1
+        self.__pending = {}
+        self.pool.clear()
+
+    @pyqtSlot(int, int, QImage, str)
+    def __deliver(self, generation: int, request: int, image: QImage, path: str):
+        if generation != self.generation or request not in self.__pending:
+            return
+
+        callback, receiver, with_path = self.__pending.pop(request)
+
+        if receiver is not None and sip.isdeleted(receiver):
+            return
+
+        if with_path:
+            callback(image, path)
+        else:
+            callback(image)
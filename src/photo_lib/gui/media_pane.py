@@ -5,10 +5,12 @@ from PyQt6.QtCore import Qt, QEvent, QSize
 
 from photo_lib.gui.misc import QSquarePushButton
 from photo_lib.gui.clickable_image import ClickableImage
+from photo_lib.gui.media_loader import MediaLoader
 from photo_lib.gui.text_scroll_area import TextScroller
+from photo_lib.gui.metadata_view import MetadataView
 from photo_lib.gui.model import Model
 from photo_lib.PhotoDatabase import DatabaseEntry, PhotoDb
-from typing import Union, Callable
+from typing import Union, Callable, List
 import os.path
 
 
@@ -47,8 +49,8 @@ class MediaPane(QLabel):
     new_name_lbl: QLabel
     file_size_lbl: QLabel
     file_size: str = ""
-    metadata_lbl: TextScroller
-    metadata: str = ""
+    metadata_lbl: MetadataView
+    metadata_tags: List[str] = None
 
     button_widget: QWidget
     button_layout: QHBoxLayout
@@ -70,7 +72,7 @@ class MediaPane(QLabel):
     remove_callback: Union[None, Callable]
 
     def __init__(self, model: Model, entry: DatabaseEntry, share_scroll: Callable, move_right: Callable,
-                 move_left: Callable):
+                 move_left: Callable, loader: MediaLoader = None):
         super().__init__()
         self.setMinimumHeight(860)
         self.share_scroll = share_scroll
@@ -85,11 +87,16 @@ class MediaPane(QLabel):
         self.setLayout(self.layout)
 
         # prepare the metadata
-        self.metadata, self.file_size = self.model.process_metadata(self.dbe.metadata)
+        self.metadata_tags, self.file_size = self.model.get_processed_metadata(self.dbe)
 
         # Assuming default for the moment and just assuming that we get a picture.
+        # The pane shows the thumbnail, the full file is only decoded in the full view. With a loader, a missing
+        # thumbnail is created in the background instead of blocking the gui thread.
         file_path = self.model.pdb.path_from_datetime(dt_obj=self.dbe.datetime, file_name=self.dbe.new_name)
-        self.media = ClickableImage(file_path=file_path)
+        self.media = ClickableImage(file_path=file_path,
+                                    thumbnail_path=self.model.get_thumbnail_path(self.dbe, create=loader is None),
+                                    loader=loader, key=self.dbe.key, pdb=self.model.pdb, new_name=self.dbe.new_name)
+        self.media.loaded.connect(self.fit_media)
 
         # creating all the necessary labels
         self.original_name_lbl = TextScroller()
@@ -183,15 +190,15 @@ class MediaPane(QLabel):
         self.file_size_lbl.setText(self.file_size)
         self.file_size_lbl.setTextInteractionFlags(Qt.TextInteractionFlag.TextSelectableByMouse)
 
-        self.metadata_lbl = TextScroller()
-        self.metadata_lbl.set_text(self.metadata)
+        # Table that only renders the visible tags
+        self.metadata_lbl = MetadataView()
+        self.metadata_lbl.set_metadata(self.dbe.metadata, self.metadata_tags)
         self.metadata_lbl.setFrameShape(QFrame.Shape.NoFrame)
-        self.metadata_lbl.text_label.setTextInteractionFlags(Qt.TextInteractionFlag.TextSelectableByMouse)
         # Dito self.original_name_lbl
         self.metadata_lbl.share_scroll = bake_attribute("metadata_lbl", self.share_scroll)
         self.metadata_lbl.setVerticalScrollBarPolicy(Qt.ScrollBarPolicy.ScrollBarAlwaysOff)
         self.metadata_lbl.setHorizontalScrollBarPolicy(Qt.ScrollBarPolicy.ScrollBarAlwaysOff)
-        self.max_needed_width = max(self.max_needed_width, self.metadata_lbl.text_label.width())
+        self.max_needed_width = max(self.max_needed_width, self.metadata_lbl.needed_width())
 
         # Adding all the widgets.
         self.layout.addWidget(self.media)
@@ -210,11 +217,18 @@ class MediaPane(QLabel):
         :return:
         """
         super().resizeEvent(event)
-        self.media.setFixedWidth(self.width())
-        self.media.setFixedHeight(min(self.max_height, int(self.width() / self.media.width_div_height)))
+        self.fit_media()
         # print(self.metadata_lbl.size())
         # self.media.setScaledContents(True)
 
+    def fit_media(self):
+        """
+        Size the picture to the width of the pane, also once the picture is loaded and its aspect ratio known.
+        :return:
+        """
+        self.media.setFixedWidth(self.width())
+        self.media.setFixedHeight(min(self.max_height, int(self.width() / self.media.width_div_height)))
+
     def update_delete_text(self):
         """
         Updating the Text of the Delete or Keep button
@@ -242,6 +256,9 @@ class MediaPane(QLabel):
         self.tag_lbl.setText(self.dbe.naming_tag)
         self.new_name_lbl.setText(self.dbe.new_name)
 
+        # the file moved, the thumbnail is stored by key and stays valid
+        self.media.fpath = self.model.pdb.path_from_datetime(dt_obj=self.dbe.datetime, file_name=self.dbe.new_name)
+
     def enterEvent(self, event: QEnterEvent) -> None:
         """
         When the mouse enters the widget, the metadata will be displayed.
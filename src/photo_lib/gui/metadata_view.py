@@ -0,0 +1,169 @@
+from PyQt6.QtWidgets import QTableView, QHeaderView, QAbstractItemView
+from PyQt6.QtCore import Qt, QAbstractTableModel, QModelIndex
+from PyQt6.QtGui import QColor
+from typing import Callable, Union, List, Set
+
+
+class MetadataTableModel(QAbstractTableModel):
+    """
+    Table of the tags and values of a metadata dict. The values are only converted to text when a row is displayed.
+    Tags in differing are highlighted.
+    """
+    metadata: dict
+    tags: List[str]
+    differing: Set[str]
+
+    highlight: QColor = QColor(255, 200, 200)
+
+    # values considered to estimate the width of the value column, see longest_value
+    width_sample: int = 256
+
+    __longest_value: Union[str, None] = None
+
+    def __init__(self, metadata: dict, tags: List[str] = None):
+        """
+        :param metadata: dictionary of metadata, generated by the exiftool
+        :param tags: the sorted keys of metadata, sorted here if not given
+        """
+        super().__init__()
+        self.metadata = metadata
+        self.tags = tags if tags is not None else sorted(metadata.keys())
+        self.differing = set()
+
+    def rowCount(self, parent: QModelIndex = QModelIndex()) -> int:
+        return 0 if parent.isValid() else len(self.tags)
+
+    def columnCount(self, parent: QModelIndex = QModelIndex()) -> int:
+        return 0 if parent.isValid() else 2
+
+    def data(self, index: QModelIndex, role: int = Qt.ItemDataRole.DisplayRole):
+        tag = self.tags[index.row()]
+
+        if role == Qt.ItemDataRole.DisplayRole:
+            return tag if index.column() == 0 else str(self.metadata.get(tag))
+
+        if role == Qt.ItemDataRole.BackgroundRole and tag in self.differing:
+            return self.highlight
+
+        return None
+
+    def headerData(self, section: int, orientation: Qt.Orientation, role: int = Qt.ItemDataRole.DisplayRole):
+        if orientation == Qt.Orientation.Horizontal and role == Qt.ItemDataRole.DisplayRole:
+            return f"{len(self.tags)} Attributes" if section == 0 else "Value"
+
+        return None
+
+    def longest_value(self) -> str:
+        """
+        Longest text of the first width_sample values, computed once. Files with thousands of tags don't have to
+        convert all values to text, the rows are only converted when displayed.
+        """
+        if self.__longest_value is None:
+            sample = (str(self.metadata.get(tag)) for tag in self.tags[:self.width_sample])
+            self.__longest_value = max(sample, key=len, default="")
+
+        return self.__longest_value
+
+    def set_differing(self, differing: Set[str]):
+        """
+        Highlight the given tags.
+
+        :param differing: tags whose value differs from the other files of the cluster
+        :return:
+        """
+        self.differing = differing
+        if len(self.tags) > 0:
+            self.dataChanged.emit(self.index(0, 0), self.index(len(self.tags) - 1, 1),
+                                  [Qt.ItemDataRole.BackgroundRole])
+
+
+class MetadataView(QTableView):
+    """
+    Shows the metadata of a file in a table which only renders the visible rows. Provides the scroll sharing of the
+    TextScroller (share_scroll, scroll_from_ratio) so it can be synchronized with the other panes.
+    """
+    share_scroll: Union[None, Callable]
+    call_share_scroll: bool = True
+    table_model: Union[MetadataTableModel, None] = None
+
+    # cap of the estimated width of the value column in px, longer values are scrolled
+    max_value_width: int = 800
+
+    def __init__(self, scroll_share: Callable = None):
+        super().__init__()
+        self.share_scroll = scroll_share
+
+        self.setSelectionMode(QAbstractItemView.SelectionMode.ContiguousSelection)
+        self.setEditTriggers(QAbstractItemView.EditTrigger.NoEditTriggers)
+        self.setHorizontalScrollMode(QAbstractItemView.ScrollMode.ScrollPerPixel)
+        self.setVerticalScrollMode(QAbstractItemView.ScrollMode.ScrollPerPixel)
+        self.setShowGrid(False)
+        self.setWordWrap(False)
+
+        # fixed row heights, nothing has to be measured per row
+        self.verticalHeader().hide()
+        self.verticalHeader().setSectionResizeMode(QHeaderView.ResizeMode.Fixed)
+        self.verticalHeader().setDefaultSectionSize(self.fontMetrics().lineSpacing() + 4)
+        self.horizontalHeader().setStretchLastSection(True)
+
+    def set_metadata(self, metadata: dict, tags: List[str] = None):
+        """
+        Show the metadata of a file.
+
+        :param metadata: dictionary of metadata, generated by the exiftool
+        :param tags: the sorted keys of metadata, see MetadataTableModel
+        :return:
+        """
+        self.table_model = MetadataTableModel(metadata, tags)
+        self.setModel(self.table_model)
+
+        # size the tag column by the longest tag instead of measuring all of them
+        longest = max(self.table_model.tags, key=len, default="")
+        self.setColumnWidth(0, self.fontMetrics().horizontalAdvance(longest) + 20)
+
+    def needed_width(self) -> int:
+        """
+        Estimated width to show the longest tag and the longest value without scrolling. The value column is estimated
+        from a sample of the values and capped at max_value_width.
+        """
+        if self.table_model is None:
+            return 0
+
+        value_width = self.fontMetrics().horizontalAdvance(self.table_model.longest_value())
+        return self.columnWidth(0) + min(value_width, self.max_value_width) + 20
+
+    def scroll_from_ratio(self, rx, ry) -> None:
+        """
+        Set the scroll form a ratio.
+
+        :param rx: relative scroll x (0.0 - 1.0)
+        :param ry: relative scroll y (0.0 - 1.0)
+        :return:
+        """
+        self.call_share_scroll = False
+
+        x_target = rx * self.horizontalScrollBar().maximum()
+        y_target = ry * self.verticalScrollBar().maximum()
+
+        self.horizontalScrollBar().setValue(int(x_target))
+        self.verticalScrollBar().setValue(int(y_target))
+        self.call_share_scroll = True
+
+    def scrollContentsBy(self, dx: int, dy: int) -> None:
+        """
+        Captures the scrolling and pass it from the scroll bar to the share_scroll function such that scrolling is
+        synchronized.
+
+        :param dx: px amount to scroll in x direction
+        :param dy: px amount to scroll in y direction
+        :return:
+        """
+        super().scrollContentsBy(dx, dy)
+        y = self.verticalScrollBar().value()
+        x = self.horizontalScrollBar().value()
+
+        y_ratio = y / self.verticalScrollBar().maximum() if self.verticalScrollBar().maximum() else 1.0
+        x_ratio = x / self.horizontalScrollBar().maximum() if self.horizontalScrollBar().maximum() else 1.0
+
+        if self.call_share_scroll and self.share_scroll is not None:
+            self.share_scroll(caller=self, rx=x_ratio, ry=y_ratio)
@@ -11,6 +11,8 @@ from typing import Union
 class DateTimeModal(QWidget):
     tag_label: QLabel
     custom_datetime: QLabel
+    candidates_label: QLabel
+    candidates: QLabel
     tag_input: QLineEdit
     custom_datetime_input: QLineEdit
 
@@ -37,6 +39,9 @@ class DateTimeModal(QWidget):
         self.form_layout = QFormLayout()
         self.tag_label = QLabel("Tag:")
         self.custom_datetime = QLabel("Custom Datetime:")
+        self.candidates_label = QLabel("Candidates:")
+        self.candidates = QLabel()
+        self.candidates.setTextInteractionFlags(Qt.TextInteractionFlag.TextSelectableByMouse)
 
         self.tag_input = QLineEdit()
         self.tag_input.setPlaceholderText("Enter custom to provide datetime manually")
@@ -61,6 +66,7 @@ class DateTimeModal(QWidget):
 
         self.form_layout.addRow(self.tag_label, self.tag_input)
         self.form_layout.addRow(self.custom_datetime, self.custom_datetime_input)
+        self.form_layout.addRow(self.candidates_label, self.candidates)
         self.form_layout.addRow(self.button_container)
 
         self.setLayout(self.form_layout)
@@ -88,6 +94,10 @@ class DateTimeModal(QWidget):
         self.__media_pane = value
         self.tag_input.setText(self.__media_pane.dbe.naming_tag)
 
+        # list the tags the image could be named after
+        date_tags = self.__media_pane.model.get_date_tags(self.__media_pane.dbe)
+        self.candidates.setText("\n".join(f"{tag}: {dt.strftime('%Y-%m-%d %H.%M.%S')}" for tag, dt, raw in date_tags))
+
 
 class FolderSelectModal(QFileDialog):
     def __init__(self):
@@ -111,6 +121,8 @@ class TaskSelectModal(QDialog):
     cancel_button: QPushButton
 
     hash_button: QPushButton
+    similar_button: QPushButton
+    window_button: QPushButton
     day_button: QPushButton
     month_button: QPushButton
     year_button: QPushButton
@@ -132,6 +144,17 @@ class TaskSelectModal(QDialog):
         self.hash_button.setToolTip("Search for duplicates that have the same hash.")
         self.hash_button.clicked.connect(lambda : self.set_level_accept("hash"))
 
+        self.similar_button = QPushButton("Similar")
+        self.similar_button.setShortcut(QKeySequence(Qt.KeyboardModifier.ControlModifier | Qt.Key.Key_5))
+        self.similar_button.setToolTip("Search for visually similar images across the entire library.")
+        self.similar_button.clicked.connect(lambda : self.set_level_accept("phash"))
+
+        self.window_button = QPushButton("24 Hours")
+        self.window_button.setShortcut(QKeySequence(Qt.KeyboardModifier.ControlModifier | Qt.Key.Key_6))
+        self.window_button.setToolTip("Search for duplicates that were taken within 24 hours of each other, "
+                                      "across day and month folders.")
+        self.window_button.clicked.connect(lambda : self.set_level_accept("window"))
+
         self.day_button = QPushButton("Day")
         self.day_button.setShortcut(QKeySequence(Qt.KeyboardModifier.ControlModifier | Qt.Key.Key_1))
         self.day_button.setToolTip("Search for duplicates that were taken on the same day.")
@@ -158,10 +181,12 @@ class TaskSelectModal(QDialog):
         self.cancel_button.clicked.connect(self.cancel)
 
         self.main_layout.addWidget(self.info_label)
+        self.main_layout.addWidget(self.window_button)
         self.main_layout.addWidget(self.day_button)
         self.main_layout.addWidget(self.month_button)
         self.main_layout.addWidget(self.year_button)
         self.main_layout.addWidget(self.all_button)
+        self.main_layout.addWidget(self.similar_button)
         self.main_layout.addWidget(self.cancel_button)
 
         self.model = model
@@ -178,10 +203,10 @@ class TaskSelectModal(QDialog):
     def set_level_accept(self, level: str):
         """
         Set the targeted level and perform the search.
-        :param level: level string from ["day", "month", "year", "all", "hash"]
+        :param level: level string from ["day", "month", "year", "all", "hash", "phash", "window"]
         :return:
         """
-        assert level in ["day", "month", "year", "all", "hash"]
+        assert level in ["day", "month", "year", "all", "hash", "phash", "window"]
 
         self.model.search_level = level
         self.accept()
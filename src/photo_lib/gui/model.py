@@ -1,9 +1,16 @@
 import datetime
 import os.path
-from typing import List, Union, Tuple
-import multiprocessing as mp
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, Future
+from dataclasses import dataclass
+from typing import List, Union, Tuple, Dict, Iterable, Set
+
+from PyQt6.QtGui import QImage
 
 from photo_lib.PhotoDatabase import PhotoDb, DatabaseEntry
+from photo_lib.gui.image_cache import image_cache, thumbnail_size
+from photo_lib.search_scheduler import DuplicateSearch
 from photo_lib.metadataagregator import key_lookup_dir
 
 
@@ -14,6 +21,63 @@ class NoDbException(Exception):
     pass
 
 
+@dataclass
+class PrefetchedCluster:
+    row_id: int
+    files: List[DatabaseEntry]
+    # sorted tags and file size string of every key, see Model.process_metadata
+    metadata: Dict[int, Tuple[List[str], str]]
+
+
+# PhotoDb of the prefetch thread, sqlite connections can't be shared between threads
+_prefetch_local = threading.local()
+
+
+def _close_prefetch_db():
+    """
+    Close the connection of the prefetch thread, e.g. when the database is switched. Runs in the prefetch thread.
+    :return:
+    """
+    pdb = getattr(_prefetch_local, "pdb", None)
+    _prefetch_local.pdb = None
+    _prefetch_local.root_dir = None
+
+    if pdb is not None:
+        pdb.con.close()
+
+
+def _prefetch_clusters(root_dir: str, after: Union[int, None], count: int) -> List[PrefetchedCluster]:
+    """
+    Load the clusters following after in the prefetch thread, with their processed metadata. The existing thumbnails
+    are decoded into the image_cache, missing ones aren't created, that would write to the database.
+
+    :param root_dir: root of the library
+    :param after: key of the last cluster already loaded, None to start at the first one
+    :param count: number of clusters to load
+    :return:
+    """
+    if getattr(_prefetch_local, "root_dir", None) != root_dir:
+        _close_prefetch_db()
+        _prefetch_local.pdb = PhotoDb(root_dir=root_dir)
+        _prefetch_local.root_dir = root_dir
+
+    pdb: PhotoDb = _prefetch_local.pdb
+    clusters = []
+    for row_id, files in pdb.get_duplicate_entries(after=after, limit=count):
+        metadata = {dbe.key: Model.process_metadata(dbe.metadata) for dbe in files}
+        for dbe in files:
+            if (dbe.key, thumbnail_size) in image_cache:
+                continue
+
+            path = pdb.thumbnail_path(key=dbe.key, new_name=dbe.new_name, create=False)
+            if path is not None:
+                image_cache.put((dbe.key, thumbnail_size), QImage(path))
+
+        clusters.append(PrefetchedCluster(row_id=row_id, files=files, metadata=metadata))
+
+    return clusters
+
+
 class Model:
     pdb:  Union[PhotoDb, None] = None
     files: List[DatabaseEntry]
@@ -21,7 +85,18 @@ class Model:
     search_level: Union[str, None] = None
     resources: str = os.path.join(os.path.dirname(__file__), "resources")
 
+    # Number of clusters following the current one which are loaded in the background.
+    prefetch_count: int = 3
+    __prefetched: deque
+    __prefetch_future: Union[Future, None] = None
+    __prefetch_generation: int = 0
+    __prefetch_executor: ThreadPoolExecutor
+    __current: Union[PrefetchedCluster, None] = None
+
     def __init__(self, folder_path: str = None):
+        self.__prefetched = deque()
+        self.__prefetch_executor = ThreadPoolExecutor(max_workers=1)
+
         if folder_path is not None:
             self.pdb = PhotoDb(root_dir=folder_path)
 
@@ -33,29 +108,44 @@ class Model:
         """
         if os.path.exists(os.path.join(folder_path, ".photos.db")):
             self.pdb = PhotoDb(root_dir=folder_path)
+            self.invalidate_prefetch()
+
+            # the connection belongs to the prefetch thread, so it's closed there
+            self.__prefetch_executor.submit(_close_prefetch_db)
 
     @staticmethod
-    def process_metadata(metadict: dict):
+    def process_metadata(metadict: dict) -> Tuple[List[str], str]:
         """
-        Parse the Metadata dict and convert it into a text string that can be displayed.
+        Prepare the Metadata dict for display in a MetadataView. The values are converted to text by the view, only for
+        the visible rows.
 
         :param metadict: dictionary of metadata, generated by the exiftool
 
-        :return: metadata string, file size string
+        :return: sorted tags, file size string
         """
-        keys = metadict.keys()
-        key_list = list(keys)
-        key_list.sort()
         file_size = ""
+        if "File:FileSize" in metadict:
+            file_size = f"File Size: {int(metadict.get('File:FileSize')):,}".replace(",", "'")
+
+        return sorted(metadict.keys()), file_size
 
-        result = f"Number of Attributes: {len(key_list)}\n"
+    @staticmethod
+    def differing_tags(metadicts: List[dict]) -> Set[str]:
+        """
+        Tags whose value isn't the same in all metadata dicts, including tags missing in some of them.
 
-        for key in key_list:
-            result += f"{key}: {metadict.get(key)}\n"
-            if key == "File:FileSize":
-                file_size = f"File Size: {int(metadict.get(key)):,}".replace(",", "'")
+        :param metadicts: dictionaries of metadata, generated by the exiftool
+        :return: set of the tags
+        """
+        if len(metadicts) < 2:
+            return set()
 
-        return result, file_size
+        all_tags = set().union(*(d.keys() for d in metadicts))
+        first = metadicts[0]
+        missing = object()
+
+        return {tag for tag in all_tags
+                if any(d.get(tag, missing) != first.get(tag, missing) for d in metadicts[1:])}
 
     def try_rename_image(self, tag: str, dbe: DatabaseEntry, custom_datetime: str = None):
         """
@@ -78,7 +168,10 @@ class Model:
             if parsing_function is None:
                 raise ValueError(f"Tag {tag} does not have a matching parsing function.")
 
-            new_datetime, key = parsing_function(dbe.metadata)
+            # date tags are parsed at import, only parse the metadata if the tag is missing in the table
+            new_datetime = self.pdb.get_date_tag(key=dbe.key, tag=tag)
+            if new_datetime is None:
+                new_datetime, key = parsing_function(dbe.metadata)
 
         if new_datetime == dbe.datetime:
             print("Equivalent Datetime, exiting")
@@ -91,24 +184,143 @@ class Model:
         dbe.datetime = new_datetime
         dbe.naming_tag = tag
 
+        # the image may be queued in other clusters with its old name
+        self.invalidate_prefetch([dbe.key])
+
+    def get_date_tags(self, dbe: DatabaseEntry) -> List[Tuple[str, datetime.datetime, str]]:
+        """
+        Get the date tags of an image that could be used for naming it.
+
+        :param dbe: database entry of the image
+        :return: list of (tag, datetime, raw string)
+        """
+        if self.pdb is None:
+            raise NoDbException("No Database selected")
+
+        return self.pdb.get_date_tags(key=dbe.key)
+
+    def get_thumbnail_path(self, dbe: DatabaseEntry, create: bool = True) -> Union[str, None]:
+        """
+        Path to the thumbnail of a file, the thumbnail is created if it doesn't exist yet.
+
+        :param dbe: database entry of the file
+        :param create: create a missing thumbnail, otherwise None is returned for it
+        :return: path or None if no thumbnail could be created
+        """
+        if self.pdb is None:
+            raise NoDbException("No Database selected")
+
+        path = self.pdb.thumbnail_path(key=dbe.key, new_name=dbe.new_name, create=create)
+
+        # a thumbnail created on demand stores its difference hash
+        if create:
+            self.pdb.con.commit()
+        return path
+
     def fetch_duplicate_row(self):
         """
-        Fetch the current row from the database.
+        Fetch the current row from the database. The prefetched cluster is used if it is still the next one, the
+        following clusters are prefetched in the background.
         :return:
         """
         if self.pdb is None:
             raise NoDbException("No Database selected")
 
-        success, results, row_id = self.pdb.get_duplicate_entry()
+        self.__collect_prefetch()
+        self.__current = None
+
+        self.pdb.cur.execute("SELECT key FROM duplicate_clusters ORDER BY key LIMIT 1")
+        row = self.pdb.cur.fetchone()
+
+        # drop prefetched clusters which were deleted meanwhile
+        while len(self.__prefetched) > 0 and (row is None or self.__prefetched[0].row_id < row[0]):
+            self.__prefetched.popleft()
+
+        if row is not None and len(self.__prefetched) > 0 and self.__prefetched[0].row_id == row[0]:
+            self.__current = self.__prefetched.popleft()
+            success, results, row_id = True, self.__current.files, self.__current.row_id
+        else:
+            self.__prefetched.clear()
+            success, results, row_id = self.pdb.get_duplicate_entry()
+
         if success:
             self.files = []
             for entry in results:
                 if entry is not None:
                     self.files.append(entry)
             self.current_row = row_id
+            self.__start_prefetch()
 
         return success
 
+    def __collect_prefetch(self):
+        """
+        Move the clusters of a finished prefetch to the queue, unless the queue was invalidated since it started.
+        :return:
+        """
+        future = self.__prefetch_future
+        if future is None or not future.done():
+            return
+
+        self.__prefetch_future = None
+
+        # prefetching is optional, on failure (e.g. a locked database) the clusters are fetched directly
+        try:
+            generation, clusters = future.result()
+        except Exception as e:
+            print(f"Prefetching failed: {e}")
+            return
+
+        if generation == self.__prefetch_generation:
+            self.__prefetched.extend(clusters)
+
+    def __start_prefetch(self):
+        """
+        Load the clusters following the current one in the background, until prefetch_count are queued.
+        :return:
+        """
+        if self.__prefetch_future is not None or len(self.__prefetched) >= self.prefetch_count:
+            return
+
+        after = self.__prefetched[-1].row_id if len(self.__prefetched) > 0 else self.current_row
+        generation = self.__prefetch_generation
+        root_dir = self.pdb.root_dir
+        count = self.prefetch_count - len(self.__prefetched)
+
+        self.__prefetch_future = self.__prefetch_executor.submit(
+            lambda: (generation, _prefetch_clusters(root_dir, after, count)))
+
+    def invalidate_prefetch(self, keys: Iterable[int] = None):
+        """
+        Drop prefetched clusters whose membership or entries changed.
+
+        :param keys: keys of the images that were removed from clusters or renamed, None drops all prefetched clusters
+        :return:
+        """
+        # a running prefetch may have read the old membership
+        self.__prefetch_generation += 1
+        self.__prefetch_future = None
+
+        if keys is None:
+            self.__prefetched.clear()
+            return
+
+        keys = set(keys)
+        self.__prefetched = deque(cluster for cluster in self.__prefetched
+                                  if not any(dbe.key in keys for dbe in cluster.files))
+
+    def get_processed_metadata(self, dbe: DatabaseEntry) -> Tuple[List[str], str]:
+        """
+        Processed metadata of a file of the current cluster, prefetched if available. See process_metadata.
+
+        :param dbe: database entry of the file
+        :return: sorted tags, file size string
+        """
+        if self.__current is not None and dbe.key in self.__current.metadata:
+            return self.__current.metadata[dbe.key]
+
+        return self.process_metadata(dbe.metadata)
+
     def compare_current_files(self):
         """
         Compare access all available files and determine the areas of similarity.
@@ -189,6 +401,7 @@ class Model:
         :return:
         """
         self.files.remove(dbe)
+        self.invalidate_prefetch([dbe.key])
 
     def mark_duplicates(self, original: DatabaseEntry, duplicates: List[DatabaseEntry]):
         """
@@ -209,27 +422,42 @@ class Model:
             marks: DatabaseEntry
             self.pdb.mark_duplicate(successor=main_key, duplicate_image_id=marks.key, delete=False)
 
-    def search_duplicates(self) -> Tuple[bool, mp.Pipe]:
+        # the duplicates were removed from all clusters
+        self.invalidate_prefetch([marks.key for marks in duplicates])
+
+    def search_duplicates(self) -> Tuple[bool, Union[DuplicateSearch, None]]:
         """
         Search for duplicates in the database.
 
-        :return:
+        :return: success and the DuplicateSearch to poll, None if the search is already done
         """
         if self.pdb is None:
             raise NoDbException("No Database selected")
 
+        # the search replaces the duplicates table
+        self.invalidate_prefetch()
+
         if self.search_level == "hash":
             self.pdb.duplicates_from_hash(overwrite=True)
             return True, None
 
+        if self.search_level == "phash":
+            success, search = self.pdb.phash_dup_search(overwrite=True, procs=os.cpu_count() or 4)
+            return success, search
+
+        if self.search_level == "window":
+            success, search = self.pdb.img_ana_dup_search_window(overwrite=True, procs=os.cpu_count() or 4)
+            return success, search
+
         # Other thing
         # success, pipe = self.pdb.img_ana_dup_search(overwrite=True, level=self.search_level)
-        success, pipe = self.pdb.img_ana_dup_search(overwrite=True, level=self.search_level, new=False)
+        success, search = self.pdb.img_ana_dup_search(overwrite=True, level=self.search_level, engine="numpy",
+                                                      procs=os.cpu_count() or 4)
 
         if not success:
-            print(pipe)
+            print(search)
             return False, None
 
-        return True, pipe
+        return True, search
 
 
@@ -3,35 +3,129 @@ import json
 import datetime
 import os
 import hashlib
+import functools
+import mmap
+import threading
+import re
 from dataclasses import dataclass
+from typing import List, Generator, Tuple, Union
 from .tagsnshit import known  # find
 
 
-def anti_utc(dt_str: str, fmt_str: str):
+# Engines of hash_file, file_digest is only available from python 3.11
+hash_engines = ("readinto", "mmap", "file_digest")
+default_hash_engine = "file_digest" if hasattr(hashlib, "file_digest") else "readinto"
+
+# read buffer of the readinto engine, reused across calls, one per thread
+__hash_buffers = threading.local()
+
+
+def hash_file(path, engine: str = None, buffer_size: int = 1 << 20):
     """
-    Merge UTC into the datetime.
-    :param dt_str:
-    :param fmt_str:
-    :return:
+    Hashes a file with sha256
+
+    Engines:
+    - readinto: reads the file into a reused buffer of buffer_size bytes
+    - mmap: maps the file into memory and hashes it in one call
+    - file_digest: hashlib.file_digest (python 3.11+)
+
+    :param path: file_path to hash
+    :param engine: one of hash_engines, defaults to file_digest if available and readinto otherwise
+    :param buffer_size: size of the read buffer of the readinto engine
+    :return: hex digest
     """
-    dt_obj = datetime.datetime.strptime(dt_str, fmt_str)
-    unaware = datetime.datetime.strptime(dt_obj.strftime("%Y-%m-%d %H:%M:%S"), "%Y-%m-%d %H:%M:%S")
-    return unaware + dt_obj.utcoffset()
+    if engine is None:
+        engine = default_hash_engine
+
+    with open(path, "rb") as f:
+        if engine == "file_digest":
+            return hashlib.file_digest(f, "sha256").hexdigest()
+
+        sha256_hash = hashlib.sha256()
+
+        if engine == "mmap":
+            # empty files can't be mapped
+            if os.fstat(f.fileno()).st_size > 0:
+                with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                    sha256_hash.update(mm)
+            return sha256_hash.hexdigest()
+
+        if engine != "readinto":
+            raise ValueError(f"Unknown hash engine {engine}, must be one of {hash_engines}")
+
+        buffer = getattr(__hash_buffers, "buffer", None)
+        if buffer is None or len(buffer) != buffer_size:
+            buffer = bytearray(buffer_size)
+            __hash_buffers.buffer = buffer
+
+        view = memoryview(buffer)
+        n = f.readinto(buffer)
+        while n > 0:
+            sha256_hash.update(view[:n])
+            n = f.readinto(buffer)
 
+    return sha256_hash.hexdigest()
 
-def hash_file(path):
+
+def fingerprint_file(path, chunk_size: int = 1 << 16) -> Tuple[int, str]:
     """
-    Hashes a file with sha256
+    Cheap fingerprint of a file, reading at most two chunks instead of the whole file. Files with differing
+    fingerprints differ, files with identical fingerprints need to be compared by the full hash or binary.
+
+    :param path: file_path to fingerprint
+    :param chunk_size: size of the chunks at the start and end of the file which are hashed
+    :return: size of the file, sha256 hex digest of the first and last chunk_size bytes
+    """
+    sha256_hash = hashlib.sha256()
+    with open(path, "rb") as f:
+        size = os.fstat(f.fileno()).st_size
+        sha256_hash.update(f.read(chunk_size))
+
+        if size > chunk_size:
+            f.seek(max(chunk_size, size - chunk_size))
+            sha256_hash.update(f.read(chunk_size))
+
+    return size, sha256_hash.hexdigest()
+
+
+def hash_and_fingerprint_file(path, chunk_size: int = 1 << 16, buffer_size: int = 1 << 20) -> Tuple[str, int, str]:
+    """
+    Hash a file and fingerprint it in the same pass, the first and last chunk_size bytes are taken from the data read
+    for the hash. Equivalent to hash_file followed by fingerprint_file, but the file is only read once.
+
     :param path: file_path to hash
-    :return:
+    :param chunk_size: size of the chunks of the fingerprint, see fingerprint_file
+    :param buffer_size: size of the read buffer
+    :return: sha256 hex digest of the file, size of the file, sha256 hex digest of the first and last chunk
     """
     sha256_hash = hashlib.sha256()
+    head = bytearray()
+    tail = bytearray()
+    size = 0
+
+    buffer = bytearray(buffer_size)
+    view = memoryview(buffer)
+
     with open(path, "rb") as f:
-        # Read and update hash string value in blocks of 4K
-        for byte_block in iter(lambda: f.read(4096), b""):
-            sha256_hash.update(byte_block)
-        result = sha256_hash.hexdigest()
-    return result
+        n = f.readinto(buffer)
+        while n > 0:
+            data = view[:n]
+            sha256_hash.update(data)
+
+            # bytes of the first chunk, the tail only covers the bytes after it like in fingerprint_file
+            if size < chunk_size:
+                head += data[:chunk_size - size]
+                data = data[chunk_size - size:]
+
+            tail += data
+            del tail[:-chunk_size]
+
+            size += n
+            n = f.readinto(buffer)
+
+    partial_hash = hashlib.sha256(head)
+    partial_hash.update(tail)
+    return sha256_hash.hexdigest(), size, partial_hash.hexdigest()
 
 
 @dataclass
@@ -44,6 +138,140 @@ class FileMetaData:
     datetime_object: datetime.datetime
     verify: bool = False
     google_fotos_metadata: dict = None
+    date_tags: list = None  # list of (tag, datetime, raw string) of all date tags that parsed
+    file_size: int = None  # file_size and partial_hash as returned by fingerprint_file, if it was computed
+    partial_hash: str = None
+
+
+def load_google_fotos_metadata(path: str) -> Union[dict, None]:
+    """
+    Load the metadata google fotos exports next to a file (<file name>.json).
+
+    :param path: path of the file
+    :return: the metadata or None if there's none
+    """
+    if os.path.exists(f"{path}.json"):
+        with open(f"{path}.json", "r") as gfjf:
+            return json.load(gfjf)
+
+    return None
+
+
+# Formats of general_parser, in the order they're tried, as (pattern string, strptime format, timezone aware).
+parser_formats = [
+    (":: ::z", "%Y:%m:%d %H:%M:%S%z", True),
+    ("-- :: z", "%Y-%m-%d %H:%M:%S %z", True),
+    ("-- ::z", "%Y-%m-%d %H:%M:%S%z", True),
+    ("--T::z", "%Y-%m-%dT%H:%M:%S%z", True),
+    (":: :z", "%Y:%m:%d %H:%M%z", True),
+    (":: ::.f", "%Y:%m:%d %H:%M:%S.%f", False),
+    (":: ::.fz", "%Y:%m:%d %H:%M:%S.%f%z", True),
+    (":: ::", "%Y:%m:%d %H:%M:%S", False),
+    (":: ::Z", "%Y:%m:%d %H:%M:%SZ", False),
+    ("-- ::", "%Y-%m-%d %H:%M:%S", False),
+    ("--T::", "%Y-%m-%dT%H:%M:%S", False),
+    ("-- :", "%Y-%m-%d %H:%M", False),
+    (":: ::pm", "%Y:%m:%d %I:%M:%S%p", False),
+]
+
+# The regexes strptime uses for the directives, so the parser accepts exactly the strings strptime accepts.
+__directive_regex = {
+    "Y": r"(?P<Y>\d\d\d\d)",
+    "m": r"(?P<m>1[0-2]|0[1-9]|[1-9])",
+    "d": r"(?P<d>3[0-1]|[1-2]\d|0[1-9]|[1-9]| [1-9])",
+    "H": r"(?P<H>2[0-3]|[0-1]\d|\d)",
+    "I": r"(?P<I>1[0-2]|0[1-9]|[1-9])",
+    "M": r"(?P<M>[0-5]\d|\d)",
+    "S": r"(?P<S>6[0-1]|[0-5]\d|\d)",
+    "f": r"(?P<f>[0-9]{1,6})",
+    "p": r"(?P<p>am|pm)",
+    "z": r"(?P<z>[+-]\d\d:?[0-5]\d(:?[0-5]\d(\.\d{1,6})?)?|(?-i:Z))",
+}
+
+
+def __compile_format(fmt: str) -> re.Pattern:
+    """
+    Compile a strptime format string to a regex the same way strptime does.
+
+    :param fmt: strptime format string, only the directives in __directive_regex are supported
+    :return: compiled regex
+    """
+    pattern = re.sub(r"([\\.^$*+?(){}\[\]|])", r"\\\1", fmt)
+    pattern = re.sub(r"\s+", r"\\s+", pattern)
+    pattern = re.sub(r"%(.)", lambda m: __directive_regex[m.group(1)], pattern)
+    return re.compile(pattern, re.IGNORECASE)
+
+
+compiled_formats = {name: (__compile_format(fmt), tz_aware) for name, fmt, tz_aware in parser_formats}
+
+
+@functools.lru_cache(maxsize=8192)
+def parse_format(dt_str: str, pattern: str) -> Union[datetime.datetime, None]:
+    """
+    Parse a datetime string with a single pattern of general_parser. Equivalent to strptime with the format of the
+    pattern, followed by merging the utc offset into the datetime for the timezone aware patterns.
+
+    Results are cached since the same strings appear in many tags and files.
+
+    :param dt_str: datetime string
+    :param pattern: pattern string, key of compiled_formats
+    :return: the datetime or None if the string doesn't match the pattern or isn't a valid datetime
+    """
+    regex, tz_aware = compiled_formats[pattern]
+    found = regex.match(dt_str)
+
+    # strptime doesn't allow unconverted data at the end
+    if found is None or found.end() != len(dt_str):
+        return None
+
+    groups = found.groupdict()
+
+    if groups.get("I") is not None:
+        hour = int(groups["I"])
+        if groups["p"].lower() == "am":
+            hour = 0 if hour == 12 else hour
+        elif hour != 12:
+            hour += 12
+    else:
+        hour = int(groups["H"])
+
+    second = int(groups["S"]) if groups.get("S") is not None else 0
+    fraction = int(groups["f"].ljust(6, "0")) if groups.get("f") is not None else 0
+
+    try:
+        dt_obj = datetime.datetime(int(groups["Y"]), int(groups["m"]), int(groups["d"]), hour, int(groups["M"]),
+                                   second, fraction)
+    except ValueError:
+        return None
+
+    if not tz_aware:
+        return dt_obj
+
+    z = groups["z"]
+    offset = datetime.timedelta(0)
+    if z != "Z":
+        if z[3] == ":":
+            z = z[:3] + z[4:]
+            if len(z) > 5:
+                if z[5] != ":":
+                    return None
+                z = z[:5] + z[6:]
+
+        try:
+            offset = datetime.timedelta(hours=int(z[1:3]), minutes=int(z[3:5]), seconds=int(z[5:7] or 0),
+                                        microseconds=int(z[8:].ljust(6, "0") or 0))
+        except ValueError:
+            return None
+        if z.startswith("-"):
+            offset = -offset
+
+    # strptime only allows offsets of less than a day, the former round trip through strftime failed for years
+    # before 1000.
+    if offset >= datetime.timedelta(hours=24) or offset <= -datetime.timedelta(hours=24) or dt_obj.year < 1000:
+        return None
+
+    # merge utc into the datetime, sub seconds are dropped.
+    return dt_obj.replace(microsecond=0) + offset
 
 
 def general_parser(dt_str: str, preferred: str = None, retry: bool = True):
@@ -56,6 +284,7 @@ def general_parser(dt_str: str, preferred: str = None, retry: bool = True):
     '--T::z'
     ':: :z'
     ':: ::.f'
+    ':: ::.fz'
     ':: ::'
     ':: ::Z'
     '-- ::'
@@ -63,6 +292,8 @@ def general_parser(dt_str: str, preferred: str = None, retry: bool = True):
     '-- :'
     ':: ::pm'
 
+    The preferred pattern is tried first, if it fails and retry is set, all patterns are tried in the order above.
+    The patterns are precompiled regexes, see parse_format. The former cascade of strptime calls is in old_parsers.
 
     :param dt_str:
     :param preferred: pattern string
@@ -71,149 +302,25 @@ def general_parser(dt_str: str, preferred: str = None, retry: bool = True):
     :raises ValueError if the String didn't match any patterns
     :raise ValueError if the Parsing failed.
     """
+    if preferred is not None:
+        if preferred not in compiled_formats:
+            raise ValueError(f"No valid preferred string given {preferred}, see doc string")
 
-    # format YYYY:MM:DD HH:MM:SS+HH:MM
-    # format YYYY:MM:DD HH:MM:SS+HHMM
-    if preferred is None or preferred == ":: ::z":
-        try:
-            return anti_utc(dt_str, "%Y:%m:%d %H:%M:%S%z")
-        except ValueError:
-            if preferred is not None:
-                if retry:
-                    return general_parser(dt_str)
-                return None
-
-    # format YYYY-MM-DD HH:MM:SS +HH:MM
-    # format YYYY-MM-DD HH:MM:SS +HHMM
-    if preferred is None or preferred == "-- :: z":
-        try:
-            return anti_utc(dt_str, "%Y-%m-%d %H:%M:%S %z")
-        except ValueError:
-            if preferred is not None:
-                if retry:
-                    return general_parser(dt_str)
-                return None
-
-    # format YYYY-MM-DD HH:MM:SS+HH:MM
-    # format YYYY-MM-DD HH:MM:SS+HHMM
-    if preferred is None or preferred == "-- ::z":
-        try:
-            return anti_utc(dt_str, "%Y-%m-%d %H:%M:%S%z")
-        except ValueError:
-            if preferred is not None:
-                if retry:
-                    return general_parser(dt_str)
-                return None
-
-    # format YYYY-MM-DDTHH:MM:SS+HH:MM
-    # format YYYY-MM-DDTHH:MM:SS+HHMM
-    if preferred is None or preferred == "--T::z":
-        try:
-            return anti_utc(dt_str, "%Y-%m-%dT%H:%M:%S%z")
-        except ValueError:
-            if preferred is not None:
-                if retry:
-                    return general_parser(dt_str)
-                return None
-
-    # format YYYY:MM:DD HH:MM+HH:MM
-    # format YYYY:MM:DD HH:MM+HHMM
-    if preferred is None or preferred == ":: :z":
-        try:
-            return anti_utc(dt_str, "%Y:%m:%d %H:%M%z")
-        except ValueError:
-            if preferred is not None:
-                if retry:
-                    return general_parser(dt_str)
-                return None
-
-    # format YYYY:MM:DD HH:MM:SS.ssssss
-    if preferred is None or preferred == ":: ::.f":
-        try:
-            return datetime.datetime.strptime(dt_str, "%Y:%m:%d %H:%M:%S.%f")
-        except ValueError:
-            if preferred is not None:
-                if retry:
-                    return general_parser(dt_str)
-                return None
-
-        # format YYYY:MM:DD HH:MM:SS.ssssss
-    if preferred is None or preferred == ":: ::.fz":
-        try:
-            return anti_utc(dt_str, "%Y:%m:%d %H:%M:%S.%f%z")
-        except ValueError:
-            if preferred is not None:
-                if retry:
-                    return general_parser(dt_str)
-                return None
-
-    # format YYYY:MM:DD HH:MM:SS
-    if preferred is None or preferred == ":: ::":
-        try:
-            return datetime.datetime.strptime(dt_str, "%Y:%m:%d %H:%M:%S")
-        except ValueError:
-            if preferred is not None:
-                if retry:
-                    return general_parser(dt_str)
-                return None
-
-    # format YYYY:MM:DD HH:MM:SSZ
-    if preferred is None or preferred == ":: ::Z":
-        try:
-            return datetime.datetime.strptime(dt_str, "%Y:%m:%d %H:%M:%SZ")
-        except ValueError:
-            if preferred is not None:
-                if retry:
-                    return general_parser(dt_str)
-                return None
-
-    # format YYYY-MM-DD HH:MM:SS
-    if preferred is None or preferred == "-- ::":
-        try:
-            return datetime.datetime.strptime(dt_str, "%Y-%m-%d %H:%M:%S")
-        except ValueError:
-            if preferred is not None:
-                if retry:
-                    return general_parser(dt_str)
-                return None
-
-    # format YYYY-MM-DDTHH:MM:SS
-    if preferred is None or preferred == "--T::":
-        try:
-            return datetime.datetime.strptime(dt_str, "%Y-%m-%dT%H:%M:%S")
-        except ValueError:
-            if preferred is not None:
-                if retry:
-                    return general_parser(dt_str)
-                return None
+        result = parse_format(dt_str, preferred)
+        if result is not None:
+            return result
 
-    # format YYYY:MM:DD HH:MM
-    if preferred is None or preferred == "-- :":
-        try:
-            return datetime.datetime.strptime(dt_str, "%Y-%m-%d %H:%M")
-        except ValueError:
-            if preferred is not None:
-                if retry:
-                    return general_parser(dt_str)
-                return None
+        if not retry:
+            return None
 
-    if preferred is None or preferred == ":: ::pm":
-        try:
-            return datetime.datetime.strptime(dt_str, "%Y:%m:%d %I:%M:%S%p")
-        except ValueError:
-            if preferred is not None:
-                if retry:
-                    return general_parser(dt_str)
-                return None
-            # if preferred is none, just try the next parser and see if it works.
+    for pattern, _, _ in parser_formats:
+        result = parse_format(dt_str, pattern)
+        if result is not None:
+            return result
 
-    if preferred is not None:
-        # return None
-        raise ValueError(f"No valid preferred string given {preferred}, see doc string")
-    else:
-        if dt_str == "0000:00:00 00:00:00":
-            return None
-        raise ValueError(f"No matching date time parsing string found for {dt_str}")
+    if dt_str == "0000:00:00 00:00:00":
+        return None
+    raise ValueError(f"No matching date time parsing string found for {dt_str}")
 
 
 def func_wrapper(key: str, start_pattern: str = None, ):
@@ -225,6 +332,7 @@ def func_wrapper(key: str, start_pattern: str = None, ):
 
         return general_parser(dt_str, preferred=start_pattern), key
 
+    new_func.keys = (key,)
     return new_func
 
 
@@ -238,6 +346,7 @@ def double_key_wrapper(date_key: str, time_key: str, start_pattern: str = None):
 
         return general_parser(f"{date_str} {time_str}", preferred=start_pattern), date_key
 
+    new_func.keys = (date_key, time_key)
     return new_func
 
 
@@ -324,8 +433,38 @@ wrapper_collection = [
 ]
 
 
+def parse_date_tags(metadata: dict, parsers: list = None,
+                    ignore_errors: bool = False) -> List[Tuple[str, datetime.datetime, str]]:
+    """
+    Run all datetime parsers over the metadata of a file.
+
+    :param metadata: metadata dict from exiftool
+    :param parsers: list of parsers generated by func_wrapper or double_key_wrapper, defaults to wrapper_collection
+    :param ignore_errors: skip tags that fail to parse instead of raising the ValueError of the parser
+    :return: list of (tag, datetime, raw string) of all tags that parsed
+    """
+    if parsers is None:
+        parsers = wrapper_collection
+
+    date_tags = []
+
+    for f in parsers:
+        try:
+            res, key = f(metadata)
+        except ValueError:
+            if ignore_errors:
+                continue
+            raise
+
+        if res is not None:
+            date_tags.append((key, res, " ".join(str(metadata.get(k)) for k in f.keys)))
+
+    return date_tags
+
+
 class MetadataAggregator:
     ethp: exiftool.ExifToolHelper
+    exiftool_path: str
     det_new_ks: bool
 
     func_collection = wrapper_collection
@@ -333,25 +472,105 @@ class MetadataAggregator:
     # add more methodology for parsing. class or function
     def __init__(self, exiftool_path: str = None, detect_new_keys: bool = False):
         self.ethp = exiftool.ExifToolHelper(executable=exiftool_path)
+        self.exiftool_path = exiftool_path
         self.det_new_ks = detect_new_keys
 
-    def process_file(self, path: str) -> FileMetaData:
-        f_hash = hash_file(path)
+    def process_file(self, path: str, f_hash: str = None) -> FileMetaData:
+        """
+        Process a single file.
+
+        :param path: path of the file
+        :param f_hash: sha256 hash of the file if it's known already, the file is hashed otherwise
+        :return:
+        """
+        if f_hash is None:
+            f_hash = hash_file(path)
+        metadata = self.ethp.get_metadata(path)[0]
 
-        content = None
+        return self.__build_file_metadata(path=path, metadata=metadata, f_hash=f_hash)
+
+    def process_files(self, paths: List[str], batch_size: int = 64, skip_hashes: set = None,
+                      skip_fingerprints: set = None) -> Generator[FileMetaData, None, None]:
+        """
+        Process multiple files, sending up to batch_size paths to exiftool in a single get_metadata call instead of
+        paying the round trip through the exiftool pipe for every file.
+
+        If exiftool fails on a batch (e.g. one corrupt file), the files of the batch are processed one by one, so the
+        error is raised for the offending file just like with process_file.
+
+        Files whose hash is in skip_hashes aren't passed to exiftool. They are yielded with only the file_hash and the
+        google fotos metadata, metadata and datetime_object are None.
+
+        If skip_fingerprints is given, the fingerprint of every file is computed first. Files whose (file_size,
+        partial_hash) is in skip_fingerprints aren't hashed either, their file_hash is None as well. Otherwise, the
+        fingerprint is taken from the data read for the hash, see hash_and_fingerprint_file.
+
+        :param paths: paths of the files to process
+        :param batch_size: number of files passed to exiftool at once
+        :param skip_hashes: hashes of files for which the metadata isn't needed
+        :param skip_fingerprints: fingerprints of files for which neither the hash nor the metadata is needed
+        :return: generator yielding the FileMetaData in the order of paths
+        """
+        for i in range(0, len(paths), batch_size):
+            batch = paths[i:i + batch_size]
+            if skip_fingerprints is not None:
+                fingerprints = [fingerprint_file(path) for path in batch]
+                hashes = [None if fp in skip_fingerprints else hash_file(path)
+                          for path, fp in zip(batch, fingerprints)]
+            else:
+                # a single read per file
+                results = [hash_and_fingerprint_file(path) for path in batch]
+                hashes = [f_hash for f_hash, _, _ in results]
+                fingerprints = [(file_size, partial_hash) for _, file_size, partial_hash in results]
+
+            skip = [f_hash is None or (skip_hashes is not None and f_hash in skip_hashes) for f_hash in hashes]
+            extract = [path for path, s in zip(batch, skip) if not s]
+
+            try:
+                metadata_list = self.ethp.get_metadata(extract) if len(extract) > 0 else []
+            except exiftool.exceptions.ExifToolExecuteException:
+                metadata_list = None
+
+            if metadata_list is None or len(metadata_list) != len(extract):
+                metadata_iter = (self.ethp.get_metadata(path)[0] for path in extract)
+            else:
+                metadata_iter = iter(metadata_list)
+
+            for path, f_hash, (file_size, partial_hash), s in zip(batch, hashes, fingerprints, skip):
+                if s:
+                    fmd = FileMetaData(org_fname=os.path.basename(path),
+                                       org_fpath=os.path.dirname(path),
+                                       metadata=None,
+                                       naming_tag="",
+                                       file_hash=f_hash,
+                                       datetime_object=None,
+                                       google_fotos_metadata=load_google_fotos_metadata(path))
+                else:
+                    fmd = self.__build_file_metadata(path=path, metadata=next(metadata_iter), f_hash=f_hash)
+
+                fmd.file_size = file_size
+                fmd.partial_hash = partial_hash
+                yield fmd
+
+    def __build_file_metadata(self, path: str, metadata: dict, f_hash: str) -> FileMetaData:
+        """
+        Resolve the datetime of a file from its exiftool metadata and build the FileMetaData.
+
+        :param path: path of the file
+        :param metadata: metadata dict of the file returned by exiftool
+        :param f_hash: sha256 hash of the file
+        :return:
+        """
         cur_date: datetime.datetime = None
         cur_tag: str = ""
 
-        metadata = self.ethp.get_metadata(path)[0]
         not_known = False
         not_parsed = False
 
         keys = []
 
         # try to load google fotos metadata
-        if os.path.exists(f"{path}.json"):
-            with open(f"{path}.json", "r") as gfjf:
-                content = json.load(gfjf)
+        content = load_google_fotos_metadata(path)
 
         # if self.det_new_ks, search for new matadata keys
         if self.det_new_ks:
@@ -365,16 +584,15 @@ class MetadataAggregator:
                     not_known = True
 
         # determine date and time picture was taken
-        for f in self.func_collection:
-            res, key = f(metadata)
-            if res is not None:
-                if cur_date is None:
-                    cur_date = res
-                    cur_tag = key
+        date_tags = parse_date_tags(metadata, parsers=self.func_collection)
+        for key, res, raw in date_tags:
+            if cur_date is None:
+                cur_date = res
+                cur_tag = key
 
-                elif res < cur_date:
-                    cur_date = res
-                    cur_tag = key
+            elif res < cur_date:
+                cur_date = res
+                cur_tag = key
 
         # output unknown keys if they are found.
         if not_known or not_parsed:
@@ -398,7 +616,8 @@ class MetadataAggregator:
                                file_hash=f_hash,
                                datetime_object=cur_date,
                                verify=verify,
-                               google_fotos_metadata=content
+                               google_fotos_metadata=content,
+                               date_tags=date_tags
                                )
 
         return ret_obj
@@ -83,4 +83,187 @@ def dummy_func(metadata: dict, key: str):
 def parse_quicktime(metadata: dict, key: str):
     x = datetime.datetime.strptime(metadata[key], "%Y-%m-%d %H:%M:%S %z")
     p = datetime.datetime.strptime(x.strftime("%Y-%m-%d %H:%M:%S"), "%Y-%m-%d %H:%M:%S")
-    return p + x.utcoffset()
\ No newline at end of file
+    return p + x.utcoffset()
+
+
+# Cascade of strptime calls used by the MetadataAggregator before the precompiled general_parser.
+def anti_utc(dt_str: str, fmt_str: str):
+    """
+    Merge UTC into the datetime.
+    :param dt_str:
+    :param fmt_str:
+    :return:
+    """
+    dt_obj = datetime.datetime.strptime(dt_str, fmt_str)
+    unaware = datetime.datetime.strptime(dt_obj.strftime("%Y-%m-%d %H:%M:%S"), "%Y-%m-%d %H:%M:%S")
+    return unaware + dt_obj.utcoffset()
+
+
+def general_parser(dt_str: str, preferred: str = None, retry: bool = True):
+    """
+
+    patterns:
+    ':: ::z'
+    '-- :: z'
+    '-- ::z'
+    '--T::z'
+    ':: :z'
+    ':: ::.f'
+    ':: ::'
+    ':: ::Z'
+    '-- ::'
+    '--T::'
+    '-- :'
+    ':: ::pm'
+
+
+    :param dt_str:
+    :param preferred: pattern string
+    :param retry:
+    :return:
+    :raises ValueError if the String didn't match any patterns
+    :raise ValueError if the Parsing failed.
+    """
+
+    # format YYYY:MM:DD HH:MM:SS+HH:MM
+    # format YYYY:MM:DD HH:MM:SS+HHMM
+    if preferred is None or preferred == ":: ::z":
+        try:
+            return anti_utc(dt_str, "%Y:%m:%d %H:%M:%S%z")
+        except ValueError:
+            if preferred is not None:
+                if retry:
+                    return general_parser(dt_str)
+                return None
+
+    # format YYYY-MM-DD HH:MM:SS +HH:MM
+    # format YYYY-MM-DD HH:MM:SS +HHMM
+    if preferred is None or preferred == "-- :: z":
+        try:
+            return anti_utc(dt_str, "%Y-%m-%d %H:%M:%S %z")
+        except ValueError:
+            if preferred is not None:
+                if retry:
+                    return general_parser(dt_str)
+                return None
+
+    # format YYYY-MM-DD HH:MM:SS+HH:MM
+    # format YYYY-MM-DD HH:MM:SS+HHMM
+    if preferred is None or preferred == "-- ::z":
+        try:
+            return anti_utc(dt_str, "%Y-%m-%d %H:%M:%S%z")
+        except ValueError:
+            if preferred is not None:
+                if retry:
+                    return general_parser(dt_str)
+                return None
+
+    # format YYYY-MM-DDTHH:MM:SS+HH:MM
+    # format YYYY-MM-DDTHH:MM:SS+HHMM
+    if preferred is None or preferred == "--T::z":
+        try:
+            return anti_utc(dt_str, "%Y-%m-%dT%H:%M:%S%z")
+        except ValueError:
+            if preferred is not None:
+                if retry:
+                    return general_parser(dt_str)
+                return None
+
+    # format YYYY:MM:DD HH:MM+HH:MM
+    # format YYYY:MM:DD HH:MM+HHMM
+    if preferred is None or preferred == ":: :z":
+        try:
+            return anti_utc(dt_str, "%Y:%m:%d %H:%M%z")
+        except ValueError:
+            if preferred is not None:
+                if retry:
+                    return general_parser(dt_str)
+                return None
+
+    # format YYYY:MM:DD HH:MM:SS.ssssss
+    if preferred is None or preferred == ":: ::.f":
+        try:
+            return datetime.datetime.strptime(dt_str, "%Y:%m:%d %H:%M:%S.%f")
+        except ValueError:
+            if preferred is not None:
+                if retry:
+                    return general_parser(dt_str)
+                return None
+
+        # format YYYY:MM:DD HH:MM:SS.ssssss
+    if preferred is None or preferred == ":: ::.fz":
+        try:
+            return anti_utc(dt_str, "%Y:%m:%d %H:%M:%S.%f%z")
+        except ValueError:
+            if preferred is not None:
+                if retry:
+                    return general_parser(dt_str)
+                return None
+
+    # format YYYY:MM:DD HH:MM:SS
+    if preferred is None or preferred == ":: ::":
+        try:
+            return datetime.datetime.strptime(dt_str, "%Y:%m:%d %H:%M:%S")
+        except ValueError:
+            if preferred is not None:
+                if retry:
+                    return general_parser(dt_str)
+                return None
+
+    # format YYYY:MM:DD HH:MM:SSZ
+    if preferred is None or preferred == ":: ::Z":
+        try:
+            return datetime.datetime.strptime(dt_str, "%Y:%m:%d %H:%M:%SZ")
+        except ValueError:
+            if preferred is not None:
+                if retry:
+                    return general_parser(dt_str)
+                return None
+
+    # format YYYY-MM-DD HH:MM:SS
+    if preferred is None or preferred == "-- ::":
+        try:
+            return datetime.datetime.strptime(dt_str, "%Y-%m-%d %H:%M:%S")
+        except ValueError:
+            if preferred is not None:
+                if retry:
+                    return general_parser(dt_str)
+                return None
+
+    # format YYYY-MM-DDTHH:MM:SS
+    if preferred is None or preferred == "--T::":
+        try:
+            return datetime.datetime.strptime(dt_str, "%Y-%m-%dT%H:%M:%S")
+        except ValueError:
+            if preferred is not None:
+                if retry:
+                    return general_parser(dt_str)
+                return None
+
+    # format YYYY:MM:DD HH:MM
+    if preferred is None or preferred == "-- :":
+        try:
+            return datetime.datetime.strptime(dt_str, "%Y-%m-%d %H:%M")
+        except ValueError:
+            if preferred is not None:
+                if retry:
+                    return general_parser(dt_str)
+                return None
+
+    if preferred is None or preferred == ":: ::pm":
+        try:
+            return datetime.datetime.strptime(dt_str, "%Y:%m:%d %I:%M:%S%p")
+        except ValueError:
+            if preferred is not None:
+                if retry:
+                    return general_parser(dt_str)
+                return None
+            # if preferred is none, just try the next parser and see if it works.
+
+    if preferred is not None:
+        # return None
+        raise ValueError(f"No valid preferred string given {preferred}, see doc string")
+    else:
+        if dt_str == "0000:00:00 00:00:00":
+            return None
+        raise ValueError(f"No matching date time parsing string found for {dt_str}")
@@ -0,0 +1,367 @@
+"""
+Scheduler of the parallel duplicate searches. The groups of a search (folders or datetime groups) are handed to a
+ProcessPoolExecutor, the results are collected in the parent process which does all writes to the database.
+"""
+import os
+import sqlite3
+import tempfile
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, Future, wait, FIRST_COMPLETED
+from dataclasses import dataclass
+from typing import Callable, List, Tuple, Union, Dict
+
+import numpy as np
+from difPy.dif import dif
+
+from .similarity import load_grey, pairwise_mse, connected_components, dhash_file, cluster_hashes
+from .thumbnails import ensure_thumbnail
+
+
+def difpy_folder(folder: str) -> List[List[str]]:
+    """
+    Run difPy on a folder, inside a worker process.
+
+    :param folder: folder to search
+    :return: clusters of file names, the first one is the file difPy matched the others against
+    """
+    duplicates = dif(folder, show_progress=False, show_output=False)
+    return [[val["filename"]] + [os.path.basename(d) for d in val["duplicates"]]
+            for val in duplicates.result.values()]
+
+
+def hash_thumbnails(entries: List[Tuple[int, str, str]], max_pixel: int) -> List[Tuple[int, int]]:
+    """
+    Compute the difference hashes of the thumbnails of a page of images, inside a worker process. Missing thumbnails
+    are created, which yields their hash as well.
+
+    :param entries: (key, path of the file, path of its thumbnail) of every image
+    :param max_pixel: size of the larger side of created image thumbnails
+    :return: (key, difference hash) of every image with a thumbnail
+    """
+    hashes = []
+    for key, src, thumbnail in entries:
+        exists, value = ensure_thumbnail(src, thumbnail, max_pixel=max_pixel)
+
+        if exists and value is None:
+            value = dhash_file(thumbnail)
+
+        if value is not None:
+            hashes.append((key, value))
+
+    return hashes
+
+
+def cluster_phashes(db_path: str, max_distance: int) -> Tuple[List[List[int]], List[int]]:
+    """
+    Cluster the difference hashes of all images with cluster_hashes, inside a worker process. The hashes are read by
+    a connection of the worker, the parent only inserts the clusters.
+
+    :param db_path: path to the database
+    :param max_distance: maximum hamming distance (of 64 bits) of two similar images
+    :return: clusters of keys and their scores, see cluster_hashes
+    """
+    con = sqlite3.connect(db_path)
+    try:
+        rows = con.execute("SELECT phashes.image_key, phashes.dhash FROM phashes "
+                           "JOIN images ON images.key = phashes.image_key").fetchall()
+    finally:
+        con.close()
+
+    return cluster_hashes({key: int(value, 16) for key, value in rows}, max_distance=max_distance)
+
+
+def _load_vectors(paths: List[str], size: int, file) -> Tuple[List[int], np.ndarray]:
+    """
+    Load the thumbnails as grey vectors into a np.memmap backed by file, skipping the ones cv2 can't load. The rows
+    are written one by one and pairwise_mse reads them block by block, so a group doesn't need to fit into memory.
+
+    :param paths: paths of the thumbnails
+    :param size: width and height the thumbnails are downsampled to
+    :param file: temporary file backing the memmap
+    :return: indices of the loaded thumbnails in paths and their vectors, one per row
+    """
+    # load_grey returns whole grey values, so they are stored losslessly in a quarter of the size of float32
+    vectors = np.memmap(file, dtype=np.uint8, mode="w+", shape=(len(paths), size * size))
+    indices = []
+
+    for i, path in enumerate(paths):
+        vector = load_grey(path, size=size)
+
+        if vector is not None:
+            vectors[len(indices)] = vector
+            indices.append(i)
+
+    return indices, vectors[:len(indices)]
+
+
+def _ensure_thumbnails(entries: List[tuple], max_pixel: int) -> Tuple[List[tuple], List[Tuple[int, int]]]:
+    """
+    Create the missing thumbnails of the entries, inside a worker process.
+
+    :param entries: tuples starting with (key, path of the file, path of its thumbnail)
+    :param max_pixel: size of the larger side of created image thumbnails
+    :return: the entries which have a thumbnail and (key, difference hash) of the created thumbnails
+    """
+    present = []
+    hashes = []
+    for entry in entries:
+        exists, value = ensure_thumbnail(entry[1], entry[2], max_pixel=max_pixel)
+
+        if exists:
+            present.append(entry)
+
+        if value is not None:
+            hashes.append((entry[0], value))
+
+    return present, hashes
+
+
+def numpy_group(entries: List[Tuple[int, str, str]], threshold: float, size: int, max_pixel: int) \
+        -> Tuple[List[List[int]], List[float], List[Tuple[int, int]]]:
+    """
+    Compare all pairs of images of a group with pairwise_mse, inside a worker process. Missing thumbnails are created.
+
+    :param entries: (key, path of the file, path of its thumbnail) of every image of the group
+    :param threshold: maximum mean squared error of similar images
+    :param size: width and height the thumbnails are downsampled to
+    :param max_pixel: size of the larger side of created image thumbnails
+    :return: clusters of keys and their scores (see connected_components) and (key, difference hash) of the created
+    thumbnails
+    """
+    entries, hashes = _ensure_thumbnails(entries, max_pixel=max_pixel)
+
+    if len(entries) < 2:
+        return [], [], hashes
+
+    with tempfile.TemporaryFile() as file:
+        indices, vectors = _load_vectors([thumbnail for _, _, thumbnail in entries], size=size, file=file)
+
+        if len(indices) < 2:
+            return [], [], hashes
+
+        keys = [entries[i][0] for i in indices]
+        pairs = pairwise_mse(vectors, threshold=threshold)
+
+    clusters, scores = connected_components(keys, [(keys[a], keys[b], mse) for a, b, mse in pairs])
+    return clusters, scores, hashes
+
+
+def numpy_window(entries: List[Tuple[int, str, str, float]], split: int, window: float, threshold: float, size: int,
+                 max_pixel: int) -> Tuple[List[Tuple[int, int, float]], List[Tuple[int, int]]]:
+    """
+    Compare the images of a time bucket with each other and with the images of the following bucket, inside a worker
+    process. Pairs within the following bucket are left to the task of that bucket. Missing thumbnails are created.
+
+    :param entries: (key, path of the file, path of its thumbnail, timestamp) of every image, sorted by timestamp
+    :param split: number of entries belonging to the bucket, the remaining ones belong to the following bucket
+    :param window: maximum difference of the timestamps of a pair in seconds
+    :param threshold: maximum mean squared error of similar images
+    :param size: width and height the thumbnails are downsampled to
+    :param max_pixel: size of the larger side of created image thumbnails
+    :return: matches as (key a, key b, mean squared error) and (key, difference hash) of the created thumbnails
+    """
+    bucket, hashes = _ensure_thumbnails(entries[:split], max_pixel=max_pixel)
+    following, following_hashes = _ensure_thumbnails(entries[split:], max_pixel=max_pixel)
+    entries, split = bucket + following, len(bucket)
+    hashes += following_hashes
+
+    if len(entries) < 2:
+        return [], hashes
+
+    with tempfile.TemporaryFile() as file:
+        indices, vectors = _load_vectors([thumbnail for _, _, thumbnail, _ in entries], size=size, file=file)
+
+        if len(indices) < 2:
+            return [], hashes
+
+        pairs = pairwise_mse(vectors, threshold=threshold)
+
+    results = []
+    for a, b, mse in pairs:
+        entry_a, entry_b = entries[indices[a]], entries[indices[b]]
+
+        if indices[a] < split and abs(entry_b[3] - entry_a[3]) <= window:
+            results.append((entry_a[0], entry_b[0], mse))
+
+    return results, hashes
+
+
+@dataclass
+class SearchTask:
+    weight: int
+    func: Callable
+    args: tuple
+
+
+class DuplicateSearch:
+    """
+    Runs the tasks of a duplicate search in a pool of worker processes.
+
+    - The heaviest tasks (e.g. the folders with the most files) are submitted first, so a large folder doesn't start
+      last and keep a single worker busy after all others are done.
+    - At most max_in_flight tasks are submitted at once, finished results wait in their future until the parent
+      collects them, so neither the workers nor the results can pile up.
+    - The parent collects the results with poll and passes them to handle_result, i.e. all database writes happen in
+      the process that owns the connection. There is no pipe to drain, progress is a plain attribute.
+
+    Either call run to block until the search is done or call poll periodically, e.g. from a QTimer of the gui.
+    handle_finished is called once all tasks are done, e.g. to write results that need all tasks. It isn't called if
+    the search was cancelled. Work that needs all results but is too heavy for the parent (e.g. clustering the whole
+    library) is passed as final_task, it runs in a worker after all other tasks and its result is passed to
+    handle_finished.
+    """
+    total: int
+    done: int
+    failed: int
+    cancelled: bool
+
+    __pending: deque
+    __in_flight: Dict[Future, SearchTask]
+    __executor: Union[ProcessPoolExecutor, None]
+    __finished: bool
+    __final_task: Union[SearchTask, None]
+    __final_future: Union[Future, None]
+    __final_failed: bool
+    __final_result: object
+
+    def __init__(self, tasks: List[SearchTask], handle_result: Callable[[object], None], procs: int = 4,
+                 max_in_flight: int = None, handle_finished: Callable[..., None] = None,
+                 final_task: SearchTask = None):
+        """
+        :param tasks: tasks of the search, run in order of decreasing weight
+        :param handle_result: called in the parent process with the return value of every task
+        :param handle_finished: called in the parent process once all tasks are done, with the return value of
+        final_task if given, otherwise without arguments
+        :param procs: number of worker processes
+        :param max_in_flight: maximum number of submitted but not collected tasks, default 2 * procs
+        :param final_task: task submitted once all other tasks are done
+        """
+        self.handle_result = handle_result
+        self.handle_finished = handle_finished
+        self.__finished = False
+        self.procs = procs
+        self.max_in_flight = max_in_flight if max_in_flight is not None else 2 * procs
+
+        self.__pending = deque(sorted(tasks, key=lambda t: t.weight, reverse=True))
+        self.__in_flight = {}
+        self.__executor = None
+
+        self.__final_task = final_task
+        self.__final_future = None
+        self.__final_failed = False
+        self.__final_result = None
+
+        self.total = len(tasks) + (1 if final_task is not None else 0)
+        self.done = 0
+        self.failed = 0
+        self.cancelled = False
+
+    @property
+    def progress(self) -> Tuple[int, int]:
+        """
+        (number of tasks done, total number of tasks)
+        """
+        return self.done, self.total
+
+    @property
+    def running(self) -> bool:
+        return not self.cancelled and (len(self.__pending) > 0 or len(self.__in_flight) > 0
+                                       or self.__final_task is not None)
+
+    def __submit(self):
+        """
+        Submit pending tasks until max_in_flight tasks are in flight. The final task is submitted once all other
+        tasks are done.
+        """
+        if self.__executor is None:
+            self.__executor = ProcessPoolExecutor(max_workers=self.procs)
+
+        while len(self.__pending) > 0 and len(self.__in_flight) < self.max_in_flight:
+            task = self.__pending.popleft()
+            self.__in_flight[self.__executor.submit(task.func, *task.args)] = task
+
+        if self.__final_task is not None and len(self.__pending) == 0 and len(self.__in_flight) == 0:
+            task = self.__final_task
+            self.__final_task = None
+            self.__final_future = self.__executor.submit(task.func, *task.args)
+            self.__in_flight[self.__final_future] = task
+
+    def poll(self, timeout: Union[float, None] = 0) -> bool:
+        """
+        Collect the finished tasks, pass their results to handle_result and submit further tasks.
+
+        :param timeout: seconds to wait for a task to finish, 0 returns immediately, None waits for the next task
+        :return: True while the search is running
+        """
+        if not self.running:
+            self.__shutdown()
+            return False
+
+        self.__submit()
+
+        finished, _ = wait(list(self.__in_flight.keys()), timeout=timeout, return_when=FIRST_COMPLETED)
+        for future in finished:
+            task = self.__in_flight.pop(future)
+            self.done += 1
+
+            try:
+                result = future.result()
+            except Exception as e:
+                self.failed += 1
+                self.__final_failed = self.__final_failed or future is self.__final_future
+                print(f"Search task {task.func.__name__}{task.args[:1]} failed: {e}")
+                continue
+
+            if future is self.__final_future:
+                self.__final_result = result
+            else:
+                self.handle_result(result)
+
+        self.__submit()
+
+        if not self.running:
+            self.__shutdown()
+            return False
+
+        return True
+
+    def run(self):
+        """
+        Block until all tasks are done.
+        """
+        while self.poll(timeout=None):
+            print(f"Searched {self.done} of {self.total}")
+
+    def cancel(self):
+        """
+        Drop the pending tasks and cancel the submitted ones. Tasks already running in a worker finish in the
+        background but their results are discarded. handle_finished isn't called.
+        """
+        self.cancelled = True
+        self.__pending.clear()
+        self.__final_task = None
+
+        for future in self.__in_flight:
+            future.cancel()
+
+        self.__in_flight = {}
+        self.__shutdown()
+
+    def __shutdown(self):
+        if self.__executor is not None:
+            self.__executor.shutdown(wait=not self.cancelled, cancel_futures=True)
+            self.__executor = None
+
+        if self.__finished:
+            return
+
+        self.__finished = True
+
+        # the results are incomplete
+        if self.cancelled or self.__final_failed or self.handle_finished is None:
+            return
+
+        if self.__final_future is not None:
+            self.handle_finished(self.__final_result)
+        else:
+            self.handle_finished()
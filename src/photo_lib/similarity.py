@@ -0,0 +1,297 @@
+"""
+Perceptual hashing and near duplicate search with a BK-tree over the hamming distance of the hashes.
+"""
+import cv2
+import numpy as np
+from PIL import Image, UnidentifiedImageError
+from typing import Dict, List, Tuple, Union, Callable
+
+
+# cv2 flags decoding a jpg at 1/2, 1/4 and 1/8 of its size in the DCT domain, largest reduction first
+reduced_flags = {
+    True: ((8, cv2.IMREAD_REDUCED_GRAYSCALE_8), (4, cv2.IMREAD_REDUCED_GRAYSCALE_4),
+           (2, cv2.IMREAD_REDUCED_GRAYSCALE_2)),
+    False: ((8, cv2.IMREAD_REDUCED_COLOR_8), (4, cv2.IMREAD_REDUCED_COLOR_4), (2, cv2.IMREAD_REDUCED_COLOR_2)),
+}
+
+
+def imread_reduced(path: str, min_pixel: int, grey: bool = False) -> Union[np.ndarray, None]:
+    """
+    Load an image with cv2, decoding a jpg at the largest reduction (1/2, 1/4 or 1/8) that still has min_pixel
+    pixels along its larger side. The size is read from the header with PIL without decoding. Other formats and
+    images too small for a reduction are decoded at full resolution.
+
+    :param path: path to the image
+    :param min_pixel: minimum size of the larger side of the loaded image
+    :param grey: load a grey image instead of BGR
+    :return: image or None if the file couldn't be loaded by cv2
+    """
+    full = cv2.IMREAD_GRAYSCALE if grey else cv2.IMREAD_COLOR
+
+    try:
+        with Image.open(path) as img:
+            fmt, size = img.format, max(img.size)
+    except (OSError, UnidentifiedImageError):
+        return cv2.imread(path, full)
+
+    if fmt == "JPEG":
+        for factor, flag in reduced_flags[grey]:
+            # the decoder rounds the reduced size up
+            if -(-size // factor) >= min_pixel:
+                return cv2.imread(path, flag)
+
+    return cv2.imread(path, full)
+
+
+def dhash(img: np.ndarray, hash_size: int = 8) -> int:
+    """
+    Difference hash of an image. The image is scaled to (hash_size + 1) x hash_size grey pixels, every bit encodes
+    if a pixel is brighter than its right neighbour. Resizing and recompression barely change the hash, so similar
+    images have a small hamming distance.
+
+    :param img: image as loaded by cv2, grey or BGR(A)
+    :param hash_size: number of bits per row and number of rows
+    :return: hash with hash_size² bits
+    """
+    if img.ndim == 3:
+        img = cv2.cvtColor(img, cv2.COLOR_BGRA2GRAY if img.shape[2] == 4 else cv2.COLOR_BGR2GRAY)
+
+    small = cv2.resize(img, dsize=(hash_size + 1, hash_size), interpolation=cv2.INTER_AREA)
+    bits = (small[:, 1:] > small[:, :-1]).flatten()
+
+    value = 0
+    for bit in bits:
+        value = (value << 1) | int(bit)
+
+    return value
+
+
+def dhash_file(path: str, hash_size: int = 8) -> Union[int, None]:
+    """
+    Difference hash of an image file.
+
+    :param path: path to the image
+    :param hash_size: see dhash
+    :return: hash or None if the file couldn't be loaded by cv2
+    """
+    # at 1/8 only the mean of every 8x8 block is decoded, which flips bits of small images
+    img = imread_reduced(path, min_pixel=8 * (hash_size + 1), grey=True)
+
+    if img is None:
+        return None
+
+    return dhash(img, hash_size=hash_size)
+
+
+def hamming(a: int, b: int) -> int:
+    """
+    Number of differing bits of two hashes.
+    """
+    return bin(a ^ b).count("1")
+
+
+class _BKNode:
+    __slots__ = ("value", "items", "children")
+
+    def __init__(self, value: int, item):
+        self.value = value
+        self.items = [item]
+        self.children = {}
+
+
+class BKTree:
+    """
+    Burkhard-Keller tree, finds all values within a distance of a query without comparing it to every value. The
+    children of a node are keyed by their distance to the node, the triangle inequality allows to skip all subtrees
+    which can't contain a match.
+    """
+    root: Union[_BKNode, None]
+    distance: Callable[[int, int], int]
+    size: int
+
+    def __init__(self, distance: Callable[[int, int], int] = hamming):
+        self.root = None
+        self.distance = distance
+        self.size = 0
+
+    def add(self, value: int, item):
+        """
+        Add an item with its hash to the tree.
+
+        :param value: hash of the item
+        :param item: item returned by search, e.g. a key
+        :return:
+        """
+        self.size += 1
+
+        if self.root is None:
+            self.root = _BKNode(value, item)
+            return
+
+        node = self.root
+        while True:
+            dist = self.distance(value, node.value)
+
+            # identical hash, no new node needed
+            if dist == 0:
+                node.items.append(item)
+                return
+
+            child = node.children.get(dist)
+            if child is None:
+                node.children[dist] = _BKNode(value, item)
+                return
+
+            node = child
+
+    def search(self, value: int, max_distance: int) -> List[Tuple[int, object]]:
+        """
+        Find all items whose hash is within max_distance of value.
+
+        :param value: hash to search for
+        :param max_distance: maximum distance of a match
+        :return: list of (distance, item)
+        """
+        results = []
+        stack = [self.root] if self.root is not None else []
+
+        while len(stack) > 0:
+            node = stack.pop()
+            dist = self.distance(value, node.value)
+
+            if dist <= max_distance:
+                results.extend((dist, item) for item in node.items)
+
+            for child_dist, child in node.children.items():
+                if dist - max_distance <= child_dist <= dist + max_distance:
+                    stack.append(child)
+
+        return results
+
+
+def connected_components(keys: List[int], pairs: List[Tuple[int, int, float]]) \
+        -> Tuple[List[List[int]], List[float]]:
+    """
+    Group keys into clusters, the connected components of the matching pairs.
+
+    :param keys: all keys
+    :param pairs: matches as (key a, key b, distance)
+    :return: clusters of more than one key with their keys sorted and the largest distance of a match within every
+    cluster
+    """
+    parent = {key: key for key in keys}
+
+    def find(key: int) -> int:
+        while parent[key] != key:
+            parent[key] = parent[parent[key]]
+            key = parent[key]
+        return key
+
+    for key_a, key_b, _ in pairs:
+        root_a, root_b = find(key_a), find(key_b)
+        if root_a != root_b:
+            parent[max(root_a, root_b)] = min(root_a, root_b)
+
+    max_dist = {}
+    for key_a, _, dist in pairs:
+        root = find(key_a)
+        max_dist[root] = max(max_dist.get(root, 0), dist)
+
+    members = {}
+    for key in sorted(keys):
+        members.setdefault(find(key), []).append(key)
+
+    clusters = [keys for keys in members.values() if len(keys) > 1]
+    scores = [max_dist[find(keys[0])] for keys in clusters]
+
+    return clusters, scores
+
+
+def cluster_hashes(hashes: Dict[int, int], max_distance: int,
+                   progress: Callable[[int, int], None] = None) -> Tuple[List[List[int]], List[int]]:
+    """
+    Group keys whose hashes are within max_distance of each other. Clusters are the connected components of the
+    matches, so two members of a cluster may be further apart than max_distance through intermediate members.
+
+    :param hashes: hash of every key
+    :param max_distance: maximum hamming distance of a match
+    :param progress: called with (number of keys searched, total number of keys)
+    :return: clusters with their keys sorted and the largest distance of a match within every cluster
+    """
+    tree = BKTree()
+    for key, value in hashes.items():
+        tree.add(value, key)
+
+    pairs = []
+    for i, (key, value) in enumerate(hashes.items()):
+        pairs.extend((key, match, dist) for dist, match in tree.search(value, max_distance) if match != key)
+
+        if progress is not None and (i + 1) % 1000 == 0:
+            progress(i + 1, len(hashes))
+
+    if progress is not None:
+        progress(len(hashes), len(hashes))
+
+    return connected_components(list(hashes.keys()), pairs)
+
+
+def load_grey(path: str, size: int = 64) -> Union[np.ndarray, None]:
+    """
+    Load an image as size x size grey pixels, the input of pairwise_mse.
+
+    :param path: path to the image, usually a thumbnail
+    :param size: width and height of the downsampled image
+    :return: flattened float32 array or None if the file couldn't be loaded by cv2
+    """
+    # keep some margin, see dhash_file
+    img = imread_reduced(path, min_pixel=2 * size, grey=True)
+
+    if img is None:
+        return None
+
+    return cv2.resize(img, dsize=(size, size), interpolation=cv2.INTER_AREA).astype(np.float32).ravel()
+
+
+def pairwise_mse(vectors: np.ndarray, threshold: float, block_size: int = 1024,
+                 progress: Callable[[int, int], None] = None) -> List[Tuple[int, int, float]]:
+    """
+    Find all pairs of rows of vectors with a mean squared error of at most threshold. The error is computed for
+    blocks of block_size x block_size pairs at once as |a|² + |b|² - 2ab with a matrix product, so only one block of
+    errors is in memory at any time. vectors may be a np.memmap, only the rows of the current blocks are read then.
+
+    :param vectors: one flattened image per row, e.g. from load_grey
+    :param threshold: maximum mean squared error of a match
+    :param block_size: number of rows per block
+    :param progress: called with (number of rows done, total number of rows)
+    :return: list of (index a, index b, mean squared error) with index a < index b
+    """
+    n, d = vectors.shape
+    pairs = []
+
+    # centering doesn't change the differences but keeps the float32 products small and precise
+    norms = np.empty(n, dtype=np.float32)
+    for i0 in range(0, n, block_size):
+        block = np.asarray(vectors[i0:i0 + block_size], dtype=np.float32) - 128
+        norms[i0:i0 + block_size] = np.einsum("ij,ij->i", block, block)
+
+    for i0 in range(0, n, block_size):
+        a = np.asarray(vectors[i0:i0 + block_size], dtype=np.float32) - 128
+
+        for j0 in range(i0, n, block_size):
+            b = a if j0 == i0 else np.asarray(vectors[j0:j0 + block_size], dtype=np.float32) - 128
+
+            mse = norms[i0:i0 + len(a), None] + norms[None, j0:j0 + len(b)] - 2 * (a @ b.T)
+            mse /= d
+
+            match = mse <= threshold
+            if j0 == i0:
+                # only pairs above the diagonal
+                match = np.triu(match, k=1)
+
+            ii, jj = np.nonzero(match)
+            pairs.extend(zip((ii + i0).tolist(), (jj + j0).tolist(), np.maximum(mse[ii, jj], 0).tolist()))
+
+        if progress is not None:
+            progress(min(i0 + block_size, n), n)
+
+    return pairs
@@ -0,0 +1,135 @@
+"""
+Creation of the thumbnails of images and videos. The functions don't touch the database, so they can run in worker
+processes and threads of the thumbnail pipeline (see PhotoDb.thumbnail_creation).
+"""
+import os
+import sys
+import threading
+from typing import Union, Tuple
+
+import cv2
+import ffmpeg
+
+from .similarity import dhash, dhash_file, imread_reduced
+
+
+image_extensions = {".jpeg", ".jpg", ".png", ".tiff"}
+video_extensions = {".mov", ".m4v", ".mp4", ".gif"}
+
+
+def image_thumbnail(src: str, dst: str, max_pixel: int = 512) -> Union[int, None]:
+    """
+    Create the thumbnail of an image with cv2, the larger side is scaled to max_pixel.
+
+    :param src: path to the image
+    :param dst: path of the thumbnail
+    :param max_pixel: size of the larger side of the thumbnail
+    :return: difference hash of the thumbnail, None if the image couldn't be loaded
+    """
+    # load image from disk, jpgs are decoded at the smallest size still larger than the thumbnail
+    img = imread_reduced(src, min_pixel=max_pixel)
+
+    if img is None:
+        return None
+
+    # determine which axis is larger
+    max_pix = max(img.shape[0], img.shape[1])
+
+    # calculate new size
+    if max_pix == img.shape[0]:
+        py = max_pixel
+        px = int(max_pixel / max_pix * img.shape[1])
+    else:
+        px = max_pixel
+        py = int(max_pixel / max_pix * img.shape[0])
+
+    # resize image to new size
+    img_half = cv2.resize(img, dsize=(px, py))
+
+    # store image
+    cv2.imwrite(dst, img_half)
+    return dhash(img_half)
+
+
+def video_thumbnail(src: str, dst: str) -> Union[int, None]:
+    """
+    Create the thumbnail of a video from its middle frame with ffmpeg.
+
+    :param src: path to the video
+    :param dst: path of the thumbnail, a jpg
+    :return: difference hash of the thumbnail, None if ffmpeg failed
+    """
+    try:
+        probe = ffmpeg.probe(src)
+    except ffmpeg.Error as e:
+        print(e.stderr.decode(), file=sys.stderr)
+        return None
+
+    time = float(probe['streams'][0]['duration']) // 2
+
+    for i in range(len(probe['streams'])):
+        width = probe['streams'][i].get('width')
+        if width is not None:
+            break
+    try:
+        (
+            ffmpeg
+            .input(src, ss=time)
+            .filter('scale', width, -1)
+            .output(dst, vframes=1)
+            .overwrite_output()
+            .run(capture_stdout=True, capture_stderr=True)
+        )
+    except ffmpeg.Error as e:
+        print(e.stderr.decode(), file=sys.stderr)
+        return None
+
+    return dhash_file(dst)
+
+
+def thumbnail_extension(file_name: str) -> Union[str, None]:
+    """
+    Extension of the thumbnail of a file, videos have a jpg thumbnail.
+
+    :param file_name: name of the image or video
+    :return: extension or None if no thumbnail can be created of the file
+    """
+    ext = os.path.splitext(file_name)[1]
+
+    if ext in image_extensions:
+        return ext
+
+    if ext in video_extensions:
+        return ".jpg"
+
+    return None
+
+
+def ensure_thumbnail(src: str, dst: str, max_pixel: int = 512) -> Tuple[bool, Union[int, None]]:
+    """
+    Create the thumbnail of an image or video unless it exists already.
+
+    :param src: path to the image or video
+    :param dst: path of the thumbnail
+    :param max_pixel: size of the larger side of image thumbnails
+    :return: whether the thumbnail exists, difference hash if the thumbnail was created now
+    """
+    if os.path.exists(dst):
+        return True, None
+
+    # several workers may create the same thumbnail at once (the window search loads every bucket in two tasks), so
+    # it's written under a temporary name and renamed, nobody reads a half written file
+    tmp = os.path.join(os.path.dirname(dst), f".{os.getpid()}_{threading.get_ident()}_{os.path.basename(dst)}")
+
+    if os.path.splitext(src)[1] in video_extensions:
+        value = video_thumbnail(src, tmp)
+    else:
+        value = image_thumbnail(src, tmp, max_pixel=max_pixel)
+
+    if value is None:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        return False, None
+
+    os.replace(tmp, dst)
+    return True, value
@@ -1,19 +1,55 @@
+import base64
+import json
 import os
+from typing import Generator, Tuple, Iterable, Union
 
 
-def rec_list_all(path: str):
+def walk_files(path: str, skip: Iterable[str] = ()) -> Generator[Tuple[str, str, int, float], None, None]:
+    """
+    Recursively walk through everything beneath path with os.scandir. The type information of the directory entries
+    is reused, so only files need a stat call (for size and mtime). The order is the same as the recursive listing
+    with os.listdir, the contents of a subdirectory are yielded where the subdirectory is encountered.
+
+    :param path: root of the tree
+    :param skip: names of directories and files directly in path which are ignored (e.g. .thumbnails, .trash),
+        entries of the same name deeper in the tree are listed
+    :return: Generator of (dirpath, name, size, mtime) of all files
+    """
+    skip = set(skip)
+    with os.scandir(path) as it:
+        for entry in it:
+            if entry.name in skip:
+                continue
+
+            if entry.is_file():
+                stat = entry.stat()
+                yield os.path.dirname(entry.path), entry.name, stat.st_size, stat.st_mtime
+            elif entry.is_dir():
+                yield from walk_files(entry.path)
+
+
+def rec_list_all(path: str, skip: Iterable[str] = ()):
     """
     Recursive list everything contained beneth this path.
     :param path:
+    :param skip: names of directories and files directly in path which are ignored
     :return:
     """
-    files = os.listdir(path)
-    results = []
-    for file in files:
-        file_path = os.path.join(path, file)
-        if os.path.isdir(file_path):
-            results.extend(rec_list_all(file_path))
-        elif os.path.isfile(file_path):
-            results.append(file_path)
-
-    return results
+    return [os.path.join(dirpath, name) for dirpath, name, _, _ in walk_files(path, skip)]
+
+
+def decode_metadata(json_str: Union[str, None]) -> Union[dict, None]:
+    """
+    Decode a metadata column. Databases before version 2 stored base64 encoded json, which is still understood.
+
+    :param json_str: value of the column
+    :return: decoded metadata or None if the column is empty
+    """
+    if json_str is None or json_str == "None":
+        return None
+
+    try:
+        return json.loads(json_str)
+    except json.JSONDecodeError:
+        # base64 encoded json objects (starting with "ey") are never valid json, the column predates version 2
+        return json.loads(base64.b64decode(json_str.encode("ascii")).decode("utf-8"))
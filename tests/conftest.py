@@ -0,0 +1,41 @@
+import os
+import sys
+
+import pytest
+
+# the package isn't installed, the tests run against the sources
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src"))
+
+from photo_lib.PhotoDatabase import PhotoDb
+
+
+@pytest.fixture
+def pdb(tmp_path):
+    """
+    PhotoDb of an empty library in a temporary directory.
+    """
+    root = tmp_path / "lib"
+    root.mkdir()
+    db = PhotoDb(root_dir=str(root))
+    yield db
+    db.con.close()
+
+
+def insert_image(pdb: PhotoDb, new_name: str, file_hash: str = None, metadata: str = "{}",
+                 datetime_str: str = "2020-01-02 03.04.05") -> int:
+    """
+    Insert a row into the images table of a library, without a file.
+
+    :param pdb: database to insert into
+    :param new_name: new_name of the image
+    :param file_hash: hash of the image
+    :param metadata: metadata column as stored
+    :param datetime_str: datetime column as stored
+    :return: key of the image
+    """
+    pdb.cur.execute("INSERT INTO images (org_fname, org_fpath, metadata, naming_tag, file_hash, new_name, datetime) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    (new_name, "/src", metadata, "File:FileModifyDate", file_hash, new_name, datetime_str))
+    key = pdb.cur.lastrowid
+    pdb.cur.execute("INSERT INTO names (name) VALUES (?)", (new_name,))
+    return key
@@ -0,0 +1,50 @@
+from conftest import insert_image
+
+
+def test_duplicates_from_hash(pdb):
+    keys = [insert_image(pdb, f"{i}.jpg", file_hash=h) for i, h in enumerate("abacbdb")]
+    insert_image(pdb, "none.jpg", file_hash=None)
+    pdb.con.commit()
+
+    progress = []
+    success, msg = pdb.duplicates_from_hash(progress=lambda done, total: progress.append((done, total)))
+
+    assert success
+    assert progress == [(2, 2)]
+
+    # clusters ordered by hash, the keys of a cluster sorted
+    rows = pdb.get_duplicate_entries(limit=10)
+    assert [[dbe.key for dbe in files] for _, files in rows] == [[keys[0], keys[2]], [keys[1], keys[4], keys[6]]]
+
+    # existing clusters are kept unless overwritten
+    assert pdb.duplicates_from_hash() == (False, "Duplicates Table exist.")
+
+    pdb.cur.execute("UPDATE images SET file_hash = 'c' WHERE key = ?", (keys[0],))
+    success, msg = pdb.duplicates_from_hash(overwrite=True)
+    assert success and msg.startswith("Dropped table")
+    assert pdb.get_duplicate_table_size() == 2
+
+    pdb.cur.execute("SELECT DISTINCT match_type FROM duplicate_clusters")
+    assert pdb.cur.fetchall() == [("hash",)]
+
+
+def test_insert_duplicate_clusters(pdb):
+    keys = [insert_image(pdb, f"{i}.jpg") for i in range(5)]
+    pdb.create_duplicates_table()
+
+    pdb.insert_duplicate_clusters("day", [[keys[3], keys[0]], [keys[1], keys[2], keys[4]]], scores=[1.5, None])
+    pdb.con.commit()
+
+    pdb.cur.execute("SELECT c.match_type, c.score, m.image_key, m.position FROM duplicate_clusters c "
+                    "JOIN duplicate_members m ON m.cluster_key = c.key ORDER BY c.key, m.position")
+    # members keep the order they were found in
+    assert pdb.cur.fetchall() == [("day", 1.5, keys[3], 0), ("day", 1.5, keys[0], 1),
+                                  ("day", None, keys[1], 0), ("day", None, keys[2], 1), ("day", None, keys[4], 2)]
+
+    assert pdb.clusters_of_image(keys[2]) == [2]
+
+    # a cluster left with a single image is removed
+    pdb.remove_from_duplicates(keys[0])
+    pdb.remove_from_duplicates(keys[4])
+    assert pdb.get_duplicate_table_size() == 1
+    assert [dbe.key for dbe in pdb.get_duplicate_entry()[1]] == [keys[1], keys[2]]
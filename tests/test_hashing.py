@@ -0,0 +1,82 @@
+import hashlib
+import os
+
+import pytest
+
+from photo_lib.metadataagregator import hash_file, hash_engines, fingerprint_file, hash_and_fingerprint_file
+
+# empty, smaller than a buffer, exactly one buffer and spanning several buffers
+sizes = [0, 1, 1000, 1 << 16, (1 << 16) + 1, 3 * (1 << 16) + 17]
+
+
+@pytest.fixture(params=sizes)
+def random_file(request, tmp_path):
+    data = os.urandom(request.param)
+    path = tmp_path / f"{request.param}.bin"
+    path.write_bytes(data)
+    return str(path), data
+
+
+@pytest.mark.parametrize("engine", [e for e in hash_engines if e != "file_digest" or hasattr(hashlib, "file_digest")])
+def test_hash_engines_agree(random_file, engine):
+    path, data = random_file
+    assert hash_file(path, engine=engine, buffer_size=1 << 16) == hashlib.sha256(data).hexdigest()
+
+
+def test_default_engine(random_file):
+    path, data = random_file
+    assert hash_file(path) == hashlib.sha256(data).hexdigest()
+
+
+def test_unknown_engine(random_file):
+    with pytest.raises(ValueError):
+        hash_file(random_file[0], engine="nope")
+
+
+def test_fingerprint_small_file(tmp_path):
+    # files up to one chunk are hashed whole
+    data = os.urandom(1000)
+    path = tmp_path / "small.bin"
+    path.write_bytes(data)
+
+    assert fingerprint_file(str(path), chunk_size=1 << 16) == (1000, hashlib.sha256(data).hexdigest())
+
+
+def test_fingerprint_large_file(tmp_path):
+    chunk = 1 << 10
+    data = os.urandom(10 * chunk + 7)
+    path = tmp_path / "large.bin"
+    path.write_bytes(data)
+
+    expected = hashlib.sha256(data[:chunk] + data[-chunk:]).hexdigest()
+    assert fingerprint_file(str(path), chunk_size=chunk) == (len(data), expected)
+
+    # a change in the middle isn't seen, a change at the end is
+    changed = bytearray(data)
+    changed[5 * chunk] ^= 0xff
+    path.write_bytes(changed)
+    assert fingerprint_file(str(path), chunk_size=chunk) == (len(data), expected)
+
+    changed[-1] ^= 0xff
+    path.write_bytes(changed)
+    assert fingerprint_file(str(path), chunk_size=chunk)[1] != expected
+
+
+def test_fingerprint_overlapping_chunks(tmp_path):
+    # the tail doesn't repeat bytes of the head
+    chunk = 1 << 10
+    data = os.urandom(chunk + 100)
+    path = tmp_path / "overlap.bin"
+    path.write_bytes(data)
+
+    assert fingerprint_file(str(path), chunk_size=chunk) == (len(data), hashlib.sha256(data).hexdigest())
+
+
+@pytest.mark.parametrize("buffer_size", [100, 1 << 10, 1 << 20])
+def test_hash_and_fingerprint_matches_separate_reads(random_file, buffer_size):
+    path, _ = random_file
+    chunk = 1 << 10
+
+    size, partial_hash = fingerprint_file(path, chunk_size=chunk)
+    assert hash_and_fingerprint_file(path, chunk_size=chunk, buffer_size=buffer_size) == \
+        (hash_file(path), size, partial_hash)
@@ -0,0 +1,78 @@
+import base64
+import json
+import sqlite3
+
+from photo_lib.PhotoDatabase import PhotoDb
+
+
+def _create_version_0(root: str, metadata: dict) -> str:
+    """
+    Database as created before the versioning: the five base tables, base64 encoded metadata and the duplicates
+    table storing the keys of a cluster as json array.
+    """
+    db_path = f"{root}/.photos.db"
+    con = sqlite3.connect(db_path)
+    for command in (PhotoDb.images_table_command, PhotoDb.names_table_command, PhotoDb.replaced_table_command,
+                    PhotoDb.import_tables_table_command, PhotoDb.trash_table_command):
+        con.execute(command)
+
+    con.execute("CREATE TABLE duplicates (key INTEGER PRIMARY KEY AUTOINCREMENT, match_type TEXT, matched_keys TEXT)")
+
+    encoded = base64.b64encode(json.dumps(metadata).encode("utf-8")).decode("ascii")
+    for i in range(3):
+        con.execute("INSERT INTO images (org_fname, org_fpath, metadata, google_fotos_metadata, naming_tag, file_hash, "
+                    "new_name, datetime) VALUES (?, '/src', ?, 'None', 'EXIF:DateTimeOriginal', ?, ?, "
+                    "'2020-01-02 03.04.05')", (f"{i}.jpg", encoded, f"hash{i}", f"2020-01-02 03.04.05_00{i}.jpg"))
+
+    con.execute("INSERT INTO duplicates (match_type, matched_keys) VALUES ('hash', '[1, 3]')")
+    con.commit()
+    con.close()
+    return db_path
+
+
+def test_upgrade_from_version_0(tmp_path):
+    metadata = {"EXIF:DateTimeOriginal": "2020:01:02 03:04:05", "File:FileName": "0.jpg"}
+    db_path = _create_version_0(str(tmp_path), metadata)
+
+    pdb = PhotoDb(root_dir=str(tmp_path))
+
+    # 1: indexes
+    assert pdb.get_db_version() == PhotoDb.db_version == 7
+    assert pdb.verify_indexes() == []
+
+    # 2: plain json
+    pdb.cur.execute("SELECT metadata, google_fotos_metadata FROM images")
+    for stored, google in pdb.cur.fetchall():
+        assert json.loads(stored) == metadata
+        assert google is None
+
+    # 3: date tags of the existing images
+    pdb.cur.execute("SELECT image_key, tag, datetime FROM date_tags WHERE tag = 'EXIF:DateTimeOriginal' "
+                    "ORDER BY image_key")
+    assert pdb.cur.fetchall() == [(k, "EXIF:DateTimeOriginal", "2020-01-02 03.04.05") for k in (1, 2, 3)]
+
+    # 4, 5, 7: new tables
+    for table in ("import_cache", "fingerprints", "phashes"):
+        pdb.cur.execute(f"SELECT COUNT(*) FROM {table}")
+        assert pdb.cur.fetchone() == (0,)
+
+    # 6: clusters moved out of the duplicates table
+    pdb.cur.execute("SELECT name FROM sqlite_master WHERE type = 'table' AND name = 'duplicates'")
+    assert pdb.cur.fetchone() is None
+    pdb.cur.execute("SELECT c.match_type, m.image_key, m.position FROM duplicate_clusters c "
+                    "JOIN duplicate_members m ON m.cluster_key = c.key ORDER BY m.position")
+    assert pdb.cur.fetchall() == [("hash", 1, 0), ("hash", 3, 1)]
+
+    pdb.con.close()
+
+    # upgrading is a one shot, reopening doesn't convert the plain json again
+    pdb = PhotoDb(root_dir=str(tmp_path), db_path=db_path)
+    pdb.cur.execute("SELECT metadata FROM images WHERE key = 1")
+    assert json.loads(pdb.cur.fetchone()[0]) == metadata
+    pdb.con.close()
+
+
+def test_new_database_is_current(pdb):
+    assert pdb.get_db_version() == PhotoDb.db_version
+    assert pdb.verify_indexes() == []
+    assert pdb.verify_tables() == (True, True)
@@ -0,0 +1,88 @@
+import datetime
+
+import pytest
+
+from photo_lib import old_parsers
+from photo_lib.metadataagregator import general_parser, parse_format, parser_formats
+
+samples = [
+    "2020:01:02 03:04:05+01:00",
+    "2020:01:02 03:04:05-0530",
+    "2020:01:02 03:04:05Z",
+    "2020-01-02 03:04:05 +01:00",
+    "2020-01-02 03:04:05+0100",
+    "2020-01-02T03:04:05-08:00",
+    "2020-01-02T03:04:05Z",
+    "2020:01:02 03:04+02:00",
+    "2020:01:02 03:04:05.123",
+    "2020:01:02 03:04:05.5",
+    "2020:01:02 03:04:05.123+01:00",
+    "2020:01:02 03:04:05",
+    "2020:1:2 3:4:5",
+    "2020-01-02 03:04:05",
+    "2020-01-02T03:04:05",
+    "2020-01-02 03:04",
+    "2020:01:02 03:04:05pm",
+    "2020:01:02 12:04:05AM",
+    "2020:01:02 12:04:05 PM",
+    "2020:12:31 23:59:59+23:59",
+    "2020:12:31 23:59:59+24:00",
+    "2020:02:30 03:04:05",
+    "2020:13:02 03:04:05",
+    "2020:01:02 24:04:05",
+    "0999:01:02 03:04:05+01:00",
+    "2020:01:02 03:04:05 trailing",
+    "2020:01:02",
+    "",
+    "0000:00:00 00:00:00",
+]
+
+
+def _strptime(dt_str: str, fmt: str, tz_aware: bool):
+    """
+    Reference of parse_format, strptime followed by merging the utc offset like old_parsers.anti_utc.
+    """
+    try:
+        if tz_aware:
+            return old_parsers.anti_utc(dt_str, fmt)
+        return datetime.datetime.strptime(dt_str, fmt)
+    except ValueError:
+        return None
+
+
+@pytest.mark.parametrize("dt_str", samples)
+@pytest.mark.parametrize("pattern, fmt, tz_aware", parser_formats)
+def test_parse_format_matches_strptime(dt_str, pattern, fmt, tz_aware):
+    assert parse_format(dt_str, pattern) == _strptime(dt_str, fmt, tz_aware)
+
+
+@pytest.mark.parametrize("dt_str", samples)
+def test_general_parser_matches_old_parser(dt_str):
+    try:
+        expected = old_parsers.general_parser(dt_str)
+    except ValueError:
+        expected = ValueError
+
+    # the sub second pattern with utc offset is new, the old cascade didn't parse it
+    if expected is ValueError and parse_format(dt_str, ":: ::.fz") is not None:
+        expected = parse_format(dt_str, ":: ::.fz")
+
+    if expected is ValueError:
+        with pytest.raises(ValueError):
+            general_parser(dt_str)
+    else:
+        assert general_parser(dt_str) == expected
+
+
+@pytest.mark.parametrize("pattern", [p[0] for p in parser_formats])
+def test_general_parser_preferred(pattern):
+    dt_str = "2020:01:02 03:04:05"
+    assert general_parser(dt_str, preferred=pattern) == datetime.datetime(2020, 1, 2, 3, 4, 5)
+
+    if pattern != ":: ::":
+        assert general_parser(dt_str, preferred=pattern, retry=False) is None
+
+
+def test_general_parser_unknown_preferred():
+    with pytest.raises(ValueError):
+        general_parser("2020:01:02 03:04:05", preferred="nope")
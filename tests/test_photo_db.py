@@ -0,0 +1,57 @@
+import datetime
+import os
+
+from conftest import insert_image
+
+
+def _imported_table(pdb, name: str, new_names: list):
+    """
+    Import table of a finished import of files with the given new_names, as written by import_folder.
+    """
+    pdb.cur.execute("INSERT INTO import_tables (root_path, import_table_name) VALUES ('/src', ?)", (name,))
+    pdb.cur.execute(f"CREATE TABLE {name} "
+                    f"(key INTEGER PRIMARY KEY AUTOINCREMENT, org_fname TEXT NOT NULL, org_fpath TEXT NOT NULL, "
+                    f"metadata TEXT, google_fotos_metadata TEXT, file_hash TEXT, new_name TEXT, "
+                    f"imported INTEGER DEFAULT 0, allowed INTEGER DEFAULT 0, processed INTEGER DEFAULT 0, "
+                    f"message TEXT, hash_based_duplicate TEXT, file_size INTEGER, mtime REAL)")
+    pdb.cur.executemany(f"INSERT INTO {name} (org_fname, org_fpath, new_name, imported, allowed, processed) "
+                        f"VALUES (?, '/src', ?, 1, 1, 1)", [(n, n) for n in new_names])
+
+
+def test_revert_import_removes_all_rows(pdb):
+    dt = datetime.datetime(2020, 1, 2, 3, 4, 5)
+    kept = insert_image(pdb, "2020-01-02 03.04.05_000.jpg", file_hash="a")
+    reverted = insert_image(pdb, "2020-01-02 03.04.05_001.jpg", file_hash="a")
+
+    path = pdb.path_from_datetime(dt, "2020-01-02 03.04.05_001.jpg")
+    os.makedirs(os.path.dirname(path))
+    with open(path, "wb") as f:
+        f.write(b"image")
+
+    for key in (kept, reverted):
+        pdb.cur.execute("INSERT INTO date_tags (image_key, tag, datetime) VALUES (?, 'File:FileModifyDate', "
+                        "'2020-01-02 03.04.05')", (key,))
+        pdb.cur.execute("INSERT INTO fingerprints (image_key, file_size, partial_hash) VALUES (?, 5, 'p')", (key,))
+        pdb.cur.execute("INSERT INTO phashes (image_key, dhash) VALUES (?, 'ff')", (key,))
+
+    pdb.create_duplicates_table()
+    pdb.insert_duplicate_clusters("hash", [[kept, reverted]])
+
+    _imported_table(pdb, "src", ["2020-01-02 03.04.05_001.jpg"])
+    pdb.con.commit()
+
+    pdb.revert_import("src")
+
+    assert not os.path.exists(path)
+    for table, column in (("images", "key"), ("date_tags", "image_key"), ("fingerprints", "image_key"),
+                          ("phashes", "image_key")):
+        pdb.cur.execute(f"SELECT {column} FROM {table} ORDER BY {column}")
+        assert pdb.cur.fetchall() == [(kept,)], table
+
+    # the cluster is left with a single image
+    assert pdb.get_duplicate_table_size() == 0
+
+    pdb.cur.execute("SELECT COUNT(*) FROM import_tables")
+    assert pdb.cur.fetchone() == (0,)
+    pdb.cur.execute("SELECT name FROM sqlite_master WHERE name = 'src'")
+    assert pdb.cur.fetchone() is None
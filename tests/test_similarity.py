@@ -0,0 +1,73 @@
+import random
+
+import pytest
+
+from conftest import insert_image
+from photo_lib.search_scheduler import cluster_phashes
+from photo_lib.similarity import BKTree, hamming, connected_components, cluster_hashes
+
+
+def test_connected_components():
+    clusters, scores = connected_components([5, 1, 2, 3, 4, 6], [(5, 3, 2.0), (1, 3, 4.0), (2, 6, 1.0)])
+
+    # singletons are dropped, keys sorted, score is the largest distance within the cluster
+    assert clusters == [[1, 3, 5], [2, 6]]
+    assert scores == [4.0, 1.0]
+
+    assert connected_components([1, 2], []) == ([], [])
+
+
+def test_connected_components_chain():
+    keys = list(range(100))
+    random.Random(0).shuffle(keys)
+    pairs = [(keys[i], keys[i + 1], float(i)) for i in range(len(keys) - 1)]
+
+    assert connected_components(keys, pairs) == ([sorted(keys)], [98.0])
+
+
+def _brute_force_clusters(hashes: dict, max_distance: int):
+    pairs = [(a, b, hamming(ha, hb)) for a, ha in hashes.items() for b, hb in hashes.items()
+             if a < b and hamming(ha, hb) <= max_distance]
+    return connected_components(list(hashes.keys()), pairs)
+
+
+@pytest.mark.parametrize("max_distance", [0, 3, 8])
+def test_cluster_hashes_matches_brute_force(max_distance):
+    rng = random.Random(max_distance)
+
+    # a few base hashes with near copies flipping up to 6 bits
+    hashes = {}
+    for base in (rng.getrandbits(64) for _ in range(20)):
+        hashes[len(hashes)] = base
+        for _ in range(rng.randint(0, 4)):
+            flipped = base
+            for bit in rng.sample(range(64), rng.randint(0, 6)):
+                flipped ^= 1 << bit
+            hashes[len(hashes)] = flipped
+
+    assert cluster_hashes(hashes, max_distance) == _brute_force_clusters(hashes, max_distance)
+
+
+def test_bk_tree_search():
+    rng = random.Random(1)
+    values = [rng.getrandbits(16) for _ in range(500)]
+    tree = BKTree()
+    for i, value in enumerate(values):
+        tree.add(value, i)
+
+    assert tree.size == 500
+    query = values[0]
+    expected = sorted((hamming(query, v), i) for i, v in enumerate(values) if hamming(query, v) <= 4)
+    assert sorted(tree.search(query, 4)) == expected
+
+
+def test_cluster_phashes(pdb):
+    keys = [insert_image(pdb, f"{i}.jpg") for i in range(4)]
+    pdb.cur.executemany("INSERT INTO phashes (image_key, dhash) VALUES (?, ?)",
+                        [(keys[0], "ffffffffffffffff"), (keys[1], "fffffffffffffffe"), (keys[2], "0000000000000000"),
+                         (keys[3], "0000000000000003"), (1000, "ffffffffffffffff")])
+    pdb.con.commit()
+
+    # hashes of images no longer in the database are ignored
+    assert cluster_phashes(pdb.img_db, max_distance=1) == ([[keys[0], keys[1]]], [1])
+    assert cluster_phashes(pdb.img_db, max_distance=2) == ([[keys[0], keys[1]], [keys[2], keys[3]]], [1, 2])
@@ -0,0 +1,42 @@
+import os
+
+from photo_lib.utils import walk_files, rec_list_all
+
+
+def _touch(path, content: bytes = b""):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "wb") as f:
+        f.write(content)
+
+
+def test_walk_files_skips_root_entries_only(tmp_path):
+    root = str(tmp_path)
+    _touch(os.path.join(root, "a.jpg"), b"abc")
+    _touch(os.path.join(root, ".thumbnails", "thumb_1.jpg"))
+    _touch(os.path.join(root, ".trash", "b.jpg"))
+    _touch(os.path.join(root, "2020", "01", "c.jpg"))
+    _touch(os.path.join(root, "2020", ".thumbnails", "d.jpg"))
+    _touch(os.path.join(root, "2020", ".trash"))
+
+    found = {os.path.join(dirpath, name): (size, mtime)
+             for dirpath, name, size, mtime in walk_files(root, skip=[".thumbnails", ".trash"])}
+
+    assert set(found) == {os.path.join(root, "a.jpg"),
+                          os.path.join(root, "2020", "01", "c.jpg"),
+                          os.path.join(root, "2020", ".thumbnails", "d.jpg"),
+                          os.path.join(root, "2020", ".trash")}
+
+    stat = os.stat(os.path.join(root, "a.jpg"))
+    assert found[os.path.join(root, "a.jpg")] == (3, stat.st_mtime)
+
+
+def test_rec_list_all_matches_os_walk(tmp_path):
+    root = str(tmp_path)
+    for rel in ("a", "x/b", "x/y/c", "z/d"):
+        _touch(os.path.join(root, rel))
+
+    expected = {os.path.join(dirpath, name) for dirpath, _, names in os.walk(root) for name in names}
+    listed = rec_list_all(root)
+
+    assert len(listed) == len(expected)
+    assert set(listed) == expected